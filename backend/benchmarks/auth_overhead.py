@@ -0,0 +1,125 @@
+"""
+Auth overhead per request: the original per-router verification (secret
+re-parsed on every decode, users lookup on every request) versus the shared
+require_user dependency (pre-built key, cached user, memoized per request).
+
+The users lookup is simulated with a fixed latency so results do not depend
+on a live Supabase project.
+
+Usage (from backend/):
+    python -m benchmarks.auth_overhead [--requests 500] [--db-latency-ms 5]
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import time
+import types
+
+os.environ.setdefault("JWT_SECRET_KEY", "benchmark-secret")
+
+from fastapi import Depends, FastAPI, HTTPException
+from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
+from fastapi.testclient import TestClient
+from jose import jwt
+
+import services.auth as auth
+from services import repository
+
+class _SlowUsersTable:
+    """Stand-in for supabase.table("users") with a fixed round-trip time"""
+
+    def __init__(self, latency: float):
+        self.latency = latency
+        self.calls = 0
+
+    def table(self, _name):
+        return self
+
+    def select(self, *_args):
+        return self
+
+    def eq(self, _column, user_id):
+        self._user_id = user_id
+        return self
+
+    def execute(self):
+        self.calls += 1
+        time.sleep(self.latency)
+        return types.SimpleNamespace(data=[{"id": self._user_id, "email": "bench@example.com", "plan": "pro"}])
+
+class _SlowRepository:
+    """Stand-in for the repository's users lookup, sharing the table's latency and call count"""
+
+    def __init__(self, users: _SlowUsersTable):
+        self.users = users
+
+    async def get_user(self, user_id):
+        self.users.calls += 1
+        await asyncio.sleep(self.users.latency)
+        return {"id": user_id, "email": "bench@example.com", "plan": "pro"}
+
+def build_app(users: _SlowUsersTable) -> FastAPI:
+    app = FastAPI()
+    security = HTTPBearer()
+
+    @app.get("/before")
+    async def before(credentials: HTTPAuthorizationCredentials = Depends(security)):
+        # Original pattern: string secret and a users query on every request
+        try:
+            payload = jwt.decode(credentials.credentials, auth.SECRET_KEY, algorithms=[auth.ALGORITHM])
+            result = users.table("users").select("*").eq("id", payload["sub"]).execute()
+            if not result.data:
+                raise HTTPException(status_code=401, detail="Invalid authentication")
+            return {"id": result.data[0]["id"]}
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=str(e))
+
+    @app.get("/after")
+    async def after(user=Depends(auth.require_user)):
+        return {"id": user["id"]}
+
+    return app
+
+def measure(client: TestClient, path: str, token: str, requests: int):
+    headers = {"Authorization": f"Bearer {token}"}
+    client.get(path, headers=headers)  # warm-up
+    timings = []
+    for _ in range(requests):
+        start = time.perf_counter()
+        resp = client.get(path, headers=headers)
+        timings.append((time.perf_counter() - start) * 1000)
+        assert resp.status_code == 200, resp.text
+    timings.sort()
+    return {
+        "mean_ms": statistics.mean(timings),
+        "p50_ms": timings[len(timings) // 2],
+        "p99_ms": timings[int(len(timings) * 0.99) - 1]
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--db-latency-ms", type=float, default=5.0)
+    args = parser.parse_args()
+
+    users = _SlowUsersTable(args.db_latency_ms / 1000)
+    repository.set_repository(_SlowRepository(users))
+    auth.user_cache.clear()
+
+    client = TestClient(build_app(users))
+    token = auth.create_access_token({"sub": "bench-user"})
+
+    results = {}
+    for path in ("/before", "/after"):
+        users.calls = 0
+        results[path] = measure(client, path, token, args.requests)
+        results[path]["db_calls"] = users.calls
+
+    print(f"{args.requests} requests, simulated users lookup {args.db_latency_ms} ms")
+    for path, r in results.items():
+        print(f"{path:8} mean {r['mean_ms']:.3f} ms  p50 {r['p50_ms']:.3f} ms  p99 {r['p99_ms']:.3f} ms  db calls {r['db_calls']}")
+    print(f"speedup (mean): {results['/before']['mean_ms'] / results['/after']['mean_ms']:.1f}x")
+
+if __name__ == "__main__":
+    main()
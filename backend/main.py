@@ -2,7 +2,11 @@ from fastapi import FastAPI, HTTPException, Depends, UploadFile, File
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from contextlib import asynccontextmanager
+import asyncio
+import contextlib
 import os
+import secrets
+from typing import Optional
 from dotenv import load_dotenv
 
 # Load environment variables BEFORE importing modules that read them at import-time
@@ -10,15 +14,57 @@ load_dotenv()
 
 from routers import analyze, forecast, explain, auth, stripe_webhook
 from services.database import init_db
-from services.supabase_client import get_supabase_client
+from services.repository import close_repositories
+from services.write_behind import result_writer
+from services.auth import user_cache_stats
+from services.analysis_lookup import analysis_cache_stats
+from services.revocation import rebuild_filter, run_sync_loop
+from services.rate_limit import admission_stats
+from services.scheduler import scheduler_stats
+from services.webhook_queue import run_consumer, queue_stats
+from services.price_catalog import refresh_catalog, catalog_stats
+from services.single_flight import single_flight_stats
+from services.prefetch import prefetcher, prefetch_stats
+from services.llm import llm_health, llm_stats
+from services.retention import RETENTION_INTERVAL_SECONDS, run_retention_loop, retention_stats
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     # Startup
     await init_db()
+    # Revoked tokens are answered from an in-memory filter rebuilt from the denylist
+    try:
+        revoked = await rebuild_filter()
+        print(f"Token revocation filter loaded ({revoked} revoked tokens)")
+    except Exception as e:
+        print(f"Token revocation filter rebuild failed, checking every token against the denylist until a retry succeeds: {e}")
+    revocation_sync = asyncio.create_task(run_sync_loop())
+    # The pricing page is served from the in-memory Stripe price catalogue
+    try:
+        catalog = await refresh_catalog()
+        print(f"Price catalogue loaded ({len(catalog['prices'])} prices)")
+    except Exception as e:
+        print(f"Price catalogue load failed, will retry on first request: {e}")
+    # Stripe webhooks are acknowledged on receipt and applied from the durable queue
+    stripe_consumer = asyncio.create_task(run_consumer(stripe_webhook.apply_customer_events))
+    # Result rows are inserted in batches in the background
+    result_writes = asyncio.create_task(result_writer.run())
+    # Partitions, expiry and archiving of forecasts and explanations (0 disables,
+    # e.g. when another process runs it)
+    retention = asyncio.create_task(run_retention_loop()) if RETENTION_INTERVAL_SECONDS > 0 else None
     yield
     # Shutdown
-    pass
+    revocation_sync.cancel()
+    stripe_consumer.cancel()
+    result_writes.cancel()
+    if retention is not None:
+        retention.cancel()
+    prefetcher.cancel()
+    with contextlib.suppress(asyncio.CancelledError):
+        await result_writes
+    # Rows still buffered are written (or spilled to disk) before the connections close
+    await result_writer.close()
+    await close_repositories()
 
 app = FastAPI(
     title="SalesVision AI API",
@@ -45,9 +91,6 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Security
-security = HTTPBearer()
-
 # Include routers
 app.include_router(auth.router, prefix="/auth", tags=["authentication"])
 app.include_router(analyze.router, prefix="/analyze", tags=["analysis"])
@@ -65,7 +108,38 @@ async def root():
 
 @app.get("/health")
 async def health_check():
-    return {"status": "healthy", "service": "SalesVision AI API"}
+    # An open LLM breaker degrades answers (fallback insights) but not availability
+    llm = llm_health()
+    degraded = any(breaker["state"] != "closed" for breaker in llm.values())
+    return {"status": "degraded" if degraded else "healthy", "service": "SalesVision AI API", "llm": llm}
+
+# Bearer token for /metrics (queue, cache and plan internals); unset disables it
+METRICS_TOKEN = os.getenv("METRICS_TOKEN")
+
+async def require_metrics_token(credentials: Optional[HTTPAuthorizationCredentials] = Depends(HTTPBearer(auto_error=False))):
+    if not METRICS_TOKEN:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if credentials is None or not secrets.compare_digest(credentials.credentials, METRICS_TOKEN):
+        raise HTTPException(status_code=401, detail="Invalid metrics token", headers={"WWW-Authenticate": "Bearer"})
+
+@app.get("/metrics", dependencies=[Depends(require_metrics_token)])
+async def metrics():
+    """In-process cache metrics, for tuning sizes and TTLs"""
+    return {
+        "caches": {
+            "auth_users": user_cache_stats(),
+            "analyses": analysis_cache_stats(),
+            "price_catalog": catalog_stats()
+        },
+        "admission": admission_stats(),
+        "schedulers": scheduler_stats(),
+        "stripe_events": await asyncio.to_thread(queue_stats),
+        "write_behind": result_writer.stats(),
+        "single_flight": single_flight_stats(),
+        "prefetch": prefetch_stats(),
+        "llm": llm_stats(),
+        "retention": retention_stats()
+    }
 
 if __name__ == "__main__":
     import uvicorn
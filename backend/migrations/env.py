@@ -0,0 +1,48 @@
+import asyncio
+import os
+import re
+from logging.config import fileConfig
+from alembic import context
+from sqlalchemy.ext.asyncio import create_async_engine
+from services.schema import metadata
+from services.sql_repository import async_database_url
+
+config = context.config
+if config.config_file_name is not None:
+    fileConfig(config.config_file_name)
+
+target_metadata = metadata
+
+# Monthly partitions are created at runtime (services.retention), not by migrations
+_PARTITION = re.compile(r"_(y\d{4}m\d{2}|default)$")
+
+def _include_object(object, name, type_, reflected, compare_to) -> bool:
+    return not (type_ == "table" and reflected and compare_to is None and _PARTITION.search(name))
+
+def _database_url() -> str:
+    url = os.getenv("DATABASE_URL")
+    if not url:
+        raise RuntimeError("DATABASE_URL must be set to run migrations")
+    return async_database_url(url)
+
+def run_migrations_offline() -> None:
+    """Emit the migration SQL without connecting (alembic upgrade head --sql)"""
+    context.configure(url=_database_url(), target_metadata=target_metadata, include_object=_include_object, literal_binds=True, dialect_opts={"paramstyle": "named"})
+    with context.begin_transaction():
+        context.run_migrations()
+
+def _run_migrations(connection) -> None:
+    context.configure(connection=connection, target_metadata=target_metadata, include_object=_include_object)
+    with context.begin_transaction():
+        context.run_migrations()
+
+async def run_migrations_online() -> None:
+    engine = create_async_engine(_database_url())
+    async with engine.connect() as connection:
+        await connection.run_sync(_run_migrations)
+    await engine.dispose()
+
+if context.is_offline_mode():
+    run_migrations_offline()
+else:
+    asyncio.run(run_migrations_online())
@@ -0,0 +1,37 @@
+"""history indexes
+
+Replaces the user_id indexes of the result tables with covering
+(user_id, created_at, id) indexes for the keyset-paginated history pages.
+The new index is built before the old one is dropped, so user_id lookups
+stay indexed throughout.
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-19 14:55:04.989023
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = '0002'
+down_revision = '0001'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_index('idx_analysis_results_history', 'analysis_results', ['user_id', 'created_at', 'id'], unique=False, postgresql_include=['filename', 'data_points'])
+    op.drop_index('idx_analysis_results_user_id', table_name='analysis_results')
+    op.create_index('idx_explanation_results_history', 'explanation_results', ['user_id', 'created_at', 'id'], unique=False, postgresql_include=['analysis_id'])
+    op.drop_index('idx_explanation_results_user_id', table_name='explanation_results')
+    op.create_index('idx_forecast_results_history', 'forecast_results', ['user_id', 'created_at', 'id'], unique=False, postgresql_include=['analysis_id', 'forecast_days'])
+    op.drop_index('idx_forecast_results_user_id', table_name='forecast_results')
+
+
+def downgrade() -> None:
+    op.create_index('idx_forecast_results_user_id', 'forecast_results', ['user_id'], unique=False)
+    op.drop_index('idx_forecast_results_history', table_name='forecast_results')
+    op.create_index('idx_explanation_results_user_id', 'explanation_results', ['user_id'], unique=False)
+    op.drop_index('idx_explanation_results_history', table_name='explanation_results')
+    op.create_index('idx_analysis_results_user_id', 'analysis_results', ['user_id'], unique=False)
+    op.drop_index('idx_analysis_results_history', table_name='analysis_results')
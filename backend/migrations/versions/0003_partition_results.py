@@ -0,0 +1,137 @@
+"""partition results
+
+Turns forecast_results and explanation_results into tables range-partitioned
+by month on created_at (primary key (id, created_at)), adds the archive
+columns, and adds ensure_monthly_partition(), which services.retention calls
+to create partitions ahead of time. Existing rows are copied into
+partitions covering their months; the tables are rewritten, so run this in
+a maintenance window on large databases.
+
+Downgrading copies the rows back into plain tables. Blobs of archived rows
+stay in the archive and are not restored.
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-19 15:20:11.402518
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+revision = '0003'
+down_revision = '0002'
+branch_labels = None
+depends_on = None
+
+ENSURE_MONTHLY_PARTITION = """
+CREATE OR REPLACE FUNCTION ensure_monthly_partition(parent TEXT, month_start DATE) RETURNS TEXT AS $$
+DECLARE
+    range_start DATE := date_trunc('month', month_start);
+    range_end DATE := range_start + INTERVAL '1 month';
+    partition_name TEXT := format('%s_y%sm%s', parent, to_char(range_start, 'YYYY'), to_char(range_start, 'MM'));
+BEGIN
+    IF to_regclass(partition_name) IS NOT NULL THEN
+        RETURN NULL;
+    END IF;
+    EXECUTE format('CREATE TABLE %I (LIKE %I INCLUDING DEFAULTS INCLUDING CONSTRAINTS)', partition_name, parent);
+    EXECUTE format(
+        'WITH moved AS (DELETE FROM %I WHERE created_at >= %L AND created_at < %L RETURNING *) INSERT INTO %I SELECT * FROM moved',
+        parent || '_default', range_start, range_end, partition_name
+    );
+    EXECUTE format('ALTER TABLE %I ATTACH PARTITION %I FOR VALUES FROM (%L) TO (%L)', parent, partition_name, range_start, range_end);
+    RETURN partition_name;
+END;
+$$ LANGUAGE plpgsql
+"""
+
+# Partitions from the month of the oldest row to two months ahead
+CREATE_PARTITIONS = """
+DO $$
+DECLARE
+    month_start DATE;
+BEGIN
+    SELECT date_trunc('month', COALESCE(MIN(created_at), NOW()))::DATE INTO month_start FROM {table}_unpartitioned;
+    WHILE month_start <= date_trunc('month', NOW()) + INTERVAL '2 months' LOOP
+        PERFORM ensure_monthly_partition('{table}', month_start);
+        month_start := month_start + INTERVAL '1 month';
+    END LOOP;
+END;
+$$
+"""
+
+TABLES = {
+    'forecast_results': {
+        'columns': lambda: [
+            sa.Column('analysis_id', sa.UUID(as_uuid=False), nullable=True),
+            sa.Column('forecast_days', sa.Integer(), nullable=True),
+            sa.Column('forecast_data', postgresql.JSONB(astext_type=sa.Text()), nullable=True),
+        ],
+        'copied': 'id, user_id, analysis_id, forecast_days, forecast_data',
+        'include': ['analysis_id', 'forecast_days'],
+    },
+    'explanation_results': {
+        'columns': lambda: [
+            sa.Column('analysis_id', sa.UUID(as_uuid=False), nullable=True),
+            sa.Column('feature_importance', postgresql.JSONB(astext_type=sa.Text()), nullable=True),
+            sa.Column('shap_values', postgresql.JSONB(astext_type=sa.Text()), nullable=True),
+        ],
+        'copied': 'id, user_id, analysis_id, feature_importance, shap_values',
+        'include': ['analysis_id'],
+    },
+}
+
+
+def _set_aside(table: str) -> None:
+    # Index and constraint names are reused by the replacement table
+    op.rename_table(table, f'{table}_unpartitioned')
+    op.execute(f'ALTER INDEX idx_{table}_history RENAME TO idx_{table}_unpartitioned_history')
+    op.execute(f'ALTER TABLE {table}_unpartitioned RENAME CONSTRAINT {table}_pkey TO {table}_unpartitioned_pkey')
+
+
+def upgrade() -> None:
+    op.execute(ENSURE_MONTHLY_PARTITION)
+    for table, spec in TABLES.items():
+        _set_aside(table)
+        op.create_table(table,
+        sa.Column('id', sa.UUID(as_uuid=False), server_default=sa.text('gen_random_uuid()'), nullable=False),
+        sa.Column('user_id', sa.UUID(as_uuid=False), nullable=True),
+        *spec['columns'](),
+        sa.Column('created_at', sa.DateTime(), server_default=sa.text('NOW()'), nullable=False),
+        sa.Column('archived_at', sa.DateTime(), nullable=True),
+        sa.Column('archive_key', sa.String(length=255), nullable=True),
+        sa.ForeignKeyConstraint(['analysis_id'], ['analysis_results.id'], ondelete='CASCADE'),
+        sa.ForeignKeyConstraint(['user_id'], ['users.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('id', 'created_at'),
+        postgresql_partition_by='RANGE (created_at)'
+        )
+        op.create_index(f'idx_{table}_history', table, ['user_id', 'created_at', 'id'], unique=False, postgresql_include=spec['include'])
+        op.execute(f'CREATE TABLE {table}_default PARTITION OF {table} DEFAULT')
+        op.execute(CREATE_PARTITIONS.format(table=table))
+        op.execute(
+            f"INSERT INTO {table} ({spec['copied']}, created_at) "
+            f"SELECT {spec['copied']}, COALESCE(created_at, NOW()) FROM {table}_unpartitioned"
+        )
+        op.drop_table(f'{table}_unpartitioned')
+
+
+def downgrade() -> None:
+    for table, spec in TABLES.items():
+        op.create_table(f'{table}_unpartitioned',
+        sa.Column('id', sa.UUID(as_uuid=False), server_default=sa.text('gen_random_uuid()'), nullable=False),
+        sa.Column('user_id', sa.UUID(as_uuid=False), nullable=True),
+        *spec['columns'](),
+        sa.Column('created_at', sa.DateTime(), server_default=sa.text('NOW()'), nullable=True),
+        sa.ForeignKeyConstraint(['analysis_id'], ['analysis_results.id'], ondelete='CASCADE'),
+        sa.ForeignKeyConstraint(['user_id'], ['users.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('id', name=f'{table}_unpartitioned_pkey')
+        )
+        op.execute(
+            f"INSERT INTO {table}_unpartitioned ({spec['copied']}, created_at) "
+            f"SELECT {spec['copied']}, created_at FROM {table}"
+        )
+        op.drop_table(table)
+        op.rename_table(f'{table}_unpartitioned', table)
+        op.execute(f'ALTER TABLE {table} RENAME CONSTRAINT {table}_unpartitioned_pkey TO {table}_pkey')
+        op.create_index(f'idx_{table}_history', table, ['user_id', 'created_at', 'id'], unique=False, postgresql_include=spec['include'])
+    op.execute('DROP FUNCTION IF EXISTS ensure_monthly_partition(TEXT, DATE)')
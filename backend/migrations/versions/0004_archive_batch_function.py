@@ -0,0 +1,36 @@
+"""archive batch function
+
+Adds mark_archived(), which the REST repository calls to archive a batch of
+result rows in one request instead of one PATCH per row.
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2026-10-19 16:10:42.118305
+"""
+from alembic import op
+
+
+revision = '0004'
+down_revision = '0003'
+branch_labels = None
+depends_on = None
+
+MARK_ARCHIVED = """
+CREATE OR REPLACE FUNCTION mark_archived(target TEXT, archive_keys JSONB, blob_columns TEXT[], archived TIMESTAMP) RETURNS VOID AS $$
+BEGIN
+    EXECUTE format(
+        'UPDATE %I AS t SET %s archived_at = $2, archive_key = k.value FROM jsonb_each_text($1) AS k WHERE t.id = k.key::uuid',
+        target,
+        (SELECT string_agg(format('%I = NULL, ', c), '') FROM unnest(blob_columns) AS c)
+    ) USING archive_keys, archived;
+END;
+$$ LANGUAGE plpgsql;
+"""
+
+
+def upgrade() -> None:
+    op.execute(MARK_ARCHIVED)
+
+
+def downgrade() -> None:
+    op.execute('DROP FUNCTION IF EXISTS mark_archived(TEXT, JSONB, TEXT[], TIMESTAMP)')
@@ -1,5 +1,4 @@
-from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Form
-from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Response, UploadFile, File, Form
 import pandas as pd
 import openai
 import os
@@ -8,11 +7,18 @@ from typing import Dict, Any, Optional
 import json
 from PIL import Image, ImageStat
 import colorsys
-from services.supabase_client import get_supabase_client
-from services.auth import verify_token
+from services.analysis_lookup import find_analysis, invalidate_analysis
+from services.write_behind import result_writer
+from services.auth import require_user
+from services.history import HISTORY_MAX_PAGE_SIZE, HISTORY_PAGE_SIZE, list_history
+from services.rate_limit import rate_limited
+from services.datasets import save_dataset, append_rows
+from services.scheduler import run_job
+from services.single_flight import IdempotencyConflict, request_fingerprint, run_idempotent
+from services.prefetch import prefetcher
+from services.llm import chat_completion
 
 router = APIRouter()
-security = HTTPBearer()
 
 # Initialize OpenAI and model configuration from environment
 openai.api_key = os.getenv("OPENAI_API_KEY")
@@ -23,82 +29,176 @@ OPENAI_INSIGHTS_MAX_TOKENS = int(os.getenv("OPENAI_INSIGHTS_MAX_TOKENS", "1200")
 
 @router.post("/")
 async def analyze_sales_data(
+    response: Response,
     file: UploadFile = File(...),
     image: Optional[UploadFile] = File(None),
     text: Optional[str] = Form(None),
-    credentials: HTTPAuthorizationCredentials = Depends(security)
+    idempotency_key: Optional[str] = Header(None, max_length=255),
+    user: Dict[str, Any] = Depends(rate_limited("llm"))
 ):
     """
-    Analyze uploaded sales data and return AI-generated insights
+    Analyze uploaded sales data and return AI-generated insights.
+    A retry sending the same Idempotency-Key header gets the first response
+    instead of running the analysis again.
     """
     try:
-        # Verify user authentication
-        user = await verify_token(credentials.credentials)
-        if not user:
-            raise HTTPException(status_code=401, detail="Invalid authentication")
-        
         # Check file type
         if not file.filename.endswith('.csv'):
             raise HTTPException(status_code=400, detail="Only CSV files are supported")
         
         # Read CSV data
         contents = await file.read()
-        df = pd.read_csv(io.StringIO(contents.decode('utf-8')))
-        
-        # Basic data validation
-        if df.empty:
-            raise HTTPException(status_code=400, detail="CSV file is empty")
-        
-        # Process multimodal inputs
-        text_insight = None
-        visual_insight = None
-        
-        if text:
-            text_insight = await analyze_text_sentiment(text)
+        if idempotency_key is None:
+            return await run_analysis(file.filename, contents, image, text, user)
         
+        image_bytes = None
         if image:
-            visual_insight = await analyze_image_metadata(image)
-        
-        # Generate AI insights using OpenAI with multimodal context
-        insights = await generate_multimodal_insights(df, text_insight, visual_insight)
-        
-        # Store analysis results in Supabase
-        supabase = get_supabase_client()
-        analysis_result = {
-            "user_id": user["id"],
-            "filename": file.filename,
-            "summary": insights["summary"],
-            "key_factors": insights["key_factors"],
-            "recommendations": insights["recommendations"],
-            "data_points": len(df),
-            "text_insight": text_insight,
-            "visual_insight": visual_insight
+            image_bytes = await image.read()
+            await image.seek(0)
+        fingerprint = request_fingerprint(file.filename.encode(), contents, image_bytes, text.encode() if text else None)
+        try:
+            result, replayed = await run_idempotent(
+                user["id"], "analyze", idempotency_key, fingerprint,
+                lambda: run_analysis(file.filename, contents, image, text, user)
+            )
+        except IdempotencyConflict as e:
+            raise HTTPException(status_code=422, detail=str(e))
+        if replayed:
+            response.headers["Idempotent-Replayed"] = "true"
+        return result
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Analysis failed: {str(e)}")
+
+async def run_analysis(
+    filename: str,
+    contents: bytes,
+    image: Optional[UploadFile],
+    text: Optional[str],
+    user: Dict[str, Any]
+) -> Dict[str, Any]:
+    """Analysis of an uploaded CSV (with optional image and text); stores the result"""
+    df = await run_job("analysis", user, pd.read_csv, io.StringIO(contents.decode('utf-8')))
+    
+    # Basic data validation
+    if df.empty:
+        raise HTTPException(status_code=400, detail="CSV file is empty")
+    
+    # Process multimodal inputs
+    text_insight = None
+    visual_insight = None
+    
+    if text:
+        text_insight = await analyze_text_sentiment(text, user)
+    
+    if image:
+        visual_insight = await analyze_image_metadata(image)
+    
+    # Generate AI insights using OpenAI with multimodal context
+    insights = await generate_multimodal_insights(df, text_insight, visual_insight, user)
+    
+    # Store analysis results in Supabase
+    analysis_result = {
+        "user_id": user["id"],
+        "filename": filename,
+        "summary": insights["summary"],
+        "key_factors": insights["key_factors"],
+        "recommendations": insights["recommendations"],
+        "data_points": len(df),
+        "text_insight": text_insight,
+        "visual_insight": visual_insight
+    }
+    
+    # Written in the background; the ID is assigned here
+    analysis_id = result_writer.submit("analysis_results", analysis_result)
+    
+    # Keep the raw upload so forecasts and explanations can use the real data
+    if analysis_id:
+        try:
+            save_dataset(analysis_id, contents)
+            # Speculatively compute the default forecast and explanation
+            prefetcher.schedule(analysis_id, user)
+        except Exception as e:
+            print(f"Error storing dataset for analysis {analysis_id}: {e}")
+    
+    return {
+        "success": True,
+        "analysis_id": analysis_id,
+        "insights": insights,
+        "text_insight": text_insight,
+        "visual_insight": visual_insight,
+        "data_summary": {
+            "rows": len(df),
+            "columns": list(df.columns),
+            "date_range": get_date_range(df) if 'date' in df.columns else None
         }
+    }
+
+@router.get("/history")
+async def get_analysis_history(
+    limit: int = Query(HISTORY_PAGE_SIZE, ge=1, le=HISTORY_MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    user: Dict[str, Any] = Depends(require_user)
+):
+    """
+    The user's analyses, newest first. Pass next_cursor back as cursor for the
+    following page; it is null on the last one.
+    """
+    try:
+        return await list_history("analysis_results", user["id"], limit, cursor)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@router.post("/{analysis_id}/rows")
+async def append_analysis_rows(
+    analysis_id: str,
+    file: UploadFile = File(...),
+    user: Dict[str, Any] = Depends(require_user)
+):
+    """
+    Append new rows (CSV with the same header) to the stored data of an analysis.
+    Later explanations only compute SHAP values for the appended rows.
+    """
+    try:
+        if not file.filename.endswith('.csv'):
+            raise HTTPException(status_code=400, detail="Only CSV files are supported")
         
-        result = supabase.table("analysis_results").insert(analysis_result).execute()
+        if await find_analysis(analysis_id, user["id"]) is None:
+            raise HTTPException(status_code=404, detail="Analysis not found")
         
+        contents = await file.read()
+        try:
+            data_fingerprint = append_rows(analysis_id, contents)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        if data_fingerprint is None:
+            raise HTTPException(status_code=404, detail="No stored data for this analysis")
+        # The cached metadata described the data before this append
+        invalidate_analysis(analysis_id)
+        
+        rows = max(len(contents.strip().split(b"\n")) - 1, 0)
         return {
             "success": True,
-            "analysis_id": result.data[0]["id"] if result.data else None,
-            "insights": insights,
-            "text_insight": text_insight,
-            "visual_insight": visual_insight,
-            "data_summary": {
-                "rows": len(df),
-                "columns": list(df.columns),
-                "date_range": get_date_range(df) if 'date' in df.columns else None
-            }
+            "analysis_id": analysis_id,
+            "rows_appended": rows,
+            "fingerprint": data_fingerprint
         }
         
+    except HTTPException:
+        raise
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Analysis failed: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Appending rows failed: {str(e)}")
 
-async def analyze_text_sentiment(text: str) -> Dict[str, Any]:
+async def analyze_text_sentiment(text: str, user: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
     """
     Analyze text sentiment and tone using OpenAI
     """
     try:
-        response = openai.ChatCompletion.create(
+        # Fails fast to the fallback below while the model's breaker is open
+        response = await chat_completion(
+            user,
             model=OPENAI_MODEL,
             messages=[
                 {"role": "system", "content": "You are a marketing sentiment analyst. Analyze the tone, sentiment, and key themes of marketing text."},
@@ -171,7 +271,12 @@ async def analyze_image_metadata(image: UploadFile) -> Dict[str, Any]:
             "characteristics": "Unable to analyze image"
         }
 
-async def generate_multimodal_insights(df: pd.DataFrame, text_insight: Optional[Dict], visual_insight: Optional[Dict]) -> Dict[str, Any]:
+async def generate_multimodal_insights(
+    df: pd.DataFrame,
+    text_insight: Optional[Dict],
+    visual_insight: Optional[Dict],
+    user: Optional[Dict[str, Any]] = None
+) -> Dict[str, Any]:
     """
     Generate AI insights from sales data with multimodal context
     """
@@ -224,7 +329,9 @@ async def generate_multimodal_insights(df: pd.DataFrame, text_insight: Optional[
         Format your response as JSON with keys: summary, key_factors, recommendations, visual_insight, text_insight
         """
         
-        response = openai.ChatCompletion.create(
+        # Fails fast to the fallback below while the model's breaker is open
+        response = await chat_completion(
+            user,
             model=OPENAI_MODEL,
             messages=[
                 {"role": "system", "content": "You are a multimodal sales analytics expert. Analyze sales data, marketing text, and visual elements to provide integrated, explainable insights."},
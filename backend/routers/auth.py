@@ -1,13 +1,11 @@
-from fastapi import APIRouter, Depends, HTTPException, status
-from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
+from fastapi import APIRouter, Depends, HTTPException, Request, status
 from pydantic import BaseModel
-from typing import Optional
+from typing import Optional, Dict, Any
 import os
-from services.supabase_client import get_supabase_client
-from services.auth import create_access_token, verify_token
+from services.repository import get_repository
+from services.auth import create_access_token, require_user, revoke_claims
 
 router = APIRouter()
-security = HTTPBearer()
 
 class LoginRequest(BaseModel):
     email: str
@@ -29,28 +27,23 @@ async def login(login_data: LoginRequest):
     Authenticate user with email and password
     """
     try:
-        supabase = get_supabase_client()
-        
         # Authenticate with Supabase
-        response = supabase.auth.sign_in_with_password({
-            "email": login_data.email,
-            "password": login_data.password
-        })
+        auth_user = await get_repository().sign_in(login_data.email, login_data.password)
         
-        if not response.user:
+        if not auth_user:
             raise HTTPException(
                 status_code=status.HTTP_401_UNAUTHORIZED,
                 detail="Invalid credentials"
             )
         
         # Create JWT token
-        access_token = create_access_token(data={"sub": response.user.id})
+        access_token = create_access_token(data={"sub": auth_user["id"]})
         
         # Get user profile
         user_profile = {
-            "id": response.user.id,
-            "email": response.user.email,
-            "created_at": response.user.created_at,
+            "id": auth_user["id"],
+            "email": auth_user["email"],
+            "created_at": auth_user.get("created_at"),
             "plan": "free"  # Default plan
         }
         
@@ -60,6 +53,8 @@ async def login(login_data: LoginRequest):
             user=user_profile
         )
         
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -72,20 +67,16 @@ async def signup(signup_data: SignupRequest):
     Register new user
     """
     try:
-        supabase = get_supabase_client()
+        repository = get_repository()
         
         # Create user in Supabase
-        response = supabase.auth.sign_up({
-            "email": signup_data.email,
-            "password": signup_data.password,
-            "options": {
-                "data": {
-                    "full_name": signup_data.full_name or ""
-                }
-            }
-        })
+        auth_user = await repository.sign_up(
+            signup_data.email,
+            signup_data.password,
+            {"full_name": signup_data.full_name or ""}
+        )
         
-        if not response.user:
+        if not auth_user:
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
                 detail="Registration failed"
@@ -93,17 +84,17 @@ async def signup(signup_data: SignupRequest):
         
         # Create user profile in database
         user_profile = {
-            "id": response.user.id,
-            "email": response.user.email,
+            "id": auth_user["id"],
+            "email": auth_user["email"],
             "plan": "free",
-            "created_at": response.user.created_at
+            "created_at": auth_user.get("created_at")
         }
         
         # Insert user into users table
-        supabase.table("users").insert(user_profile).execute()
+        await repository.create_user(user_profile)
         
         # Create JWT token
-        access_token = create_access_token(data={"sub": response.user.id})
+        access_token = create_access_token(data={"sub": auth_user["id"]})
         
         return TokenResponse(
             access_token=access_token,
@@ -111,6 +102,8 @@ async def signup(signup_data: SignupRequest):
             user=user_profile
         )
         
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
@@ -118,14 +111,14 @@ async def signup(signup_data: SignupRequest):
         )
 
 @router.post("/logout")
-async def logout(credentials: HTTPAuthorizationCredentials = Depends(security)):
+async def logout(request: Request, user: Dict[str, Any] = Depends(require_user)):
     """
-    Logout user
+    Logout user by revoking the presented token
     """
     try:
-        # In a real implementation, you might want to blacklist the token
-        # For now, we'll just return success
-        return {"message": "Successfully logged out"}
+        # Tokens issued before jti was added cannot be revoked individually; they expire on their own
+        revoked = await revoke_claims(request.state.token_claims)
+        return {"message": "Successfully logged out", "token_revoked": revoked}
         
     except Exception as e:
         raise HTTPException(
@@ -134,39 +127,18 @@ async def logout(credentials: HTTPAuthorizationCredentials = Depends(security)):
         )
 
 @router.get("/me")
-async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)):
+async def get_current_user(user: Dict[str, Any] = Depends(require_user)):
     """
     Get current user information
     """
-    try:
-        user = await verify_token(credentials.credentials)
-        if not user:
-            raise HTTPException(
-                status_code=status.HTTP_401_UNAUTHORIZED,
-                detail="Invalid token"
-            )
-        
-        return {"user": user}
-        
-    except Exception as e:
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail=f"Authentication failed: {str(e)}"
-        )
+    return {"user": user}
 
 @router.post("/refresh")
-async def refresh_token(credentials: HTTPAuthorizationCredentials = Depends(security)):
+async def refresh_token(user: Dict[str, Any] = Depends(require_user)):
     """
     Refresh access token
     """
     try:
-        user = await verify_token(credentials.credentials)
-        if not user:
-            raise HTTPException(
-                status_code=status.HTTP_401_UNAUTHORIZED,
-                detail="Invalid token"
-            )
-        
         # Create new token
         new_token = create_access_token(data={"sub": user["id"]})
         
@@ -181,4 +153,3 @@ async def refresh_token(credentials: HTTPAuthorizationCredentials = Depends(secu
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail=f"Token refresh failed: {str(e)}"
         )
-
@@ -1,66 +1,366 @@
-from fastapi import APIRouter, Depends, HTTPException
-from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
+from fastapi import APIRouter, Depends, HTTPException, Query
 import pandas as pd
 import numpy as np
-from typing import Dict, List, Any
+from typing import Dict, List, Any, Literal, Optional
 import os
-from services.supabase_client import get_supabase_client
-from services.auth import verify_token
+import time
+from services.analysis_lookup import find_analysis
+from services.write_behind import result_writer
+from services.auth import require_user
+from services.history import HISTORY_MAX_PAGE_SIZE, HISTORY_PAGE_SIZE, list_history
+from services.rate_limit import rate_limited
+from services.retention import get_result
+from services.datasets import dataset_fingerprint, load_dataset
+from services.cache import TTLCache
+from services.shap_format import build_compact_explanation, without_matrices
+from services.scheduler import run_job
+from services.single_flight import flight_key, single_flight
+from services.prefetch import prefetcher
 
 router = APIRouter()
-security = HTTPBearer()
+
+# Default quantization of stored SHAP matrices: unset (float32), "int16" or "int8"
+EXPLAIN_STORAGE_QUANTIZE = os.getenv("EXPLAIN_STORAGE_QUANTIZE") or None
+
+# Largest number of rows a single request may ask to explain
+EXPLAIN_ROWS_LIMIT = int(os.getenv("EXPLAIN_ROWS_LIMIT", "200000"))
+# Requests explaining more rows than this are scheduled as background batch jobs
+EXPLAIN_BATCH_ROWS = int(os.getenv("EXPLAIN_BATCH_ROWS", "10000"))
+
+# Progress of explanation jobs per analysis ID: {(target column, options): progress};
+# prefetches, summaries and requests with other options run side by side
+explain_progress = TTLCache(maxsize=1024, ttl=3600)
+
+# Explanation artifacts (surrogate model, SHAP sample and the built response)
+# per (analysis ID, target column); each entry records its data fingerprint
+EXPLAIN_CACHE_SIZE = int(os.getenv("EXPLAIN_CACHE_SIZE", "64"))
+EXPLAIN_CACHE_TTL_SECONDS = int(os.getenv("EXPLAIN_CACHE_TTL_SECONDS", "3600"))
+explanation_cache = TTLCache(maxsize=EXPLAIN_CACHE_SIZE, ttl=EXPLAIN_CACHE_TTL_SECONDS)
+# Explanation summaries per (analysis ID, target column, data fingerprint,
+# top features, grid size)
+summary_cache = TTLCache(maxsize=EXPLAIN_CACHE_SIZE * 4, ttl=EXPLAIN_CACHE_TTL_SECONDS)
 
 @router.post("/")
 async def explain_insights(
     analysis_id: str,
-    credentials: HTTPAuthorizationCredentials = Depends(security)
+    target_column: Optional[str] = None,
+    explain_rows: Optional[int] = Query(None, ge=1, le=EXPLAIN_ROWS_LIMIT),
+    quantize: Optional[Literal["int16", "int8"]] = None,
+    include_matrix: bool = False,
+    user: Dict[str, Any] = Depends(rate_limited("cpu"))
 ):
     """
     Generate explainable AI insights using SHAP
     """
     try:
-        # Verify user authentication
-        user = await verify_token(credentials.credentials)
-        if not user:
-            raise HTTPException(status_code=401, detail="Invalid authentication")
-        
         # Get analysis data from Supabase
-        supabase = get_supabase_client()
-        result = supabase.table("analysis_results").select("*").eq("id", analysis_id).eq("user_id", user["id"]).execute()
-        
-        if not result.data:
+        analysis = await find_analysis(analysis_id, user["id"])
+        if analysis is None:
             raise HTTPException(status_code=404, detail="Analysis not found")
         
-        # Generate SHAP explanations
-        explanations = await generate_shap_explanations()
+        quantize = quantize or EXPLAIN_STORAGE_QUANTIZE
+        # Only the default explanation is prefetched
+        if target_column is None and explain_rows is None and quantize == EXPLAIN_STORAGE_QUANTIZE:
+            prefetcher.claim("explain", analysis_id, (analysis_id, None) in explanation_cache)
         
-        # Store explanation results
-        explanation_result = {
-            "analysis_id": analysis_id,
-            "feature_importance": explanations["feature_importance"],
-            "shap_values": explanations["shap_values"],
-            "user_id": user["id"]
-        }
+        async def explain_and_store():
+            # Generate SHAP explanations
+            explanations = await generate_shap_explanations(analysis_id, target_column, explain_rows, user, quantize)
+            # Placeholder content is returned but not stored as a result
+            if explanations.get("cache_status") == "fallback":
+                return None, explanations
+            
+            # Unchanged data: reuse the row stored for the cached artifact
+            cached = explanation_cache.get((analysis_id, target_column))
+            if explanations.get("cache_status") == "hit" and cached and cached.get("explanation_id"):
+                return cached["explanation_id"], explanations
+            
+            # Store explanation results
+            explanation_result = {
+                "analysis_id": analysis_id,
+                "feature_importance": explanations["feature_importance"],
+                "shap_values": explanations["shap_values"],
+                "user_id": user["id"]
+            }
+            
+            explanation_id = result_writer.submit("explanation_results", explanation_result)
+            # Hits on entries filled without storing a row (prefetch, summaries)
+            # record theirs too, so later hits reuse it
+            if cached and explanations.get("cache_status") in ("hit", "miss", "incremental"):
+                cached["explanation_id"] = explanation_id
+            return explanation_id, explanations
         
-        result = supabase.table("explanation_results").insert(explanation_result).execute()
+        # Identical concurrent requests share one computation and one stored
+        # explanation; include_matrix only shapes each response
+        params = {"analysis_id": analysis_id, "target_column": target_column, "explain_rows": explain_rows, "quantize": quantize}
+        explanation_id, explanations = await single_flight.run(
+            flight_key(user["id"], "explain", params, dataset_fingerprint(analysis_id)), explain_and_store
+        )
+        
+        # The summaries cover the standard charts; raw matrices only on request
+        if not include_matrix:
+            explanations = {**explanations, "shap_values": without_matrices(explanations["shap_values"])}
         
         return {
             "success": True,
-            "explanation_id": result.data[0]["id"] if result.data else None,
+            "explanation_id": explanation_id,
             "explanations": explanations
         }
         
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Explanation generation failed: {str(e)}")
 
-async def generate_shap_explanations() -> Dict[str, Any]:
+@router.get("/history")
+async def get_explanation_history(
+    limit: int = Query(HISTORY_PAGE_SIZE, ge=1, le=HISTORY_MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    user: Dict[str, Any] = Depends(require_user)
+):
+    """
+    The user's explanations, newest first. Pass next_cursor back as cursor for the
+    following page; it is null on the last one.
+    """
+    try:
+        return await list_history("explanation_results", user["id"], limit, cursor)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@router.get("/{explanation_id}")
+async def get_explanation(
+    explanation_id: str,
+    user: Dict[str, Any] = Depends(require_user)
+):
+    """
+    A stored explanation; archived explanations are read back from the archive
+    """
+    try:
+        row = await get_result("explanation_results", explanation_id, user["id"])
+    except KeyError:
+        raise HTTPException(status_code=410, detail="Archived explanation is no longer available")
+    if row is None:
+        raise HTTPException(status_code=404, detail="Explanation not found")
+    
+    return {
+        "explanation_id": row["id"],
+        "analysis_id": row.get("analysis_id"),
+        "feature_importance": row.get("feature_importance"),
+        "shap_values": row.get("shap_values"),
+        "created_at": row.get("created_at"),
+        "archived": row.get("archived_at") is not None
+    }
+
+@router.get("/{analysis_id}/progress")
+async def get_explanation_progress(
+    analysis_id: str,
+    user: Dict[str, Any] = Depends(require_user)
+):
+    """
+    Progress of the SHAP computations for an analysis: totals over the jobs
+    still running, or the latest job once none is
+    """
+    jobs = [progress for progress in list((explain_progress.get(analysis_id) or {}).values()) if progress["user_id"] == user["id"]]
+    if not jobs:
+        raise HTTPException(status_code=404, detail="No explanation job for this analysis")
+    
+    current = [progress for progress in jobs if progress["status"] == "running"] or [max(jobs, key=lambda progress: progress["started"])]
+    return {
+        "analysis_id": analysis_id,
+        "status": current[0]["status"],
+        "rows_done": sum(progress["done"] for progress in current),
+        "rows_total": sum(progress["total"] for progress in current),
+        "jobs": [
+            {
+                "target_column": progress["target_column"],
+                "explain_rows": progress["explain_rows"],
+                "status": progress["status"],
+                "rows_done": progress["done"],
+                "rows_total": progress["total"]
+            }
+            for progress in jobs
+        ]
+    }
+
+@router.get("/{analysis_id}/summary")
+async def get_explanation_summary(
+    analysis_id: str,
+    target_column: Optional[str] = None,
+    top_features: int = Query(5, ge=1, le=20),
+    grid_size: int = Query(20, ge=2, le=100),
+    user: Dict[str, Any] = Depends(rate_limited("cpu"))
+):
+    """
+    Server-side explanation aggregates: importance with bootstrap confidence
+    intervals, partial dependence / ICE curves and pairwise interaction strength
+    """
+    try:
+        analysis = await find_analysis(analysis_id, user["id"])
+        if analysis is None:
+            raise HTTPException(status_code=404, detail="Analysis not found")
+        
+        # Reuses the cached artifact (or computes and caches it) for the current data
+        explanations = await generate_shap_explanations(
+            analysis_id, target_column, None, user, EXPLAIN_STORAGE_QUANTIZE
+        )
+        cached = explanation_cache.get((analysis_id, target_column))
+        if explanations.get("source") != "shap" or not cached:
+            raise HTTPException(status_code=404, detail="No stored data to summarize for this analysis")
+        
+        summary_key = (analysis_id, target_column, cached["fingerprint"], top_features, grid_size)
+        summary = summary_cache.get(summary_key)
+        if summary is None:
+            # Imported lazily alongside the explainer
+            from services.explain_summary import summarize_artifact
+            summary = await run_job(
+                "explain", user, summarize_artifact, cached["artifact"], top_features, grid_size,
+                dedup_key=("summary",) + summary_key
+            )
+            summary_cache.set(summary_key, summary)
+        
+        return {
+            "success": True,
+            "analysis_id": analysis_id,
+            "summary": summary
+        }
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Explanation summary failed: {str(e)}")
+
+async def generate_shap_explanations(
+    analysis_id: Optional[str] = None,
+    target_column: Optional[str] = None,
+    explain_rows: Optional[int] = None,
+    user: Optional[Dict[str, Any]] = None,
+    quantize: Optional[str] = None,
+    background: bool = False
+) -> Dict[str, Any]:
     """
     Generate SHAP explanations for sales data
     """
     try:
-        # For demo purposes, generate synthetic SHAP data
-        # In production, you would use actual SHAP analysis
+        dataset = load_dataset(analysis_id) if analysis_id else None
+        if dataset is None:
+            # Analyses created before uploads were stored have no data to explain
+            return generate_demo_explanations(quantize)
+        
+        df, data_fingerprint = dataset
+        cache_key = (analysis_id, target_column)
+        options = (explain_rows, quantize)
+        cached = explanation_cache.get(cache_key)
+        if cached and cached["options"] == options and cached["fingerprint"] == data_fingerprint:
+            return {**cached["explanations"], "cache_status": "hit"}
+        previous = cached["artifact"] if cached and cached["options"] == options else None
+        
+        # Imported lazily: shap and scikit-learn are only needed for real explanations
+        from services.explainer import EXPLAIN_MAX_ROWS, explain_dataset, extend_explanation
+        
+        progress = {
+            "user_id": user["id"] if user else None, "status": "running", "done": 0, "total": 0,
+            "target_column": target_column, "explain_rows": explain_rows, "started": time.monotonic()
+        }
+        jobs = explain_progress.get(analysis_id)
+        if jobs is None:
+            jobs = {}
+            explain_progress.set(analysis_id, jobs)
+        jobs[(target_column, options)] = progress
+        
+        def report(done: int, total: int):
+            progress.update(done=done, total=total)
         
+        def compute():
+            # Appended rows: explain only the new ones with the cached surrogate
+            if previous is not None:
+                extended = extend_explanation(previous, df, explain_rows, report)
+                if extended is not None:
+                    return extended, "incremental"
+            return explain_dataset(df, target_column, explain_rows, report), "miss"
+        
+        # CPU-bound: run on the explain pool so progress polls are served meanwhile
+        try:
+            rows = explain_rows or EXPLAIN_MAX_ROWS
+            artifact, cache_status = await run_job(
+                "explain", user, compute, cost=max(1.0, rows / 1000), batch=rows > EXPLAIN_BATCH_ROWS,
+                dedup_key=("explain", analysis_id, target_column, options, data_fingerprint), background=background
+            )
+            progress["status"] = "completed"
+        except Exception:
+            progress["status"] = "failed"
+            raise
+        
+        explanations = build_explanations(artifact, quantize)
+        explanation_cache.set(cache_key, {
+            "fingerprint": data_fingerprint,
+            "options": options,
+            "artifact": artifact,
+            "explanations": explanations,
+            "explanation_id": None
+        })
+        return {**explanations, "cache_status": cache_status}
+        
+    except ValueError as e:
+        # The request does not fit the data, e.g. an unknown target column
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        # Fallback explanations
+        print(f"Error generating SHAP explanations: {e}")
+        return {**generate_fallback_explanations(), "cache_status": "fallback"}
+
+async def prefetch_explanation(analysis_id: str, user: Dict[str, Any]) -> None:
+    """
+    The default explanation of a new analysis, computed in the background into
+    the explanation cache; a request for it meanwhile joins the job
+    """
+    await generate_shap_explanations(analysis_id, None, None, user, EXPLAIN_STORAGE_QUANTIZE, background=True)
+    if (analysis_id, None) not in explanation_cache:
+        raise RuntimeError("no explanation was computed")
+
+prefetcher.register("explain", prefetch_explanation)
+
+def build_explanations(artifact: Dict[str, Any], quantize: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Response payload for an explanation artifact
+    """
+    from services.explainer import feature_impacts
+    
+    features = artifact["feature_names"]
+    shap_matrix = artifact["shap_values"]
+    
+    # Global importance: mean |SHAP| per feature over all rows, normalized to sum to 1
+    mean_abs = artifact["mean_abs"]
+    importance_scores = mean_abs / mean_abs.sum() if mean_abs.sum() > 0 else mean_abs
+    impacts = feature_impacts(artifact["values"], shap_matrix, artifact["categorical_mask"])
+    
+    feature_importance = [
+        {
+            "feature": feature,
+            "importance": float(importance_scores[i]),
+            "impact": impacts[i],
+            "description": get_feature_description(feature)
+        }
+        for i, feature in enumerate(features)
+    ]
+    feature_importance.sort(key=lambda x: x["importance"], reverse=True)
+    
+    return {
+        "feature_importance": feature_importance,
+        "shap_values": build_compact_explanation(
+            features, artifact["values"], shap_matrix, artifact["base_value"], quantize, impacts
+        ),
+        "insights": generate_explanation_insights(feature_importance),
+        "model_confidence": round(max(0.0, min(1.0, artifact["r2"])), 4),
+        "target_column": artifact["target_column"],
+        "source": "shap",
+        "timings": artifact["timings"]
+    }
+
+def generate_demo_explanations(quantize: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Synthetic explanations for analyses without a stored dataset
+    """
+    try:
         # Simulate feature importance
         features = [
             "Marketing Spend",
@@ -92,7 +392,7 @@ async def generate_shap_explanations() -> Dict[str, Any]:
         feature_importance.sort(key=lambda x: x["importance"], reverse=True)
         
         # Generate SHAP values for sample predictions
-        shap_values = generate_sample_shap_values(features)
+        shap_values = generate_sample_shap_values(features, quantize)
         
         # Generate insights
         insights = generate_explanation_insights(feature_importance)
@@ -101,7 +401,8 @@ async def generate_shap_explanations() -> Dict[str, Any]:
             "feature_importance": feature_importance,
             "shap_values": shap_values,
             "insights": insights,
-            "model_confidence": 0.87
+            "model_confidence": 0.87,
+            "source": "demo"
         }
         
     except Exception as e:
@@ -122,36 +423,16 @@ def get_feature_description(feature: str) -> str:
     }
     return descriptions.get(feature, "Feature impact on sales performance")
 
-def generate_sample_shap_values(features: List[str]) -> Dict[str, Any]:
+def generate_sample_shap_values(features: List[str], quantize: Optional[str] = None) -> Dict[str, Any]:
     """Generate sample SHAP values for visualization"""
     np.random.seed(42)
     
     # Generate sample data points
     sample_points = 10
-    shap_data = []
-    
-    for i in range(sample_points):
-        point_data = {
-            "prediction": 1000 + np.random.normal(0, 200),
-            "features": {}
-        }
-        
-        for feature in features:
-            point_data["features"][feature] = {
-                "value": np.random.normal(0, 1),
-                "shap_value": np.random.normal(0, 0.5)
-            }
-        
-        shap_data.append(point_data)
+    values = np.random.normal(0, 1, (sample_points, len(features)))
+    shap_matrix = np.random.normal(0, 0.5, (sample_points, len(features)))
     
-    return {
-        "sample_predictions": shap_data,
-        "summary": {
-            "total_features": len(features),
-            "positive_features": len([f for f in features if np.random.random() > 0.5]),
-            "negative_features": len([f for f in features if np.random.random() <= 0.5])
-        }
-    }
+    return build_compact_explanation(features, values, shap_matrix, 1000.0, quantize)
 
 def generate_explanation_insights(feature_importance: List[Dict]) -> Dict[str, Any]:
     """Generate insights from feature importance analysis"""
@@ -198,7 +479,15 @@ def generate_fallback_explanations() -> Dict[str, Any]:
             }
         ],
         "shap_values": {
-            "sample_predictions": [],
+            "format": "matrix-v1",
+            "features": ["Data Quality", "Historical Trends", "External Factors"],
+            "base_value": 0.0,
+            "n_samples": 0,
+            "summaries": {
+                "mean_abs": [0.4, 0.3, 0.3],
+                "beeswarm": [],
+                "dependence": []
+            },
             "summary": {
                 "total_features": 3,
                 "positive_features": 2,
@@ -1,43 +1,214 @@
-from fastapi import APIRouter, Depends, HTTPException
-from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
+from fastapi import APIRouter, Depends, HTTPException, Query
+from pydantic import BaseModel, Field
 import pandas as pd
 import numpy as np
 from prophet import Prophet
-from typing import Dict, List, Any
+from typing import Dict, List, Any, Literal, Optional
+import calendar
+import itertools
+import math
 import os
-from services.supabase_client import get_supabase_client
-from services.auth import verify_token
+from services.analysis_lookup import find_analysis
+from services.write_behind import result_writer
+from services.auth import require_user
+from services.history import HISTORY_MAX_PAGE_SIZE, HISTORY_PAGE_SIZE, list_history
+from services.rate_limit import rate_limited
+from services.retention import get_result
+from services.cache import TTLCache
+from services.seasonality import compute_seasonal_profile, bucket_yearly
+from services.datasets import dataset_fingerprint, load_dataset
+from services.scheduler import run_job
+from services.single_flight import flight_key, single_flight
+from services.prefetch import prefetcher
 
 router = APIRouter()
-security = HTTPBearer()
+
+# Fitted Prophet models (with their seasonal profiles), keyed by analysis ID
+FORECAST_MODEL_CACHE_SIZE = int(os.getenv("FORECAST_MODEL_CACHE_SIZE", "128"))
+FORECAST_MODEL_CACHE_TTL_SECONDS = int(os.getenv("FORECAST_MODEL_CACHE_TTL_SECONDS", "3600"))
+model_cache = TTLCache(maxsize=FORECAST_MODEL_CACHE_SIZE, ttl=FORECAST_MODEL_CACHE_TTL_SECONDS)
+
+DEFAULT_WEEKLY_PATTERN = [0.1, 0.2, 0.3, 0.4, 0.5, 0.2, 0.1]
+
+# Upper bound on scenarios evaluated in a single what-if request
+MAX_SCENARIOS = int(os.getenv("FORECAST_MAX_SCENARIOS", "1000"))
+# Trailing window used as the baseline value of each regressor over the horizon
+SCENARIO_BASELINE_DAYS = int(os.getenv("FORECAST_SCENARIO_BASELINE_DAYS", "28"))
+# Longest what-if horizon in days
+SCENARIO_MAX_DAYS = int(os.getenv("FORECAST_SCENARIO_MAX_DAYS", "365"))
+
+class ScenarioRequest(BaseModel):
+    analysis_id: str
+    regressors: List[str]
+    target_column: str = "sales"
+    date_column: str = "date"
+    days: int = Field(30, ge=1, le=SCENARIO_MAX_DAYS)
+    # Explicit scenarios: relative change per regressor, e.g. {"marketing_spend": 0.1}
+    scenarios: List[Dict[str, float]] = []
+    # Cartesian grid of relative changes, e.g. {"marketing_spend": [0.1, 0.2, 0.3]}
+    grid: Dict[str, List[float]] = {}
 
 @router.post("/")
 async def generate_forecast(
     analysis_id: str,
     days: int = 30,
-    credentials: HTTPAuthorizationCredentials = Depends(security)
+    seasonality_resolution: Literal["daily", "weekly", "monthly"] = "daily",
+    user: Dict[str, Any] = Depends(rate_limited("cpu"))
 ):
     """
     Generate sales forecast using Prophet
     """
     try:
-        # Verify user authentication
-        user = await verify_token(credentials.credentials)
-        if not user:
-            raise HTTPException(status_code=401, detail="Invalid authentication")
-        
         # Get analysis data from Supabase
-        supabase = get_supabase_client()
-        result = supabase.table("analysis_results").select("*").eq("id", analysis_id).eq("user_id", user["id"]).execute()
+        analysis = await find_analysis(analysis_id, user["id"])
+        if analysis is None:
+            raise HTTPException(status_code=404, detail="Analysis not found")
+        
+        # The fitted model serves any horizon, so every forecast can use a prefetched one
+        prefetcher.claim("forecast", analysis_id, analysis_id in model_cache)
+        
+        async def forecast_and_store():
+            # For demo purposes, generate synthetic forecast data
+            # In production, you would load the actual sales data
+            forecast_data = await generate_prophet_forecast(days, analysis_id, seasonality_resolution, user)
+            
+            # Store forecast results
+            forecast_result = {
+                "analysis_id": analysis_id,
+                "forecast_days": days,
+                "forecast_data": forecast_data,
+                "user_id": user["id"]
+            }
+            
+            return result_writer.submit("forecast_results", forecast_result), forecast_data
+        
+        # Identical concurrent requests share one fit and one stored forecast
+        params = {"analysis_id": analysis_id, "days": days, "resolution": seasonality_resolution}
+        forecast_id, forecast_data = await single_flight.run(
+            flight_key(user["id"], "forecast", params, dataset_fingerprint(analysis_id)), forecast_and_store
+        )
+        
+        return {
+            "success": True,
+            "forecast_id": forecast_id,
+            "forecast": forecast_data,
+            "period": f"{days} days"
+        }
         
-        if not result.data:
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Forecast generation failed: {str(e)}")
+
+@router.get("/history")
+async def get_forecast_history(
+    limit: int = Query(HISTORY_PAGE_SIZE, ge=1, le=HISTORY_MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    user: Dict[str, Any] = Depends(require_user)
+):
+    """
+    The user's forecasts, newest first. Pass next_cursor back as cursor for the
+    following page; it is null on the last one.
+    """
+    try:
+        return await list_history("forecast_results", user["id"], limit, cursor)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@router.get("/{forecast_id}")
+async def get_forecast(
+    forecast_id: str,
+    user: Dict[str, Any] = Depends(require_user)
+):
+    """
+    A stored forecast; archived forecasts are read back from the archive
+    """
+    try:
+        row = await get_result("forecast_results", forecast_id, user["id"])
+    except KeyError:
+        raise HTTPException(status_code=410, detail="Archived forecast is no longer available")
+    if row is None:
+        raise HTTPException(status_code=404, detail="Forecast not found")
+    
+    return {
+        "forecast_id": row["id"],
+        "analysis_id": row.get("analysis_id"),
+        "forecast": row.get("forecast_data"),
+        "period": f"{row.get('forecast_days')} days",
+        "created_at": row.get("created_at"),
+        "archived": row.get("archived_at") is not None
+    }
+
+@router.post("/hierarchical")
+async def generate_hierarchical_forecast(
+    analysis_id: str,
+    hierarchy: List[str] = Query(..., description="Hierarchy columns from top to bottom, e.g. region, store"),
+    target_column: str = "sales",
+    date_column: str = "date",
+    fit_level: Optional[str] = None,
+    method: Literal["bottom_up", "ols", "wls", "mint"] = "mint",
+    days: int = 30,
+    user: Dict[str, Any] = Depends(rate_limited("cpu"))
+):
+    """
+    Generate coherent forecasts for every level of a hierarchy (total,
+    regions, stores, ...). Prophet is fitted only at fit_level (the bottom
+    level by default) and all levels are reconciled with a matrix method.
+    """
+    # Imported lazily: SciPy is only needed for hierarchical forecasts
+    from services.hierarchy import get_hierarchy, reconcile
+    
+    try:
+        analysis = await find_analysis(analysis_id, user["id"])
+        if analysis is None:
             raise HTTPException(status_code=404, detail="Analysis not found")
         
-        # For demo purposes, generate synthetic forecast data
-        # In production, you would load the actual sales data
-        forecast_data = await generate_prophet_forecast(days)
+        dataset = load_dataset(analysis_id)
+        if dataset is None:
+            raise HTTPException(status_code=404, detail="No stored dataset for this analysis")
+        df, data_fingerprint = dataset
+        
+        missing = [c for c in [date_column, target_column] + hierarchy if c not in df.columns]
+        if missing:
+            raise HTTPException(status_code=400, detail=f"Columns not found in dataset: {missing}")
+        if "total" in hierarchy:
+            # "total" names the top level of every hierarchy
+            raise HTTPException(status_code=400, detail="A hierarchy column cannot be named 'total'")
+        
+        fit_level = fit_level or hierarchy[-1]
+        if fit_level != "total" and fit_level not in hierarchy:
+            raise HTTPException(status_code=400, detail="fit_level must be 'total' or one of the hierarchy columns")
+        
+        tree = get_hierarchy(analysis_id, data_fingerprint, df, date_column, target_column, hierarchy)
+        
+        # Fit Prophet only for the nodes of the chosen level
+        start, stop = tree["level_slices"][fit_level]
+        history = np.asarray(tree["S"][start:stop] @ tree["bottom_history"].T).T
+        # One fit per node: scheduled as a batch job weighted by the number of fits
+        fit_forecast, fit_fitted = await run_job(
+            "forecast", user, fit_node_forecasts, tree["dates"], history, days,
+            cost=history.shape[1], batch=True
+        )
+        
+        reconciled = reconcile(tree, fit_level, fit_forecast, fit_fitted, method)
+        forecast_dates = pd.date_range(start=tree["dates"][-1] + pd.Timedelta(days=1), periods=days, freq='D')
+        
+        forecast_data = {
+            "dates": forecast_dates.strftime('%Y-%m-%d').tolist(),
+            "method": method,
+            "fit_level": fit_level,
+            "levels": [
+                {
+                    "level": level,
+                    "nodes": [
+                        {"key": tree["labels"][i], "values": reconciled[:, i].tolist()}
+                        for i in range(level_start, level_stop)
+                    ]
+                }
+                for level, (level_start, level_stop) in tree["level_slices"].items()
+            ]
+        }
         
-        # Store forecast results
         forecast_result = {
             "analysis_id": analysis_id,
             "forecast_days": days,
@@ -45,92 +216,317 @@ async def generate_forecast(
             "user_id": user["id"]
         }
         
-        result = supabase.table("forecast_results").insert(forecast_result).execute()
+        forecast_id = result_writer.submit("forecast_results", forecast_result)
         
         return {
             "success": True,
-            "forecast_id": result.data[0]["id"] if result.data else None,
+            "forecast_id": forecast_id,
             "forecast": forecast_data,
             "period": f"{days} days"
         }
         
+    except HTTPException:
+        raise
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Forecast generation failed: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Hierarchical forecast generation failed: {str(e)}")
 
-async def generate_prophet_forecast(days: int) -> Dict[str, Any]:
+@router.post("/scenarios")
+async def simulate_scenarios(
+    request: ScenarioRequest,
+    user: Dict[str, Any] = Depends(rate_limited("cpu"))
+):
     """
-    Generate forecast using Prophet (simplified version for demo)
+    What-if simulation: evaluate a batch of regressor adjustments against one
+    fitted model and return a scenario x horizon matrix
     """
     try:
-        # Create synthetic historical data for demo
-        dates = pd.date_range(start='2023-01-01', end='2024-01-01', freq='D')
-        sales = np.random.normal(1000, 200, len(dates)) + np.sin(np.arange(len(dates)) * 2 * np.pi / 365) * 100
+        empty = [name for name, values in request.grid.items() if not values]
+        if empty:
+            raise HTTPException(status_code=400, detail=f"Grid entries without values: {empty}")
+        # Counted before expanding: the product of a few long value lists is huge
+        count = scenario_count(request)
+        if count == 0:
+            raise HTTPException(status_code=400, detail="At least one scenario or grid entry is required")
+        if count > MAX_SCENARIOS:
+            raise HTTPException(status_code=400, detail=f"Too many scenarios (max {MAX_SCENARIOS})")
         
-        # Prepare data for Prophet
-        df = pd.DataFrame({
-            'ds': dates,
-            'y': sales
-        })
+        analysis = await find_analysis(request.analysis_id, user["id"])
+        if analysis is None:
+            raise HTTPException(status_code=404, detail="Analysis not found")
         
-        # Initialize and fit Prophet model
-        model = Prophet(
-            yearly_seasonality=True,
-            weekly_seasonality=True,
-            daily_seasonality=False,
-            seasonality_mode='multiplicative'
-        )
+        dataset = load_dataset(request.analysis_id)
+        if dataset is None:
+            raise HTTPException(status_code=404, detail="No stored dataset for this analysis")
+        df, data_fingerprint = dataset
         
-        model.fit(df)
+        missing = [c for c in [request.date_column, request.target_column] + request.regressors if c not in df.columns]
+        if missing:
+            raise HTTPException(status_code=400, detail=f"Columns not found in dataset: {missing}")
         
-        # Create future dataframe
-        future = model.make_future_dataframe(periods=days)
-        forecast = model.predict(future)
+        scenarios = build_scenarios(request)
+        unknown = {name for scenario in scenarios for name in scenario} - set(request.regressors)
+        if unknown:
+            raise HTTPException(status_code=400, detail=f"Scenarios adjust unknown regressors: {sorted(unknown)}")
         
-        # Extract forecast data
-        forecast_data = {
-            "historical": {
-                "dates": df['ds'].dt.strftime('%Y-%m-%d').tolist(),
-                "values": df['y'].tolist()
-            },
-            "forecast": {
-                "dates": forecast.tail(days)['ds'].dt.strftime('%Y-%m-%d').tolist(),
-                "values": forecast.tail(days)['yhat'].tolist(),
-                "lower_bound": forecast.tail(days)['yhat_lower'].tolist(),
-                "upper_bound": forecast.tail(days)['yhat_upper'].tolist()
-            },
-            "trend": {
-                "direction": "increasing" if forecast['trend'].iloc[-1] > forecast['trend'].iloc[-2] else "decreasing",
-                "confidence": 0.85
-            },
-            "seasonality": {
-                "weekly_pattern": extract_weekly_pattern(forecast),
-                "yearly_pattern": extract_yearly_pattern(forecast)
-            }
+        cache_key = (
+            "regressors", request.analysis_id, data_fingerprint,
+            request.date_column, request.target_column, tuple(request.regressors)
+        )
+        entry = model_cache.get(cache_key)
+        if entry is None:
+            entry = await run_job(
+                "forecast", user, fit_regressor_model, df, request.date_column, request.target_column, request.regressors,
+                dedup_key=cache_key
+            )
+            model_cache.set(cache_key, entry)
+        
+        evaluated = await run_job("forecast", user, evaluate_scenarios, entry, scenarios, request.days)
+        return {
+            "success": True,
+            "regressors": request.regressors,
+            "scenarios": scenarios,
+            **evaluated
         }
         
-        return forecast_data
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Scenario simulation failed: {str(e)}")
+
+def scenario_count(request: ScenarioRequest) -> int:
+    """Number of scenarios build_scenarios would return, without building them"""
+    count = len(request.scenarios)
+    if request.grid:
+        count += math.prod(len(values) for values in request.grid.values())
+    return count
+
+def build_scenarios(request: ScenarioRequest) -> List[Dict[str, float]]:
+    """Explicit scenarios followed by the cartesian product of the grid"""
+    scenarios = [dict(s) for s in request.scenarios]
+    if request.grid:
+        names = list(request.grid)
+        for values in itertools.product(*(request.grid[name] for name in names)):
+            scenarios.append(dict(zip(names, values)))
+    return scenarios
+
+def fit_regressor_model(df: pd.DataFrame, date_column: str, target_column: str, regressors: List[str]) -> Dict[str, Any]:
+    """
+    Fit Prophet with extra regressors on the daily aggregated dataset
+    """
+    daily = df[[date_column, target_column] + regressors].copy()
+    daily[date_column] = pd.to_datetime(daily[date_column])
+    aggregations = {target_column: 'sum', **{name: 'mean' for name in regressors}}
+    daily = daily.groupby(date_column).agg(aggregations).reset_index()
+    daily = daily.rename(columns={date_column: 'ds', target_column: 'y'})
+    
+    model = Prophet(
+        weekly_seasonality=True,
+        daily_seasonality=False
+    )
+    for name in regressors:
+        model.add_regressor(name)
+    model.fit(daily)
+    
+    return {
+        "model": model,
+        "history": daily,
+        "baseline": daily[regressors].tail(SCENARIO_BASELINE_DAYS).mean().to_numpy(dtype=float)
+    }
+
+def evaluate_scenarios(entry: Dict[str, Any], scenarios: List[Dict[str, float]], days: int) -> Dict[str, Any]:
+    """
+    Predict the baseline horizon once, then apply every scenario in a single
+    vectorized pass over a (scenario x horizon x regressor) adjustment tensor.
+
+    Prophet is linear in its regressors: yhat = trend * (1 + multiplicative)
+    + additive, where each regressor contributes beta * (x - mu) / std, scaled
+    by y_scale when additive. Scenario shifts can therefore be added to the
+    baseline components without re-running predict per scenario.
+    """
+    model = entry["model"]
+    regressors = list(model.extra_regressors)
+    history = entry["history"]
+    
+    dates = pd.date_range(start=history['ds'].iloc[-1] + pd.Timedelta(days=1), periods=days, freq='D')
+    baseline_x = np.tile(entry["baseline"], (days, 1))
+    future = pd.DataFrame(baseline_x, columns=regressors)
+    future.insert(0, 'ds', dates)
+    base = model.predict(future)
+    
+    # Per-unit effect of each regressor on the multiplicative or additive terms
+    beta = np.nanmean(np.atleast_2d(model.params["beta"]), axis=0)
+    coef = np.empty(len(regressors))
+    multiplicative = np.zeros(len(regressors), dtype=bool)
+    for i, name in enumerate(regressors):
+        spec = model.extra_regressors[name]
+        index = np.flatnonzero(model.train_component_cols[name].to_numpy())[0]
+        coef[i] = beta[index] / spec['std']
+        multiplicative[i] = spec['mode'] == 'multiplicative'
+        if not multiplicative[i]:
+            coef[i] *= model.y_scale
+    
+    # Relative changes (scenario x regressor) applied to the baseline regressor path
+    changes = np.array([[scenario.get(name, 0.0) for name in regressors] for scenario in scenarios])
+    deltas = changes[:, None, :] * baseline_x[None, :, :]
+    mult_shift = np.einsum('shr,r->sh', deltas[:, :, multiplicative], coef[multiplicative])
+    add_shift = np.einsum('shr,r->sh', deltas[:, :, ~multiplicative], coef[~multiplicative])
+    
+    trend = base['trend'].to_numpy()
+    yhat = trend * (1.0 + base['multiplicative_terms'].to_numpy() + mult_shift) + base['additive_terms'].to_numpy() + add_shift
+    
+    return {
+        "dates": dates.strftime('%Y-%m-%d').tolist(),
+        "baseline": base['yhat'].round(2).tolist(),
+        "matrix": np.round(yhat, 2).tolist(),
+        "totals": np.round(yhat.sum(axis=1), 2).tolist()
+    }
+
+def fit_node_forecasts(dates: Any, history: np.ndarray, days: int):
+    """
+    Fit one Prophet model per column of history (T x k).
+    Returns (forecast days x k, in-sample fitted T x k).
+    """
+    n_obs, n_nodes = history.shape
+    forecast = np.empty((days, n_nodes))
+    fitted = np.empty((n_obs, n_nodes))
+    for j in range(n_nodes):
+        model = Prophet(
+            weekly_seasonality=True,
+            daily_seasonality=False,
+            uncertainty_samples=0
+        )
+        model.fit(pd.DataFrame({'ds': dates, 'y': history[:, j]}))
+        yhat = model.predict(model.make_future_dataframe(periods=days))['yhat'].to_numpy()
+        fitted[:, j] = yhat[:n_obs]
+        forecast[:, j] = yhat[n_obs:]
+    return forecast, fitted
+
+async def generate_prophet_forecast(
+    days: int,
+    analysis_id: Optional[str] = None,
+    resolution: str = "daily",
+    user: Optional[Dict[str, Any]] = None,
+    background: bool = False
+) -> Dict[str, Any]:
+    """
+    Generate forecast using Prophet (simplified version for demo)
+    """
+    try:
+        # Identical concurrent requests share one run on the forecast pool
+        return await run_job(
+            "forecast", user, build_prophet_forecast, days, analysis_id, resolution,
+            dedup_key=("forecast", analysis_id, days, resolution), background=background
+        )
         
     except Exception as e:
         # Fallback to simple linear forecast
-        return generate_simple_forecast(days)
+        return generate_simple_forecast(days, resolution)
 
-def extract_weekly_pattern(forecast: pd.DataFrame) -> List[float]:
-    """Extract weekly seasonality pattern"""
-    try:
-        weekly = forecast.groupby(forecast['ds'].dt.dayofweek)['weekly'].mean()
-        return weekly.tolist()
-    except:
-        return [0.1, 0.2, 0.3, 0.4, 0.5, 0.2, 0.1]  # Default pattern
+async def prefetch_forecast(analysis_id: str, user: Dict[str, Any]) -> None:
+    """
+    The default forecast of a new analysis, run in the background to fit its
+    model; a request for it meanwhile joins the job
+    """
+    await generate_prophet_forecast(30, analysis_id, "daily", user, background=True)
+    if analysis_id not in model_cache:
+        raise RuntimeError("the model could not be fitted")
 
-def extract_yearly_pattern(forecast: pd.DataFrame) -> List[float]:
-    """Extract yearly seasonality pattern"""
-    try:
-        yearly = forecast.groupby(forecast['ds'].dt.dayofyear)['yearly'].mean()
-        return yearly.tolist()
-    except:
-        return [0.1] * 365  # Default pattern
+prefetcher.register("forecast", prefetch_forecast)
+
+def build_prophet_forecast(days: int, analysis_id: Optional[str] = None, resolution: str = "daily") -> Dict[str, Any]:
+    """
+    Fit (or reuse) the Prophet model and build the forecast payload
+    """
+    entry = model_cache.get(analysis_id) if analysis_id else None
+    if entry is None:
+        entry = fit_prophet_model()
+        if analysis_id:
+            model_cache.set(analysis_id, entry)
+    
+    model = entry["model"]
+    df = entry["history"]
+    
+    # Create future dataframe
+    future = model.make_future_dataframe(periods=days)
+    forecast = model.predict(future)
+    
+    # Day-of-year pattern for the calendar year the forecast starts in
+    forecast_year = forecast.tail(days)['ds'].iloc[0].year
+    
+    # Extract forecast data
+    forecast_data = {
+        "historical": {
+            "dates": df['ds'].dt.strftime('%Y-%m-%d').tolist(),
+            "values": df['y'].tolist()
+        },
+        "forecast": {
+            "dates": forecast.tail(days)['ds'].dt.strftime('%Y-%m-%d').tolist(),
+            "values": forecast.tail(days)['yhat'].tolist(),
+            "lower_bound": forecast.tail(days)['yhat_lower'].tolist(),
+            "upper_bound": forecast.tail(days)['yhat_upper'].tolist()
+        },
+        "trend": {
+            "direction": "increasing" if forecast['trend'].iloc[-1] > forecast['trend'].iloc[-2] else "decreasing",
+            "confidence": 0.85
+        },
+        "seasonality": {
+            "weekly_pattern": extract_weekly_pattern(entry["seasonality"]),
+            "yearly_pattern": extract_yearly_pattern(entry["seasonality"], resolution, forecast_year),
+            "resolution": resolution
+        }
+    }
+    
+    return forecast_data
+
+def fit_prophet_model() -> Dict[str, Any]:
+    """
+    Fit Prophet on the sales history and precompute its seasonal profile
+    """
+    # Create synthetic historical data for demo
+    dates = pd.date_range(start='2023-01-01', end='2024-01-01', freq='D')
+    sales = np.random.normal(1000, 200, len(dates)) + np.sin(np.arange(len(dates)) * 2 * np.pi / 365) * 100
+    
+    # Prepare data for Prophet
+    df = pd.DataFrame({
+        'ds': dates,
+        'y': sales
+    })
+    
+    # Initialize and fit Prophet model
+    model = Prophet(
+        yearly_seasonality=True,
+        weekly_seasonality=True,
+        daily_seasonality=False,
+        seasonality_mode='multiplicative'
+    )
+    
+    model.fit(df)
+    
+    return {
+        "model": model,
+        "history": df,
+        "seasonality": compute_seasonal_profile(model)
+    }
+
+def extract_weekly_pattern(profile: Dict[str, np.ndarray]) -> List[float]:
+    """Weekly seasonality by day of week (Monday first)"""
+    if "weekly" not in profile:
+        return list(DEFAULT_WEEKLY_PATTERN)  # Default pattern
+    return profile["weekly"].tolist()
+
+def extract_yearly_pattern(profile: Dict[str, np.ndarray], resolution: str = "daily", year: Optional[int] = None) -> List[float]:
+    """
+    Yearly seasonality by day of year (366 days in leap years), bucketed to
+    the requested resolution
+    """
+    leap = year is not None and calendar.isleap(year)
+    key = "yearly_366" if leap else "yearly_365"
+    if key not in profile:
+        # Default pattern: flat, so every bucket holds the same value
+        return [0.1] * {"daily": 366 if leap else 365, "weekly": 52, "monthly": 12}[resolution]
+    return bucket_yearly(profile[key], resolution)
 
-def generate_simple_forecast(days: int) -> Dict[str, Any]:
+def generate_simple_forecast(days: int, resolution: str = "daily") -> Dict[str, Any]:
     """Generate simple linear forecast as fallback"""
     import datetime
     
@@ -155,8 +551,9 @@ def generate_simple_forecast(days: int) -> Dict[str, Any]:
             "confidence": 0.7
         },
         "seasonality": {
-            "weekly_pattern": [0.1, 0.2, 0.3, 0.4, 0.5, 0.2, 0.1],
-            "yearly_pattern": [0.1] * 365
+            "weekly_pattern": list(DEFAULT_WEEKLY_PATTERN),
+            "yearly_pattern": extract_yearly_pattern({}, resolution, start_date.year),
+            "resolution": resolution
         }
     }
 
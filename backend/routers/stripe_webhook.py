@@ -1,9 +1,16 @@
-from fastapi import APIRouter, HTTPException, Request, Depends
+from fastapi import APIRouter, HTTPException, Request, Response, Depends
+from fastapi.responses import JSONResponse
 from fastapi.security import HTTPBearer
+import asyncio
 import stripe
 import os
-from typing import Dict, Any
-from services.supabase_client import get_supabase_client
+import time
+from typing import Dict, List, Any, Optional
+from services.repository import get_repository
+from services.auth import invalidate_customer
+from services.datasets import fingerprint
+from services.webhook_queue import enqueue_event
+from services.price_catalog import get_catalog, invalidate_catalog, plan_for_price
 
 router = APIRouter()
 
@@ -11,10 +18,23 @@ router = APIRouter()
 stripe.api_key = os.getenv("STRIPE_SECRET_KEY")
 webhook_secret = os.getenv("STRIPE_WEBHOOK_SECRET")
 
+# Events applied to users; anything else is acknowledged and dropped
+HANDLED_EVENTS = (
+    "customer.subscription.created",
+    "customer.subscription.updated",
+    "customer.subscription.deleted",
+    "invoice.payment_succeeded",
+    "invoice.payment_failed",
+)
+# Events that change the cached price catalogue
+CATALOG_EVENT_PREFIXES = ("price.", "product.")
+
 @router.post("/webhook")
 async def stripe_webhook(request: Request):
     """
-    Handle Stripe webhook events for subscription updates
+    Handle Stripe webhook events for subscription updates.
+    Verified events are queued durably and acknowledged at once; the
+    consumer started in the app lifespan applies them.
     """
     try:
         payload = await request.body()
@@ -33,110 +53,81 @@ async def stripe_webhook(request: Request):
         except stripe.error.SignatureVerificationError as e:
             raise HTTPException(status_code=400, detail=f"Invalid signature: {e}")
         
-        # Handle different event types
-        if event['type'] == 'customer.subscription.created':
-            await handle_subscription_created(event['data']['object'])
-        elif event['type'] == 'customer.subscription.updated':
-            await handle_subscription_updated(event['data']['object'])
-        elif event['type'] == 'customer.subscription.deleted':
-            await handle_subscription_deleted(event['data']['object'])
-        elif event['type'] == 'invoice.payment_succeeded':
-            await handle_payment_succeeded(event['data']['object'])
-        elif event['type'] == 'invoice.payment_failed':
-            await handle_payment_failed(event['data']['object'])
+        if event['type'].startswith(CATALOG_EVENT_PREFIXES):
+            invalidate_catalog()
+        elif event['type'] in HANDLED_EVENTS:
+            data_object = event['data']['object']
+            # SQLite insert with fsync: kept off the event loop
+            await asyncio.to_thread(
+                enqueue_event,
+                event.get('id') or fingerprint(payload),
+                event['type'],
+                data_object.get('customer'),
+                event.get('created') or int(time.time()),
+                {"type": event['type'], "object": data_object}
+            )
         
         return {"status": "success"}
         
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Webhook processing failed: {str(e)}")
 
-async def handle_subscription_created(subscription: Dict[str, Any]):
-    """Handle new subscription creation"""
-    try:
-        customer_id = subscription['customer']
-        plan_id = subscription['items']['data'][0]['price']['id']
-        
-        # Map Stripe price IDs to our plan names via environment variables
-        # Configure these in your .env (see .env.example)
-        plan_mapping: Dict[str, str] = {}
-        price_pro_monthly = os.getenv("STRIPE_PRICE_PRO_MONTHLY")
-        price_business_monthly = os.getenv("STRIPE_PRICE_BUSINESS_MONTHLY")
-        if price_pro_monthly:
-            plan_mapping[price_pro_monthly] = "pro"
-        if price_business_monthly:
-            plan_mapping[price_business_monthly] = "business"
-        
-        plan_name = plan_mapping.get(plan_id, "free")
-        
-        # Update user plan in Supabase
-        supabase = get_supabase_client()
-        supabase.table("users").update({
-            "plan": plan_name,
-            "stripe_customer_id": customer_id,
-            "subscription_id": subscription['id']
-        }).eq("stripe_customer_id", customer_id).execute()
-        
-    except Exception as e:
-        print(f"Error handling subscription created: {e}")
+def subscription_created_update(subscription: Dict[str, Any]) -> Dict[str, Any]:
+    """User fields for a new subscription"""
+    plan_id = subscription['items']['data'][0]['price']['id']
+    
+    return {
+        "plan": plan_for_price(plan_id),
+        "stripe_customer_id": subscription['customer'],
+        "subscription_id": subscription['id']
+    }
 
-async def handle_subscription_updated(subscription: Dict[str, Any]):
-    """Handle subscription updates"""
-    try:
-        customer_id = subscription['customer']
-        status = subscription['status']
-        
-        # Update subscription status
-        supabase = get_supabase_client()
-        supabase.table("users").update({
-            "subscription_status": status
-        }).eq("stripe_customer_id", customer_id).execute()
-        
-    except Exception as e:
-        print(f"Error handling subscription updated: {e}")
+def subscription_updated_update(subscription: Dict[str, Any]) -> Dict[str, Any]:
+    """User fields for a subscription status change"""
+    return {"subscription_status": subscription['status']}
 
-async def handle_subscription_deleted(subscription: Dict[str, Any]):
-    """Handle subscription cancellation"""
-    try:
-        customer_id = subscription['customer']
-        
-        # Downgrade user to free plan
-        supabase = get_supabase_client()
-        supabase.table("users").update({
-            "plan": "free",
-            "subscription_status": "cancelled"
-        }).eq("stripe_customer_id", customer_id).execute()
-        
-    except Exception as e:
-        print(f"Error handling subscription deleted: {e}")
+def subscription_deleted_update(subscription: Dict[str, Any]) -> Dict[str, Any]:
+    """Downgrade to the free plan on cancellation"""
+    return {"plan": "free", "subscription_status": "cancelled"}
 
-async def handle_payment_succeeded(invoice: Dict[str, Any]):
-    """Handle successful payment"""
-    try:
-        customer_id = invoice['customer']
-        
-        # Update payment status
-        supabase = get_supabase_client()
-        supabase.table("users").update({
-            "last_payment_date": invoice['created'],
-            "payment_status": "succeeded"
-        }).eq("stripe_customer_id", customer_id).execute()
-        
-    except Exception as e:
-        print(f"Error handling payment succeeded: {e}")
+def payment_succeeded_update(invoice: Dict[str, Any]) -> Dict[str, Any]:
+    """User fields for a successful payment"""
+    return {"last_payment_date": invoice['created'], "payment_status": "succeeded"}
 
-async def handle_payment_failed(invoice: Dict[str, Any]):
-    """Handle failed payment"""
-    try:
-        customer_id = invoice['customer']
-        
-        # Update payment status
-        supabase = get_supabase_client()
-        supabase.table("users").update({
-            "payment_status": "failed"
-        }).eq("stripe_customer_id", customer_id).execute()
-        
-    except Exception as e:
-        print(f"Error handling payment failed: {e}")
+def payment_failed_update(invoice: Dict[str, Any]) -> Dict[str, Any]:
+    """User fields for a failed payment"""
+    return {"payment_status": "failed"}
+
+EVENT_UPDATES = {
+    "customer.subscription.created": subscription_created_update,
+    "customer.subscription.updated": subscription_updated_update,
+    "customer.subscription.deleted": subscription_deleted_update,
+    "invoice.payment_succeeded": payment_succeeded_update,
+    "invoice.payment_failed": payment_failed_update,
+}
+
+# Fields that change the cached user (see services.auth)
+_CACHED_USER_FIELDS = {"plan", "subscription_status"}
+
+async def apply_customer_events(customer_id: Optional[str], events: List[Dict[str, Any]]) -> None:
+    """
+    Fold one customer's events, in order, into a single users update and
+    write it. Raising leaves the events queued for retry.
+    """
+    if not customer_id:
+        return
+    update: Dict[str, Any] = {}
+    for event in events:
+        update.update(EVENT_UPDATES[event["type"]](event["object"]))
+    if not update:
+        return
+    
+    await get_repository().update_users_by_customer(customer_id, update)
+    
+    if _CACHED_USER_FIELDS & update.keys():
+        invalidate_customer(customer_id)
 
 @router.post("/create-checkout-session")
 async def create_checkout_session(
@@ -173,26 +164,18 @@ async def create_checkout_session(
         raise HTTPException(status_code=500, detail=f"Checkout session creation failed: {str(e)}")
 
 @router.get("/prices")
-async def get_prices():
+async def get_prices(request: Request):
     """
-    Get available subscription prices
+    Get available subscription prices (served from the in-memory catalogue;
+    supports If-None-Match)
     """
     try:
-        prices = stripe.Price.list(active=True, type='recurring')
+        catalog = await get_catalog()
+        headers = {"ETag": catalog["etag"], "Cache-Control": "no-cache"}
+        if request.headers.get("if-none-match") == catalog["etag"]:
+            return Response(status_code=304, headers=headers)
         
-        return {
-            "prices": [
-                {
-                    "id": price.id,
-                    "amount": price.unit_amount,
-                    "currency": price.currency,
-                    "interval": price.recurring.interval,
-                    "product": price.product
-                }
-                for price in prices.data
-            ]
-        }
+        return JSONResponse({"prices": catalog["prices"]}, headers=headers)
         
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to fetch prices: {str(e)}")
-
@@ -0,0 +1,58 @@
+import os
+from typing import Any, Dict, List, Optional
+from services.cache import TTLCache
+from services.repository import get_repository
+from services.write_behind import result_writer
+
+# Routes that take an analysis ID only need to know that it exists and whom it
+# belongs to, not its summary, insights or other JSONB columns. Lookups select
+# these columns only and cache them per analysis ID; the cached user_id also
+# answers ownership checks for other users without a query.
+ANALYSIS_META_COLUMNS = "id,user_id,filename,data_points,created_at"
+ANALYSIS_CACHE_SIZE = int(os.getenv("ANALYSIS_CACHE_SIZE", "10000"))
+ANALYSIS_CACHE_TTL_SECONDS = int(os.getenv("ANALYSIS_CACHE_TTL_SECONDS", "300"))
+analysis_cache = TTLCache(maxsize=ANALYSIS_CACHE_SIZE, ttl=ANALYSIS_CACHE_TTL_SECONDS)
+
+def _meta(row: Dict[str, Any]) -> Dict[str, Any]:
+    return {name: row.get(name) for name in ANALYSIS_META_COLUMNS.split(",")}
+
+def _owned(row: Optional[Dict[str, Any]], user_id: str) -> Optional[Dict[str, Any]]:
+    return row if row is not None and row.get("user_id") == user_id else None
+
+async def find_analysis(analysis_id: str, user_id: str) -> Optional[Dict[str, Any]]:
+    """Metadata of the user's analysis (including one not yet written), or None"""
+    pending = result_writer.pending("analysis_results", analysis_id)
+    if pending is not None:
+        return _owned(_meta(pending), user_id)
+    cached = analysis_cache.get(analysis_id)
+    if cached is not None:
+        return _owned(cached, user_id)
+    row = await get_repository().get_analysis(analysis_id, user_id, ANALYSIS_META_COLUMNS)
+    if row is not None:
+        analysis_cache.set(analysis_id, row)
+    return row
+
+async def find_analyses(analysis_ids: List[str], user_id: str) -> Dict[str, Dict[str, Any]]:
+    """Metadata of those of the analyses the user owns, by ID, in one query at most"""
+    found: Dict[str, Dict[str, Any]] = {}
+    missing = []
+    for analysis_id in dict.fromkeys(analysis_ids):
+        row = result_writer.pending("analysis_results", analysis_id)
+        row = _meta(row) if row is not None else analysis_cache.get(analysis_id)
+        if row is None:
+            missing.append(analysis_id)
+        elif row.get("user_id") == user_id:
+            found[analysis_id] = row
+    if missing:
+        for row in await get_repository().get_analyses(missing, user_id, ANALYSIS_META_COLUMNS):
+            analysis_cache.set(row["id"], row)
+            found[row["id"]] = row
+    return found
+
+def invalidate_analysis(analysis_id: str) -> None:
+    """Drop a cached analysis, e.g. after its stored data changed"""
+    analysis_cache.invalidate(analysis_id)
+
+def analysis_cache_stats() -> Dict[str, Any]:
+    """Hit-rate and size metrics of the analysis cache"""
+    return analysis_cache.stats()
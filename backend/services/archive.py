@@ -0,0 +1,82 @@
+import json
+import os
+import re
+import threading
+import zlib
+from datetime import date
+from typing import Any, Dict, List, Tuple
+
+# Archived result blobs, one append-only segment file per table and month
+# (<table>/<YYYY-MM>.seg). Each blob is compressed on its own, so reading one
+# back needs only its byte range, recorded in the row's archive_key as
+# "<table>/<YYYY-MM>:<offset>:<length>". Segments are removed a month at a
+# time, once every row of the month has expired.
+RETENTION_ARCHIVE_DIR = os.getenv("RETENTION_ARCHIVE_DIR", "data/archive")
+RETENTION_ARCHIVE_COMPRESSION = int(os.getenv("RETENTION_ARCHIVE_COMPRESSION", "6"))
+
+_KEY = re.compile(r"^([a-z_]+)/(\d{4}-\d{2}):(\d+):(\d+)$")
+_lock = threading.Lock()
+
+def _segment_path(table: str, month: str) -> str:
+    return os.path.join(RETENTION_ARCHIVE_DIR, table, f"{month}.seg")
+
+def month_of(created_at: str) -> str:
+    """Segment month ("YYYY-MM") of an ISO timestamp"""
+    return created_at[:7]
+
+def store(table: str, month: str, payloads: List[Tuple[str, Dict[str, Any]]]) -> Dict[str, Tuple[str, int]]:
+    """
+    Append compressed payloads (row ID, JSON-able dict) to a month's segment
+    and fsync it; returns (archive key, compressed size) by row ID
+    """
+    path = _segment_path(table, month)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    stored = {}
+    with _lock, open(path, "ab") as f:
+        offset = f.seek(0, os.SEEK_END)
+        for row_id, payload in payloads:
+            blob = zlib.compress(json.dumps(payload, separators=(",", ":"), default=str).encode(), RETENTION_ARCHIVE_COMPRESSION)
+            f.write(blob)
+            stored[row_id] = (f"{table}/{month}:{offset}:{len(blob)}", len(blob))
+            offset += len(blob)
+        f.flush()
+        os.fsync(f.fileno())
+    return stored
+
+def load(archive_key: str) -> Dict[str, Any]:
+    """The payload stored under an archive key; KeyError if it is not archived"""
+    match = _KEY.match(archive_key)
+    if not match:
+        raise KeyError(archive_key)
+    table, month, offset, length = match.group(1), match.group(2), int(match.group(3)), int(match.group(4))
+    try:
+        with open(_segment_path(table, month), "rb") as f:
+            f.seek(offset)
+            blob = f.read(length)
+    except FileNotFoundError:
+        raise KeyError(archive_key)
+    if len(blob) != length:
+        raise KeyError(archive_key)
+    return json.loads(zlib.decompress(blob))
+
+def drop_before(table: str, month: date) -> Dict[str, int]:
+    """Remove a table's segments for months before month; returns their sizes by month"""
+    directory = os.path.join(RETENTION_ARCHIVE_DIR, table)
+    if not os.path.isdir(directory):
+        return {}
+    dropped = {}
+    cutoff = month.strftime("%Y-%m")
+    for name in sorted(os.listdir(directory)):
+        segment_month = name[:-len(".seg")]
+        if name.endswith(".seg") and segment_month < cutoff:
+            path = os.path.join(directory, name)
+            dropped[segment_month] = os.path.getsize(path)
+            os.remove(path)
+    return dropped
+
+def archive_size(table: str) -> int:
+    """Bytes of a table's archive segments"""
+    directory = os.path.join(RETENTION_ARCHIVE_DIR, table)
+    if not os.path.isdir(directory):
+        return 0
+    return sum(os.path.getsize(os.path.join(directory, name)) for name in os.listdir(directory) if name.endswith(".seg"))
@@ -1,9 +1,14 @@
-from jose import JWTError, jwt
+from fastapi import Depends, HTTPException, Request, status
+from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
+from jose import JWTError, jwk, jwt
 from passlib.context import CryptContext
 from datetime import datetime, timedelta
 from typing import Optional, Dict, Any
 import os
-from services.supabase_client import get_supabase_client
+import uuid
+from services.repository import get_repository
+from services.cache import TTLCache
+from services.revocation import is_revoked, revoke_token
 
 # Password hashing
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
@@ -14,6 +19,21 @@ SECRET_KEY = os.getenv("JWT_SECRET_KEY")
 ALGORITHM = os.getenv("JWT_ALGORITHM", "HS256")
 ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv("JWT_ACCESS_TOKEN_EXPIRE_MINUTES", "30"))
 
+# Key object built once instead of being re-parsed from the secret on every decode
+JWT_KEY = jwk.construct(SECRET_KEY, ALGORITHM) if SECRET_KEY else None
+
+# Bearer scheme shared by all routers; missing credentials are reported as 401 by require_user
+bearer_scheme = HTTPBearer(auto_error=False)
+
+# Resolved users by ID, so authenticated requests skip the users lookup.
+# Entries are dropped explicitly when Stripe changes a user's plan or status;
+# the TTL bounds staleness for any other change.
+AUTH_USER_CACHE_SIZE = int(os.getenv("AUTH_USER_CACHE_SIZE", "10000"))
+AUTH_USER_CACHE_TTL_SECONDS = int(os.getenv("AUTH_USER_CACHE_TTL_SECONDS", "60"))
+user_cache = TTLCache(maxsize=AUTH_USER_CACHE_SIZE, ttl=AUTH_USER_CACHE_TTL_SECONDS)
+# Stripe customer ID -> user ID for cached users (webhooks only know the customer)
+_customer_index = TTLCache(maxsize=AUTH_USER_CACHE_SIZE, ttl=AUTH_USER_CACHE_TTL_SECONDS)
+
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     """Verify a password against its hash"""
     return pwd_context.verify(plain_password, hashed_password)
@@ -34,42 +54,102 @@ def create_access_token(data: Dict[str, Any], expires_delta: Optional[timedelta]
     else:
         expire = datetime.utcnow() + timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
     
-    to_encode.update({"exp": expire})
-    encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
+    # jti identifies the token so it can be revoked on logout
+    to_encode.update({"exp": expire, "jti": uuid.uuid4().hex})
+    encoded_jwt = jwt.encode(to_encode, JWT_KEY, algorithm=ALGORITHM)
     
     return encoded_jwt
 
-async def verify_token(token: str) -> Optional[Dict[str, Any]]:
-    """Verify JWT token and return user data"""
+async def decode_token(token: str) -> Dict[str, Any]:
+    """Verify a JWT's signature, expiry and revocation and return its claims (raises JWTError)"""
+    if JWT_KEY is None:
+        raise JWTError("JWT_SECRET_KEY is not configured")
+    claims = jwt.decode(token, JWT_KEY, algorithms=[ALGORITHM])
+    if claims.get("jti") and await is_revoked(claims["jti"]):
+        raise JWTError("Token has been revoked")
+    return claims
+
+async def revoke_claims(claims: Dict[str, Any]) -> bool:
+    """Revoke the token with these claims; False for tokens issued without a jti"""
+    if not claims.get("jti"):
+        return False
+    await revoke_token(claims["jti"], float(claims["exp"]), claims.get("sub"))
+    return True
+
+async def resolve_user(user_id: str) -> Optional[Dict[str, Any]]:
+    """User record for an ID, from the cache or Supabase; None if it does not exist"""
+    cached = user_cache.get(user_id)
+    if cached is not None:
+        return cached
+    
+    # Get user from Supabase
+    user = await get_repository().get_user(user_id)
+    if user is None:
+        return None
+    
+    resolved = {
+        "id": user["id"],
+        "email": user["email"],
+        "plan": user.get("plan", "free"),
+        "created_at": user.get("created_at")
+    }
+    user_cache.set(user_id, resolved)
+    if user.get("stripe_customer_id"):
+        _customer_index.set(user["stripe_customer_id"], user_id)
+    return resolved
+
+async def require_user(
+    request: Request,
+    credentials: Optional[HTTPAuthorizationCredentials] = Depends(bearer_scheme)
+) -> Dict[str, Any]:
+    """
+    FastAPI dependency returning the authenticated user. The user is resolved
+    once per request and memoized on request.state for other dependencies.
+    Invalid or missing tokens are 401s; an unreachable user store is a 503.
+    """
+    user = getattr(request.state, "user", None)
+    if user is not None:
+        return user
+    
+    unauthorized = HTTPException(
+        status_code=status.HTTP_401_UNAUTHORIZED,
+        detail="Invalid authentication",
+        headers={"WWW-Authenticate": "Bearer"}
+    )
+    if credentials is None:
+        raise unauthorized
+    
     try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        user_id: str = payload.get("sub")
-        
-        if user_id is None:
-            return None
-        
-        # Get user from Supabase
-        supabase = get_supabase_client()
-        result = supabase.table("users").select("*").eq("id", user_id).execute()
-        
-        if not result.data:
-            return None
-        
-        user = result.data[0]
-        return {
-            "id": user["id"],
-            "email": user["email"],
-            "plan": user.get("plan", "free"),
-            "created_at": user.get("created_at")
-        }
-        
+        claims = await decode_token(credentials.credentials)
     except JWTError:
-        return None
+        raise unauthorized
+    user_id = claims.get("sub")
+    if user_id is None:
+        raise unauthorized
+    
+    try:
+        user = await resolve_user(user_id)
     except Exception as e:
-        print(f"Error verifying token: {e}")
-        return None
+        print(f"Error resolving user {user_id}: {e}")
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail="Authentication service unavailable")
+    if user is None:
+        raise unauthorized
+    
+    request.state.user = user
+    request.state.token_claims = claims
+    return user
+
+def invalidate_user(user_id: str) -> None:
+    """Drop a cached user so the next request reloads it"""
+    user_cache.invalidate(user_id)
 
-async def get_current_user(token: str) -> Optional[Dict[str, Any]]:
-    """Get current user from token"""
-    return await verify_token(token)
+def invalidate_customer(customer_id: str) -> None:
+    """Drop the cached user linked to a Stripe customer, if any"""
+    user_id = _customer_index.get(customer_id)
+    if user_id is not None:
+        _customer_index.invalidate(customer_id)
+        user_cache.invalidate(user_id)
 
+def user_cache_stats() -> Dict[str, Any]:
+    """Hit-rate and size metrics of the user cache"""
+    return user_cache.stats()
@@ -1,13 +1,12 @@
 import os
-from supabase import create_client
-from services.supabase_client import get_supabase_client
+from services.repository import get_repository
 
 async def init_db():
     """
     Initialize database tables and setup
     """
     try:
-        supabase = get_supabase_client()
+        get_repository()
         
         # Check if tables exist and create if needed
         # Note: In production, you would use Supabase migrations
@@ -55,38 +54,107 @@ def create_tables_sql():
         id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
         user_id UUID REFERENCES users(id) ON DELETE CASCADE,
         sales_data_id UUID REFERENCES sales_data(id) ON DELETE CASCADE,
+        filename VARCHAR(255),
         summary TEXT,
         key_factors JSONB,
         recommendations JSONB,
         data_points INTEGER,
+        text_insight JSONB,
+        visual_insight JSONB,
         created_at TIMESTAMP DEFAULT NOW()
     );
 
-    -- Forecast results table
+    -- Forecast results table, partitioned by month (see services.retention);
+    -- archived rows keep their metadata while the JSONB blobs move to the archive
     CREATE TABLE IF NOT EXISTS forecast_results (
-        id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
+        id UUID DEFAULT gen_random_uuid(),
         user_id UUID REFERENCES users(id) ON DELETE CASCADE,
         analysis_id UUID REFERENCES analysis_results(id) ON DELETE CASCADE,
         forecast_days INTEGER,
         forecast_data JSONB,
-        created_at TIMESTAMP DEFAULT NOW()
-    );
+        created_at TIMESTAMP NOT NULL DEFAULT NOW(),
+        archived_at TIMESTAMP,
+        archive_key VARCHAR(255),
+        PRIMARY KEY (id, created_at)
+    ) PARTITION BY RANGE (created_at);
 
-    -- Explanation results table
+    -- Explanation results table, partitioned like forecast_results
     CREATE TABLE IF NOT EXISTS explanation_results (
-        id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
+        id UUID DEFAULT gen_random_uuid(),
         user_id UUID REFERENCES users(id) ON DELETE CASCADE,
         analysis_id UUID REFERENCES analysis_results(id) ON DELETE CASCADE,
         feature_importance JSONB,
         shap_values JSONB,
-        created_at TIMESTAMP DEFAULT NOW()
+        created_at TIMESTAMP NOT NULL DEFAULT NOW(),
+        archived_at TIMESTAMP,
+        archive_key VARCHAR(255),
+        PRIMARY KEY (id, created_at)
+    ) PARTITION BY RANGE (created_at);
+
+    -- Rows outside the monthly partitions; ensure_monthly_partition moves them
+    -- out when their month's partition is created
+    CREATE TABLE IF NOT EXISTS forecast_results_default PARTITION OF forecast_results DEFAULT;
+    CREATE TABLE IF NOT EXISTS explanation_results_default PARTITION OF explanation_results DEFAULT;
+
+    -- Revoked access tokens (denylist), kept until the token expires
+    CREATE TABLE IF NOT EXISTS revoked_tokens (
+        jti VARCHAR(64) PRIMARY KEY,
+        user_id UUID REFERENCES users(id) ON DELETE CASCADE,
+        expires_at TIMESTAMPTZ NOT NULL,
+        revoked_at TIMESTAMPTZ DEFAULT NOW()
     );
 
     -- Create indexes for better performance
     CREATE INDEX IF NOT EXISTS idx_users_email ON users(email);
     CREATE INDEX IF NOT EXISTS idx_sales_data_user_id ON sales_data(user_id);
-    CREATE INDEX IF NOT EXISTS idx_analysis_results_user_id ON analysis_results(user_id);
-    CREATE INDEX IF NOT EXISTS idx_forecast_results_user_id ON forecast_results(user_id);
-    CREATE INDEX IF NOT EXISTS idx_explanation_results_user_id ON explanation_results(user_id);
+    -- History pages seek on (user_id, created_at, id) and read only the
+    -- included columns, so they are index-only scans
+    CREATE INDEX IF NOT EXISTS idx_analysis_results_history ON analysis_results(user_id, created_at, id) INCLUDE (filename, data_points);
+    CREATE INDEX IF NOT EXISTS idx_forecast_results_history ON forecast_results(user_id, created_at, id) INCLUDE (analysis_id, forecast_days);
+    CREATE INDEX IF NOT EXISTS idx_explanation_results_history ON explanation_results(user_id, created_at, id) INCLUDE (analysis_id);
+    CREATE INDEX IF NOT EXISTS idx_revoked_tokens_expires_at ON revoked_tokens(expires_at);
+    CREATE INDEX IF NOT EXISTS idx_revoked_tokens_revoked_at ON revoked_tokens(revoked_at);
+
+    -- Monthly partition of a results table (e.g. forecast_results_y2024m01),
+    -- created ahead of time by the retention job
+    CREATE OR REPLACE FUNCTION ensure_monthly_partition(parent TEXT, month_start DATE) RETURNS TEXT AS $$
+    DECLARE
+        range_start DATE := date_trunc('month', month_start);
+        range_end DATE := range_start + INTERVAL '1 month';
+        partition_name TEXT := format('%s_y%sm%s', parent, to_char(range_start, 'YYYY'), to_char(range_start, 'MM'));
+    BEGIN
+        IF to_regclass(partition_name) IS NOT NULL THEN
+            RETURN NULL;
+        END IF;
+        EXECUTE format('CREATE TABLE %I (LIKE %I INCLUDING DEFAULTS INCLUDING CONSTRAINTS)', partition_name, parent);
+        EXECUTE format(
+            'WITH moved AS (DELETE FROM %I WHERE created_at >= %L AND created_at < %L RETURNING *) INSERT INTO %I SELECT * FROM moved',
+            parent || '_default', range_start, range_end, partition_name
+        );
+        EXECUTE format('ALTER TABLE %I ATTACH PARTITION %I FOR VALUES FROM (%L) TO (%L)', parent, partition_name, range_start, range_end);
+        RETURN partition_name;
+    END;
+    $$ LANGUAGE plpgsql;
+
+    -- Archiving over REST: clears the blob columns of a batch of rows and
+    -- records each row's archive key ({"<id>": "<key>", ...}) in one call
+    CREATE OR REPLACE FUNCTION mark_archived(target TEXT, archive_keys JSONB, blob_columns TEXT[], archived TIMESTAMP) RETURNS VOID AS $$
+    BEGIN
+        EXECUTE format(
+            'UPDATE %I AS t SET %s archived_at = $2, archive_key = k.value FROM jsonb_each_text($1) AS k WHERE t.id = k.key::uuid',
+            target,
+            (SELECT string_agg(format('%I = NULL, ', c), '') FROM unnest(blob_columns) AS c)
+        ) USING archive_keys, archived;
+    END;
+    $$ LANGUAGE plpgsql;
+
+    DO $$
+    BEGIN
+        FOR i IN 0..2 LOOP
+            PERFORM ensure_monthly_partition('forecast_results', (date_trunc('month', NOW()) + i * INTERVAL '1 month')::DATE);
+            PERFORM ensure_monthly_partition('explanation_results', (date_trunc('month', NOW()) + i * INTERVAL '1 month')::DATE);
+        END LOOP;
+    END;
+    $$;
     """
 
@@ -0,0 +1,86 @@
+import hashlib
+import io
+import os
+from typing import Optional, Tuple
+import pandas as pd
+from services.cache import TTLCache
+
+# Raw uploads are kept on local disk so forecasting and explanation jobs can
+# work on the user's actual data rather than re-uploading it
+DATASET_STORAGE_DIR = os.getenv("DATASET_STORAGE_DIR", "data/datasets")
+DATASET_CACHE_SIZE = int(os.getenv("DATASET_CACHE_SIZE", "32"))
+DATASET_CACHE_TTL_SECONDS = int(os.getenv("DATASET_CACHE_TTL_SECONDS", "900"))
+
+_frame_cache = TTLCache(maxsize=DATASET_CACHE_SIZE, ttl=DATASET_CACHE_TTL_SECONDS)
+
+def _dataset_path(analysis_id: str) -> str:
+    # Analysis IDs are UUIDs; strip anything that could escape the directory
+    safe_id = "".join(c for c in analysis_id if c.isalnum() or c in "-_")
+    return os.path.join(DATASET_STORAGE_DIR, f"{safe_id}.csv")
+
+def fingerprint(contents: bytes) -> str:
+    """Content hash identifying a specific version of a dataset"""
+    return hashlib.sha256(contents).hexdigest()[:32]
+
+def save_dataset(analysis_id: str, contents: bytes) -> str:
+    """Persist the uploaded CSV for an analysis and return its fingerprint"""
+    os.makedirs(DATASET_STORAGE_DIR, exist_ok=True)
+    path = _dataset_path(analysis_id)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(contents)
+    os.replace(tmp_path, path)
+    _frame_cache.invalidate(analysis_id)
+    return fingerprint(contents)
+
+def load_dataset(analysis_id: str) -> Optional[Tuple[pd.DataFrame, str]]:
+    """
+    Load the stored dataset for an analysis as (DataFrame, fingerprint),
+    or None if nothing was stored
+    """
+    cached = _frame_cache.get(analysis_id)
+    if cached is not None:
+        return cached
+
+    path = _dataset_path(analysis_id)
+    if not os.path.exists(path):
+        return None
+
+    with open(path, "rb") as f:
+        contents = f.read()
+
+    loaded = (pd.read_csv(io.StringIO(contents.decode('utf-8'))), fingerprint(contents))
+    _frame_cache.set(analysis_id, loaded)
+    return loaded
+
+def dataset_fingerprint(analysis_id: str) -> Optional[str]:
+    """Fingerprint of the stored dataset, without parsing it; None if nothing was stored"""
+    cached = _frame_cache.get(analysis_id)
+    if cached is not None:
+        return cached[1]
+    path = _dataset_path(analysis_id)
+    if not os.path.exists(path):
+        return None
+    with open(path, "rb") as f:
+        return fingerprint(f.read())
+
+def append_rows(analysis_id: str, contents: bytes) -> Optional[str]:
+    """
+    Append the data rows of a CSV upload (same header) to the stored dataset
+    and return the new fingerprint, or None if nothing was stored
+    """
+    path = _dataset_path(analysis_id)
+    if not os.path.exists(path):
+        return None
+
+    with open(path, "rb") as f:
+        existing = f.read()
+
+    header, _, rows = contents.partition(b"\n")
+    stored_header = existing.partition(b"\n")[0]
+    if header.strip() != stored_header.strip():
+        raise ValueError("Appended rows must have the same columns as the stored dataset")
+
+    if existing and not existing.endswith(b"\n"):
+        existing += b"\n"
+    return save_dataset(analysis_id, existing + rows)
@@ -0,0 +1,184 @@
+import os
+import time
+from itertools import combinations
+import numpy as np
+from typing import Dict, List, Any, Optional, Tuple
+
+# Sizes of the server-side explanation summary; every model evaluation it
+# needs is stacked into a single predict call
+EXPLAIN_BOOTSTRAP_SAMPLES = int(os.getenv("EXPLAIN_BOOTSTRAP_SAMPLES", "200"))
+EXPLAIN_PDP_GRID_SIZE = int(os.getenv("EXPLAIN_PDP_GRID_SIZE", "20"))
+EXPLAIN_PDP_ROWS = int(os.getenv("EXPLAIN_PDP_ROWS", "100"))
+EXPLAIN_ICE_LINES = int(os.getenv("EXPLAIN_ICE_LINES", "20"))
+EXPLAIN_INTERACTION_FEATURES = int(os.getenv("EXPLAIN_INTERACTION_FEATURES", "4"))
+EXPLAIN_INTERACTION_GRID_SIZE = int(os.getenv("EXPLAIN_INTERACTION_GRID_SIZE", "8"))
+EXPLAIN_RANDOM_STATE = 42
+
+DAY_NAMES = ["Mon", "Tue", "Wed", "Thu", "Fri", "Sat", "Sun"]
+
+def bootstrap_importance(
+    shap_values: np.ndarray,
+    n_boot: int = EXPLAIN_BOOTSTRAP_SAMPLES,
+    confidence: float = 0.95,
+    rng: Optional[np.random.Generator] = None
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Mean |SHAP| per feature with percentile bootstrap intervals. All resamples
+    are drawn as one (n_boot x rows) index matrix and reduced together.
+    """
+    rng = rng or np.random.default_rng(EXPLAIN_RANDOM_STATE)
+    abs_shap = np.abs(shap_values)
+    n = len(abs_shap)
+    if n == 0:
+        zeros = np.zeros(shap_values.shape[1])
+        return zeros, zeros, zeros
+    # Row counts per resample (multinomial) instead of materializing every resampled matrix
+    counts = rng.multinomial(n, np.full(n, 1.0 / n), size=n_boot)
+    boot = counts @ abs_shap / n
+    alpha = (1.0 - confidence) / 2
+    low, high = np.quantile(boot, [alpha, 1.0 - alpha], axis=0)
+    return abs_shap.mean(axis=0), low, high
+
+def feature_grid(column: np.ndarray, size: int, categorical: bool) -> np.ndarray:
+    """Grid of values to evaluate a feature at: its distinct quantiles, or its codes"""
+    if categorical:
+        codes, counts = np.unique(column, return_counts=True)
+        # Most common codes first when there are more categories than grid points
+        return np.sort(codes[np.argsort(-counts, kind="stable")[:size]])
+    return np.unique(np.quantile(column, np.linspace(0.0, 1.0, size)))
+
+def grid_labels(feature: Dict[str, Any], grid: np.ndarray) -> List[Any]:
+    """Readable labels for a grid of encoded feature values"""
+    kind = feature["kind"]
+    if kind == "category":
+        return [str(feature["categories"][int(v)]) for v in grid]
+    if kind == "day_of_week":
+        return [DAY_NAMES[int(v) % 7] for v in grid]
+    if kind == "month":
+        return [int(v) for v in grid]
+    return np.round(grid, 6).tolist()
+
+def summarize_artifact(
+    artifact: Dict[str, Any],
+    top_features: int = 5,
+    grid_size: int = EXPLAIN_PDP_GRID_SIZE
+) -> Dict[str, Any]:
+    """
+    Explanation aggregates computed server-side from a cached artifact:
+    - importance: mean |SHAP| with bootstrap confidence intervals
+    - partial_dependence: PDP and ICE curves on quantile grids for the top features
+    - interactions: Friedman's H statistic for pairs of the top features
+
+    Every grid point of every curve and pair is evaluated in one stacked predict.
+    """
+    start = time.perf_counter()
+    rng = np.random.default_rng(EXPLAIN_RANDOM_STATE)
+    features = artifact["feature_names"]
+    specs = artifact["spec"]["features"]
+    categorical = artifact["categorical_mask"]
+    values = artifact["values"]
+    shap_values = artifact["shap_values"]
+
+    mean_abs, low, high = bootstrap_importance(shap_values, rng=rng)
+    order = np.argsort(-mean_abs, kind="stable")
+    top = order[:max(1, min(top_features, len(features)))]
+
+    # Rows whose predictions are averaged into the partial dependence
+    rows = values
+    if len(rows) > EXPLAIN_PDP_ROWS:
+        rows = rows[np.sort(rng.choice(len(rows), size=EXPLAIN_PDP_ROWS, replace=False))]
+    m = len(rows)
+
+    grids = {int(j): feature_grid(values[:, j], grid_size, bool(categorical[j])) for j in top}
+
+    # 2-D grids for the interaction pairs reuse points of the 1-D grids, so the
+    # single-feature dependence at those points comes from the 1-D curves
+    pairs = list(combinations(top[:EXPLAIN_INTERACTION_FEATURES].tolist(), 2))
+    sub_index = {
+        j: np.unique(np.linspace(0, len(grids[j]) - 1, min(EXPLAIN_INTERACTION_GRID_SIZE, len(grids[j]))).round().astype(int))
+        for j in set(k for pair in pairs for k in pair)
+    }
+
+    # Stack: for each feature, m rows x grid points; for each pair, m rows x g_j x g_k
+    blocks = []
+    for j in grids:
+        block = np.repeat(rows[None, :, :], len(grids[j]), axis=0)
+        block[:, :, j] = grids[j][:, None]
+        blocks.append(block.reshape(-1, rows.shape[1]))
+    for j, k in pairs:
+        gj, gk = grids[j][sub_index[j]], grids[k][sub_index[k]]
+        block = np.repeat(rows[None, None, :, :], len(gj), axis=0).repeat(len(gk), axis=1)
+        block[:, :, :, j] = gj[:, None, None]
+        block[:, :, :, k] = gk[None, :, None]
+        blocks.append(block.reshape(-1, rows.shape[1]))
+    predictions = artifact["model"].predict(np.vstack(blocks)) if m else np.zeros(0)
+
+    # Unstack in the same order
+    offset = 0
+    ice: Dict[int, np.ndarray] = {}
+    for j in grids:
+        size = len(grids[j]) * m
+        ice[j] = predictions[offset:offset + size].reshape(len(grids[j]), m).T
+        offset += size
+    interactions = []
+    for j, k in pairs:
+        gj, gk = len(sub_index[j]), len(sub_index[k])
+        size = gj * gk * m
+        pd_jk = predictions[offset:offset + size].reshape(gj, gk, m).mean(axis=2)
+        offset += size
+        pd_j = ice[j].mean(axis=0)[sub_index[j]]
+        pd_k = ice[k].mean(axis=0)[sub_index[k]]
+        interactions.append({
+            "features": [features[j], features[k]],
+            "h_statistic": round(h_statistic(pd_jk, pd_j, pd_k), 6)
+        })
+    interactions.sort(key=lambda x: x["h_statistic"], reverse=True)
+
+    ice_rows = np.arange(min(EXPLAIN_ICE_LINES, m))
+    partial_dependence = [
+        {
+            "feature": features[j],
+            "kind": specs[j]["kind"],
+            "grid": grid_labels(specs[j], grids[j]),
+            "pdp": np.round(ice[j].mean(axis=0), 6).tolist(),
+            "ice": np.round(ice[j][ice_rows], 6).tolist()
+        }
+        for j in grids
+    ]
+
+    importance = [
+        {
+            "feature": features[j],
+            "mean_abs_shap": round(float(mean_abs[j]), 6),
+            "ci_low": round(float(low[j]), 6),
+            "ci_high": round(float(high[j]), 6)
+        }
+        for j in order
+    ]
+
+    return {
+        "target_column": artifact["target_column"],
+        "n_samples": int(len(shap_values)),
+        "base_value": float(artifact["base_value"]),
+        "importance": importance,
+        "partial_dependence": partial_dependence,
+        "interactions": interactions,
+        "timings": {
+            "summary_ms": round((time.perf_counter() - start) * 1000, 1),
+            "rows_evaluated": int(len(predictions))
+        }
+    }
+
+def h_statistic(pd_jk: np.ndarray, pd_j: np.ndarray, pd_k: np.ndarray) -> float:
+    """
+    Friedman's H statistic on a grid: share of the variance of the centered
+    two-way partial dependence not explained by the two one-way dependences
+    """
+    pd_jk = pd_jk - pd_jk.mean()
+    pd_j = pd_j - pd_j.mean()
+    pd_k = pd_k - pd_k.mean()
+    total = float((pd_jk ** 2).sum())
+    if total <= 0:
+        return 0.0
+    residual = pd_jk - pd_j[:, None] - pd_k[None, :]
+    return float(np.sqrt(min((residual ** 2).sum() / total, 1.0)))
@@ -0,0 +1,378 @@
+import hashlib
+import os
+import shutil
+import tempfile
+import threading
+import time
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import joblib
+import numpy as np
+import pandas as pd
+import shap
+from sklearn.cluster import KMeans
+from sklearn.ensemble import HistGradientBoostingRegressor
+from typing import Callable, Dict, List, Any, Optional, Tuple
+
+# Bounds that keep explanation cost flat regardless of dataset size
+EXPLAIN_MAX_FIT_ROWS = int(os.getenv("EXPLAIN_MAX_FIT_ROWS", "20000"))
+EXPLAIN_MAX_ROWS = int(os.getenv("EXPLAIN_MAX_ROWS", "1000"))
+EXPLAIN_BACKGROUND_SIZE = int(os.getenv("EXPLAIN_BACKGROUND_SIZE", "100"))
+EXPLAIN_MAX_CATEGORIES = int(os.getenv("EXPLAIN_MAX_CATEGORIES", "50"))
+EXPLAIN_RANDOM_STATE = 42
+# Refit the surrogate once appended rows exceed this fraction of the rows it was fit on
+EXPLAIN_REFIT_FRACTION = float(os.getenv("EXPLAIN_REFIT_FRACTION", "0.5"))
+
+# Parallel SHAP: rows are split into chunks and explained in a process pool.
+# Features, model and output are exchanged through memory-mapped files in
+# EXPLAIN_SCRATCH_DIR (tmpfs by default) instead of being pickled per task.
+EXPLAIN_WORKERS = int(os.getenv("EXPLAIN_WORKERS", str(os.cpu_count() or 1)))
+EXPLAIN_CHUNK_ROWS = int(os.getenv("EXPLAIN_CHUNK_ROWS", "1000"))
+EXPLAIN_PARALLEL_MIN_ROWS = int(os.getenv("EXPLAIN_PARALLEL_MIN_ROWS", "4000"))
+EXPLAIN_SCRATCH_DIR = os.getenv("EXPLAIN_SCRATCH_DIR", "/dev/shm" if os.path.isdir("/dev/shm") else None)
+
+ProgressCallback = Callable[[int, int], None]
+
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_lock = threading.Lock()
+
+# Per-worker-process explainer, keyed by the scratch directory it was loaded from
+_worker_explainers: Dict[str, Any] = {}
+
+# Column names tried, in order, when no target column is given
+TARGET_CANDIDATES = ["sales", "revenue", "amount", "value", "total", "units", "quantity"]
+
+def detect_target_column(df: pd.DataFrame, requested: Optional[str] = None) -> str:
+    """Pick the column to explain: the requested one, a well-known name, or the last numeric column"""
+    if requested:
+        if requested not in df.columns:
+            raise ValueError(f"Target column '{requested}' not found")
+        return requested
+    lowered = {c.lower(): c for c in df.columns}
+    for candidate in TARGET_CANDIDATES:
+        if candidate in lowered and pd.api.types.is_numeric_dtype(df[lowered[candidate]]):
+            return lowered[candidate]
+    numeric = df.select_dtypes(include=['number']).columns.tolist()
+    if not numeric:
+        raise ValueError("Dataset has no numeric column to explain")
+    return numeric[-1]
+
+def fit_feature_spec(df: pd.DataFrame, target_column: str) -> Dict[str, Any]:
+    """
+    Decide how each column becomes a numeric feature: numeric columns as-is,
+    low-cardinality categoricals as integer codes over a fixed category list,
+    and date columns expanded to calendar parts. The spec is reused for rows
+    added later so their encoding matches the fitted model.
+    """
+    features: List[Dict[str, Any]] = []
+    for col in df.columns:
+        if col == target_column:
+            continue
+        series = df[col]
+        if pd.api.types.is_numeric_dtype(series):
+            features.append({"name": col, "source": col, "kind": "numeric"})
+            continue
+        if pd.api.types.is_datetime64_any_dtype(series) or col.lower() in ("date", "ds", "timestamp"):
+            dates = pd.to_datetime(series, errors='coerce')
+            if dates.notna().mean() > 0.9:
+                features.append({"name": f"{col}_day_of_week", "source": col, "kind": "day_of_week"})
+                features.append({"name": f"{col}_month", "source": col, "kind": "month"})
+                continue
+        if series.nunique(dropna=True) <= EXPLAIN_MAX_CATEGORIES:
+            categories = pd.Categorical(series.dropna()).categories.tolist()
+            features.append({"name": col, "source": col, "kind": "category", "categories": categories})
+    if not features:
+        raise ValueError("Dataset has no usable feature columns")
+
+    spec = {"target_column": target_column, "features": features}
+    # Missing values: median for numeric features, most common code for categoricals
+    raw = _encode_features(df, spec)
+    fill = raw.median()
+    categorical = [f["name"] for f in features if f["kind"] != "numeric"]
+    if categorical:
+        modes = raw[categorical].mode()
+        # All-NaN columns have no mode and take the constant fill below
+        fill[categorical] = modes.iloc[0] if len(modes) else np.nan
+    spec["fill_values"] = fill.fillna(0.0).tolist()
+    return spec
+
+def _encode_features(df: pd.DataFrame, spec: Dict[str, Any]) -> pd.DataFrame:
+    encoded: Dict[str, pd.Series] = {}
+    for feature in spec["features"]:
+        series = df[feature["source"]]
+        kind = feature["kind"]
+        if kind == "numeric":
+            encoded[feature["name"]] = pd.to_numeric(series, errors='coerce').astype(float)
+        elif kind in ("day_of_week", "month"):
+            dates = pd.to_datetime(series, errors='coerce')
+            encoded[feature["name"]] = (dates.dt.dayofweek if kind == "day_of_week" else dates.dt.month).astype(float)
+        else:
+            # Unknown categories (code -1) are treated as missing
+            codes = pd.Categorical(series, categories=feature["categories"]).codes
+            encoded[feature["name"]] = pd.Series(np.where(codes >= 0, codes, np.nan), index=series.index)
+    return pd.DataFrame(encoded, index=df.index)
+
+def transform_features(df: pd.DataFrame, spec: Dict[str, Any]) -> np.ndarray:
+    """Numeric feature matrix for df according to a fitted spec"""
+    return _encode_features(df, spec).fillna(
+        dict(zip([f["name"] for f in spec["features"]], spec["fill_values"]))
+    ).to_numpy(dtype=float)
+
+def rows_digest(df: pd.DataFrame, n_rows: int) -> str:
+    """Content hash of the first n_rows, used to recognise appended data"""
+    hashed = pd.util.hash_pandas_object(df.iloc[:n_rows], index=False).to_numpy()
+    return hashlib.sha256(hashed.tobytes()).hexdigest()
+
+def stratified_sample(y: np.ndarray, size: int, rng: np.random.Generator, bins: int = 10) -> np.ndarray:
+    """Row indices sampled proportionally from target-quantile strata"""
+    n = len(y)
+    if n <= size:
+        return np.arange(n)
+    edges = np.unique(np.quantile(y, np.linspace(0, 1, bins + 1)[1:-1]))
+    strata = np.searchsorted(edges, y, side='right')
+    picked = []
+    for stratum in np.unique(strata):
+        members = np.flatnonzero(strata == stratum)
+        take = max(1, int(round(size * len(members) / n)))
+        picked.append(rng.choice(members, size=min(take, len(members)), replace=False))
+    picked = np.concatenate(picked)
+    # Rounding can overshoot; drop the excess at random, not the latest rows
+    if len(picked) > size:
+        picked = rng.choice(picked, size=size, replace=False)
+    return np.sort(picked)
+
+def background_summary(X: np.ndarray, size: int, categorical_mask: np.ndarray) -> np.ndarray:
+    """
+    k-means summary of the feature matrix used as SHAP background data.
+    Categorical codes are snapped back to valid integer values.
+    """
+    if len(X) <= size:
+        return X
+    centers = KMeans(n_clusters=size, n_init=1, random_state=EXPLAIN_RANDOM_STATE).fit(X).cluster_centers_
+    centers[:, categorical_mask] = np.round(centers[:, categorical_mask])
+    return centers
+
+def get_pool() -> ProcessPoolExecutor:
+    """Process pool shared by all explanation jobs, started on first use"""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(
+                max_workers=EXPLAIN_WORKERS,
+                mp_context=multiprocessing.get_context("spawn")
+            )
+        return _pool
+
+def _load_worker_explainer(workdir: str) -> Any:
+    explainer = _worker_explainers.get(workdir)
+    if explainer is None:
+        artifact = joblib.load(os.path.join(workdir, "model.joblib"), mmap_mode="r")
+        explainer = shap.TreeExplainer(
+            artifact["model"],
+            data=np.asarray(artifact["background"]),
+            feature_perturbation="interventional"
+        )
+        # Only the current job's explainer is worth keeping
+        _worker_explainers.clear()
+        _worker_explainers[workdir] = explainer
+    return explainer
+
+def _explain_chunk(workdir: str, start: int, stop: int) -> int:
+    """Worker task: explain rows [start, stop) and write them into the shared output"""
+    explainer = _load_worker_explainer(workdir)
+    X = np.load(os.path.join(workdir, "features.npy"), mmap_mode="r")
+    out = np.load(os.path.join(workdir, "shap.npy"), mmap_mode="r+")
+    out[start:stop] = explainer.shap_values(np.asarray(X[start:stop]), check_additivity=False)
+    out.flush()
+    return stop - start
+
+def compute_shap_values(
+    model: Any,
+    background: np.ndarray,
+    X: np.ndarray,
+    progress: Optional[ProgressCallback] = None
+) -> Tuple[np.ndarray, float]:
+    """
+    SHAP values for every row of X and the explainer's base value.
+    Large inputs are explained in parallel chunks across the process pool.
+    """
+    n_rows = len(X)
+    explainer = shap.TreeExplainer(model, data=background, feature_perturbation="interventional")
+    base_value = float(np.ravel(explainer.expected_value)[0])
+
+    if n_rows < EXPLAIN_PARALLEL_MIN_ROWS or EXPLAIN_WORKERS <= 1:
+        values = np.asarray(explainer.shap_values(X, check_additivity=False))
+        if progress:
+            progress(n_rows, n_rows)
+        return values, base_value
+
+    workdir = tempfile.mkdtemp(prefix="shap-", dir=EXPLAIN_SCRATCH_DIR)
+    try:
+        joblib.dump({"model": model, "background": background}, os.path.join(workdir, "model.joblib"))
+        np.save(os.path.join(workdir, "features.npy"), np.ascontiguousarray(X, dtype=np.float64))
+        np.lib.format.open_memmap(os.path.join(workdir, "shap.npy"), mode="w+", dtype=np.float64, shape=X.shape).flush()
+
+        # At least one chunk per worker so every core gets work
+        chunk = max(1, min(EXPLAIN_CHUNK_ROWS, -(-n_rows // EXPLAIN_WORKERS)))
+        pool = get_pool()
+        futures = [pool.submit(_explain_chunk, workdir, start, min(start + chunk, n_rows)) for start in range(0, n_rows, chunk)]
+        done = 0
+        for future in as_completed(futures):
+            done += future.result()
+            if progress:
+                progress(done, n_rows)
+
+        return np.array(np.load(os.path.join(workdir, "shap.npy"))), base_value
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+def explain_dataset(
+    df: pd.DataFrame,
+    target_column: Optional[str] = None,
+    max_rows: Optional[int] = None,
+    progress: Optional[ProgressCallback] = None
+) -> Dict[str, Any]:
+    """
+    Fit a gradient-boosting surrogate of the target on the dataset's features
+    and compute TreeExplainer SHAP values on a bounded, stratified sample.
+
+    The returned artifact keeps the model, background and feature spec so
+    rows appended later can be explained without refitting.
+    """
+    rng = np.random.default_rng(EXPLAIN_RANDOM_STATE)
+    target_column = detect_target_column(df, target_column)
+    data = df[df[target_column].notna()]
+    spec = fit_feature_spec(data, target_column)
+    feature_names = [f["name"] for f in spec["features"]]
+    categorical_mask = np.array([f["kind"] != "numeric" for f in spec["features"]])
+    X = transform_features(data, spec)
+    y = data[target_column].to_numpy(dtype=float)
+
+    start = time.perf_counter()
+    fit_rows = stratified_sample(y, EXPLAIN_MAX_FIT_ROWS, rng)
+    holdout = np.zeros(len(fit_rows), dtype=bool)
+    holdout[rng.choice(len(fit_rows), size=len(fit_rows) // 5, replace=False)] = True
+    model = HistGradientBoostingRegressor(
+        max_iter=200,
+        max_leaf_nodes=15,
+        learning_rate=0.05,
+        categorical_features=categorical_mask if categorical_mask.any() else None,
+        early_stopping=False,
+        random_state=EXPLAIN_RANDOM_STATE
+    )
+    model.fit(X[fit_rows[~holdout]], y[fit_rows[~holdout]])
+    r2 = model.score(X[fit_rows[holdout]], y[fit_rows[holdout]]) if holdout.sum() >= 2 else 0.0
+    fit_ms = (time.perf_counter() - start) * 1000
+
+    start = time.perf_counter()
+    background = background_summary(X[fit_rows], EXPLAIN_BACKGROUND_SIZE, categorical_mask)
+    explain_rows = stratified_sample(y, max_rows or EXPLAIN_MAX_ROWS, rng)
+    shap_values, base_value = compute_shap_values(model, background, X[explain_rows], progress)
+    explain_ms = (time.perf_counter() - start) * 1000
+
+    return {
+        "target_column": target_column,
+        "feature_names": feature_names,
+        "categorical_mask": categorical_mask,
+        "spec": spec,
+        "model": model,
+        "background": background,
+        "values": X[explain_rows],
+        "shap_values": shap_values,
+        "base_value": base_value,
+        "mean_abs": np.abs(shap_values).mean(axis=0),
+        "rows_total": int(len(df)),
+        "rows_at_fit": int(len(df)),
+        "rows_digest": rows_digest(df, len(df)),
+        "r2": float(r2),
+        "timings": {
+            "fit_ms": round(fit_ms, 1),
+            "explain_ms": round(explain_ms, 1),
+            "rows_total": int(len(X)),
+            "rows_fit": int((~holdout).sum()),
+            "rows_explained": int(len(explain_rows)),
+            "background_size": int(len(background))
+        }
+    }
+
+def extend_explanation(
+    artifact: Dict[str, Any],
+    df: pd.DataFrame,
+    max_rows: Optional[int] = None,
+    progress: Optional[ProgressCallback] = None
+) -> Optional[Dict[str, Any]]:
+    """
+    Update an artifact for rows appended since it was computed: only the new
+    rows are explained (with the cached model and background) and merged into
+    the global importances, weighted by row counts.
+
+    Returns None when df is not an append of the artifact's data or enough
+    rows were added that the surrogate should be refit.
+    """
+    rows_before = artifact["rows_total"]
+    if len(df) <= rows_before or rows_digest(df, rows_before) != artifact["rows_digest"]:
+        return None
+    if len(df) - artifact["rows_at_fit"] > EXPLAIN_REFIT_FRACTION * artifact["rows_at_fit"]:
+        return None
+
+    rng = np.random.default_rng(EXPLAIN_RANDOM_STATE + rows_before)
+    new_rows = df.iloc[rows_before:]
+    new_rows = new_rows[new_rows[artifact["target_column"]].notna()]
+    limit = max_rows or EXPLAIN_MAX_ROWS
+    # New rows get their share of the sample, so only that many are explained
+    new_limit = max(1, int(np.ceil(limit * (len(df) - rows_before) / len(df))))
+
+    start = time.perf_counter()
+    X_new = transform_features(new_rows, artifact["spec"])
+    picked = stratified_sample(new_rows[artifact["target_column"]].to_numpy(dtype=float), new_limit, rng) if len(new_rows) else np.arange(0)
+    if len(picked):
+        shap_new, _ = compute_shap_values(artifact["model"], artifact["background"], X_new[picked], progress)
+    else:
+        shap_new = np.zeros((0, len(artifact["feature_names"])))
+    explain_ms = (time.perf_counter() - start) * 1000
+
+    # Global importance over all rows: combine per-batch means by batch size
+    rows_added = len(df) - rows_before
+    mean_abs = artifact["mean_abs"]
+    if len(shap_new):
+        mean_abs = (mean_abs * rows_before + np.abs(shap_new).mean(axis=0) * rows_added) / len(df)
+
+    # Keep the stored sample bounded: drop old rows to make room for the new ones
+    values, shap_values = artifact["values"], artifact["shap_values"]
+    room = max(limit - len(picked), 0)
+    if len(values) > room:
+        keep = np.sort(rng.choice(len(values), size=room, replace=False))
+        values, shap_values = values[keep], shap_values[keep]
+    values = np.vstack([values, X_new[picked]])
+    shap_values = np.vstack([shap_values, shap_new])
+
+    return {
+        **artifact,
+        "values": values,
+        "shap_values": shap_values,
+        "mean_abs": mean_abs,
+        "rows_total": int(len(df)),
+        "rows_digest": rows_digest(df, len(df)),
+        "timings": {
+            **artifact["timings"],
+            "fit_ms": 0.0,
+            "explain_ms": round(explain_ms, 1),
+            "rows_total": int(len(df)),
+            "rows_explained": int(len(picked)),
+            "incremental": True
+        }
+    }
+
+def feature_impacts(values: np.ndarray, shap_values: np.ndarray, categorical_mask: Optional[np.ndarray] = None) -> List[str]:
+    """
+    Direction of each feature's effect: sign of corr(feature value, SHAP value).
+    Categorical codes have no order, so their direction is reported as variable.
+    """
+    impacts = []
+    for j in range(values.shape[1]):
+        x, s = values[:, j], shap_values[:, j]
+        if (categorical_mask is not None and categorical_mask[j]) or x.std() == 0 or s.std() == 0:
+            impacts.append("variable")
+            continue
+        impacts.append("positive" if np.corrcoef(x, s)[0, 1] >= 0 else "negative")
+    return impacts
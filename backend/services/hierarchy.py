@@ -0,0 +1,197 @@
+import os
+import numpy as np
+import pandas as pd
+import scipy.sparse as sp
+import scipy.sparse.linalg as spla
+from typing import Dict, List, Any, Optional, Tuple
+from services.cache import TTLCache
+
+RECONCILIATION_METHODS = ("bottom_up", "ols", "wls", "mint")
+
+# Summing matrices and aggregated histories, reused across forecast calls
+HIERARCHY_CACHE_SIZE = int(os.getenv("HIERARCHY_CACHE_SIZE", "64"))
+HIERARCHY_CACHE_TTL_SECONDS = int(os.getenv("HIERARCHY_CACHE_TTL_SECONDS", "3600"))
+hierarchy_cache = TTLCache(maxsize=HIERARCHY_CACHE_SIZE, ttl=HIERARCHY_CACHE_TTL_SECONDS)
+
+def get_hierarchy(
+    analysis_id: str,
+    data_fingerprint: str,
+    df: pd.DataFrame,
+    date_column: str,
+    target_column: str,
+    levels: List[str]
+) -> Dict[str, Any]:
+    """Return the cached hierarchy for this dataset version, building it on a miss"""
+    key = (analysis_id, data_fingerprint, date_column, target_column, tuple(levels))
+    hierarchy = hierarchy_cache.get(key)
+    if hierarchy is None:
+        hierarchy = build_hierarchy(df, date_column, target_column, levels)
+        hierarchy_cache.set(key, hierarchy)
+    return hierarchy
+
+def build_hierarchy(df: pd.DataFrame, date_column: str, target_column: str, levels: List[str]) -> Dict[str, Any]:
+    """
+    Build the sparse summing matrix S (nodes x bottom series) and the daily
+    bottom-level history for a hierarchy such as ["region", "store"].
+
+    Node rows are ordered total first, then each level in the order given.
+    """
+    if "total" in levels:
+        raise ValueError("A hierarchy level cannot be named 'total'")
+    data = df[[date_column, target_column] + levels].copy()
+    data[date_column] = pd.to_datetime(data[date_column])
+    for col in levels:
+        data[col] = data[col].astype(str)
+
+    bottom = data.groupby([date_column] + levels)[target_column].sum().unstack(levels, fill_value=0.0)
+    bottom = bottom.asfreq("D", fill_value=0.0)
+    keys = bottom.columns.to_frame(index=False)
+    n_bottom = len(keys)
+
+    row_blocks = [np.zeros(n_bottom, dtype=np.int64)]
+    labels: List[Dict[str, str]] = [{}]
+    level_slices: Dict[str, Tuple[int, int]] = {"total": (0, 1)}
+    offset = 1
+    for depth in range(1, len(levels) + 1):
+        cols = levels[:depth]
+        codes = keys.groupby(cols, sort=True).ngroup().to_numpy()
+        node_keys = keys[cols].drop_duplicates().sort_values(cols)
+        row_blocks.append(offset + codes)
+        labels.extend(node_keys.to_dict("records"))
+        level_slices[levels[depth - 1]] = (offset, offset + len(node_keys))
+        offset += len(node_keys)
+
+    rows = np.concatenate(row_blocks)
+    cols = np.tile(np.arange(n_bottom), len(row_blocks))
+    S = sp.csr_matrix((np.ones(len(rows)), (rows, cols)), shape=(offset, n_bottom))
+
+    return {
+        "levels": levels,
+        "S": S,
+        "labels": labels,
+        "level_slices": level_slices,
+        "dates": bottom.index,
+        "bottom_history": bottom.to_numpy(dtype=float),
+        "projections": {}
+    }
+
+def node_history(hierarchy: Dict[str, Any]) -> np.ndarray:
+    """History for every node (T x n), aggregated from the bottom level"""
+    return np.asarray(hierarchy["S"] @ hierarchy["bottom_history"].T).T
+
+def seasonal_naive(Y: np.ndarray, horizon: int, season: int = 7, cycles: int = 4) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Vectorized seasonal-mean forecast for every column of Y at once.
+    Returns (forecast H x n, in-sample fitted T x n with NaN warm-up rows).
+    """
+    T, n = Y.shape
+    cycles = min(cycles, T // season)
+    if cycles < 1:
+        mean = Y.mean(axis=0)
+        return np.tile(mean, (horizon, 1)), np.tile(mean, (T, 1))
+
+    recent = Y[T - season * cycles:].reshape(cycles, season, n).mean(axis=0)
+    forecast = recent[np.arange(horizon) % season]
+
+    warmup = season * cycles
+    fitted = np.full((T, n), np.nan)
+    fitted[warmup:] = sum(Y[warmup - season * c:T - season * c] for c in range(1, cycles + 1)) / cycles
+    return forecast, fitted
+
+def shrink_covariance(residuals: np.ndarray) -> np.ndarray:
+    """
+    Schafer-Strimmer shrinkage of the residual covariance toward its diagonal,
+    as used by MinT(shrink)
+    """
+    T = residuals.shape[0]
+    cov = residuals.T @ residuals / T
+    std = np.sqrt(np.diag(cov))
+    std = np.where(std > 0, std, 1.0)
+    scaled = residuals / std
+    corr = scaled.T @ scaled / T
+    v = (1.0 / (T * (T - 1))) * ((scaled ** 2).T @ (scaled ** 2) - (scaled.T @ scaled) ** 2 / T)
+    np.fill_diagonal(v, 0.0)
+    d = corr ** 2
+    np.fill_diagonal(d, 0.0)
+    lam = float(np.clip(v.sum() / d.sum(), 0.0, 1.0)) if d.sum() > 0 else 1.0
+    shrunk = lam * np.diag(np.diag(cov)) + (1.0 - lam) * cov
+    # Small ridge keeps W invertible for constant (e.g. all-zero) series
+    return shrunk + np.eye(len(shrunk)) * 1e-9 * max(float(np.trace(shrunk)), 1.0)
+
+def projection_matrix(S: sp.csr_matrix, method: str, residuals: Optional[np.ndarray] = None) -> np.ndarray:
+    """
+    G = (S' W^-1 S)^-1 S' W^-1 mapping base forecasts of all nodes to
+    reconciled bottom-level forecasts
+    """
+    if method == "mint":
+        W = shrink_covariance(residuals)
+        W_inv_S = np.linalg.solve(W, S.toarray())
+        return np.linalg.solve(S.T @ W_inv_S, W_inv_S.T)
+
+    if method == "ols":
+        weights = np.ones(S.shape[0])
+    elif method == "wls":
+        # Structural scaling: variance proportional to the number of bottom series
+        weights = 1.0 / np.asarray(S.sum(axis=1)).ravel()
+    else:
+        raise ValueError(f"Unsupported reconciliation method: {method}")
+
+    St_W_inv = (S.T @ sp.diags(weights)).tocsc()
+    G = spla.spsolve((St_W_inv @ S).tocsc(), St_W_inv)
+    return G.toarray() if sp.issparse(G) else np.atleast_2d(G)
+
+def disaggregate(hierarchy: Dict[str, Any], level: str, level_forecast: np.ndarray) -> np.ndarray:
+    """
+    Split forecasts for the nodes of one level down to the bottom series by
+    their historical shares (middle-out)
+    """
+    start, stop = hierarchy["level_slices"][level]
+    S_level = hierarchy["S"][start:stop]
+    parent = np.asarray(S_level.argmax(axis=0)).ravel()
+    bottom_totals = hierarchy["bottom_history"].sum(axis=0)
+    level_totals = S_level @ bottom_totals
+    siblings = np.asarray(S_level.sum(axis=1)).ravel()
+    denominator = level_totals[parent]
+    shares = np.where(denominator != 0, bottom_totals / np.where(denominator != 0, denominator, 1.0), 1.0 / siblings[parent])
+    return level_forecast[:, parent] * shares
+
+def reconcile(
+    hierarchy: Dict[str, Any],
+    fit_level: str,
+    fit_forecast: np.ndarray,
+    fit_fitted: np.ndarray,
+    method: str = "mint"
+) -> np.ndarray:
+    """
+    Produce coherent forecasts (H x n) for every node from model forecasts at
+    a single level.
+
+    bottom_up aggregates (after middle-out disaggregation if the model level
+    is not the bottom). ols, wls and mint combine the model forecasts with
+    vectorized seasonal-naive base forecasts for all other nodes.
+    """
+    S = hierarchy["S"]
+    if method == "bottom_up":
+        bottom = disaggregate(hierarchy, fit_level, fit_forecast)
+        return np.asarray(S @ bottom.T).T
+
+    horizon = fit_forecast.shape[0]
+    Y = node_history(hierarchy)
+    base, fitted = seasonal_naive(Y, horizon)
+    start, stop = hierarchy["level_slices"][fit_level]
+    base[:, start:stop] = fit_forecast
+    fitted[:, start:stop] = fit_fitted
+
+    if method == "mint":
+        residuals = (Y - fitted)[~np.isnan(fitted).any(axis=1)]
+        if len(residuals) < 2:
+            method = "wls"
+    if method == "mint":
+        G = projection_matrix(S, "mint", residuals)
+    else:
+        G = hierarchy["projections"].get(method)
+        if G is None:
+            G = projection_matrix(S, method)
+            hierarchy["projections"][method] = G
+
+    return np.asarray(S @ (G @ base.T)).T
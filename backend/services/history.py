@@ -0,0 +1,61 @@
+import base64
+import json
+import os
+from typing import Any, Dict, List, Optional, Tuple
+from services.repository import get_repository
+from services.write_behind import result_writer
+
+# History pages are keyset-paginated on (user_id, created_at, id): each page
+# seeks past the last row of the previous one, so page cost does not grow
+# with the number of rows a user has. Only the columns below are returned;
+# they are included in the history indexes, so pages are index-only scans.
+HISTORY_COLUMNS = {
+    "analysis_results": "id,created_at,filename,data_points",
+    "forecast_results": "id,created_at,analysis_id,forecast_days",
+    "explanation_results": "id,created_at,analysis_id",
+}
+HISTORY_PAGE_SIZE = int(os.getenv("HISTORY_PAGE_SIZE", "20"))
+HISTORY_MAX_PAGE_SIZE = int(os.getenv("HISTORY_MAX_PAGE_SIZE", "100"))
+
+def encode_cursor(row: Dict[str, Any]) -> str:
+    """Opaque cursor for the page after this row"""
+    return base64.urlsafe_b64encode(json.dumps([row["created_at"], row["id"]]).encode()).decode().rstrip("=")
+
+def decode_cursor(cursor: str) -> Tuple[str, str]:
+    """(created_at, id) of a cursor; ValueError if it is malformed"""
+    try:
+        created_at, row_id = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+    except Exception:
+        raise ValueError("Invalid cursor")
+    if not isinstance(created_at, str) or not isinstance(row_id, str):
+        raise ValueError("Invalid cursor")
+    return created_at, row_id
+
+def _sort_key(row: Dict[str, Any]) -> Tuple[str, str]:
+    return row["created_at"], row["id"]
+
+async def list_history(table: str, user_id: str, limit: int = HISTORY_PAGE_SIZE, cursor: Optional[str] = None) -> Dict[str, Any]:
+    """One page of a user's rows, newest first, with the cursor of the next page (None on the last)"""
+    before = decode_cursor(cursor) if cursor else None
+    limit = max(1, min(limit, HISTORY_MAX_PAGE_SIZE))
+    columns = HISTORY_COLUMNS[table]
+    # One extra row tells whether another page follows
+    rows = await get_repository().history(table, columns, user_id, before, limit + 1)
+
+    # Rows accepted but not yet written behind belong in the same order
+    pending = [
+        {name: row.get(name) for name in columns.split(",")}
+        for row in result_writer.pending_rows(table, user_id)
+        if before is None or _sort_key(row) < before
+    ]
+    if pending:
+        merged: Dict[str, Dict[str, Any]] = {row["id"]: row for row in rows}
+        for row in pending:
+            merged.setdefault(row["id"], row)
+        rows = sorted(merged.values(), key=_sort_key, reverse=True)[:limit + 1]
+
+    items: List[Dict[str, Any]] = rows[:limit]
+    return {
+        "items": items,
+        "next_cursor": encode_cursor(items[-1]) if len(rows) > limit else None
+    }
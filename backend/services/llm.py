@@ -0,0 +1,194 @@
+import asyncio
+import os
+import time
+from typing import Any, Dict, Optional
+import openai
+from services.scheduler import Histogram, run_job
+
+# Resilience around chat completion calls, per model:
+# - a circuit breaker: after LLM_BREAKER_FAILURES consecutive failures the
+#   model is not called for LLM_BREAKER_RESET_SECONDS, so callers fall back
+#   at once instead of waiting for timeouts; then one probe call decides
+#   whether it closes again;
+# - hedging (opt-in, it can double token spend): when a call has not answered
+#   by the LLM_HEDGE_PERCENTILE latency, a duplicate is sent and the first
+#   answer wins. The percentile comes from the model's latency histogram once
+#   it holds LLM_HEDGE_MIN_SAMPLES calls.
+LLM_TIMEOUT_SECONDS = float(os.getenv("LLM_TIMEOUT_SECONDS", "60"))
+LLM_BREAKER_FAILURES = int(os.getenv("LLM_BREAKER_FAILURES", "5"))
+LLM_BREAKER_RESET_SECONDS = float(os.getenv("LLM_BREAKER_RESET_SECONDS", "30"))
+LLM_HEDGE_ENABLED = os.getenv("LLM_HEDGE_ENABLED", "false").lower() in ("1", "true", "yes")
+LLM_HEDGE_PERCENTILE = float(os.getenv("LLM_HEDGE_PERCENTILE", "0.95"))
+LLM_HEDGE_MIN_SAMPLES = int(os.getenv("LLM_HEDGE_MIN_SAMPLES", "20"))
+
+# Upper bounds (ms) of the LLM latency histogram buckets
+LLM_LATENCY_BUCKETS_MS = (100, 250, 500, 750, 1000, 1500, 2000, 3000, 5000, 7500, 10000, 15000, 20000, 30000, 60000)
+
+class CircuitOpenError(Exception):
+    """The model's circuit breaker is open; the call was not made"""
+
+class CircuitBreaker:
+    """Consecutive-failure breaker: closed -> open -> half-open (one probe) -> closed"""
+
+    def __init__(self, failures: int = LLM_BREAKER_FAILURES, reset_seconds: float = LLM_BREAKER_RESET_SECONDS):
+        self.failure_threshold = max(1, failures)
+        self.reset_seconds = reset_seconds
+        self.state = "closed"
+        self.consecutive_failures = 0
+        self.opened_at = 0.0
+        self.opened = 0
+        self.rejected = 0
+        self._probing = False
+
+    def allow(self) -> bool:
+        if self.state == "open" and time.monotonic() - self.opened_at >= self.reset_seconds:
+            self.state = "half_open"
+        if self.state == "closed" or (self.state == "half_open" and not self._probing):
+            self._probing = self.state == "half_open"
+            return True
+        self.rejected += 1
+        return False
+
+    def record_success(self) -> None:
+        self.state = "closed"
+        self.consecutive_failures = 0
+        self._probing = False
+
+    def record_failure(self) -> None:
+        self.consecutive_failures += 1
+        if self.state == "half_open" or self.consecutive_failures >= self.failure_threshold:
+            if self.state != "open":
+                self.opened += 1
+            self.state = "open"
+            self.opened_at = time.monotonic()
+        self._probing = False
+
+    def release(self) -> None:
+        """An allowed call ended without an outcome"""
+        self._probing = False
+
+    def snapshot(self) -> Dict[str, Any]:
+        retry_in = self.reset_seconds - (time.monotonic() - self.opened_at) if self.state == "open" else 0
+        return {
+            "state": self.state,
+            "consecutive_failures": self.consecutive_failures,
+            "retry_in_seconds": round(max(0.0, retry_in), 1),
+            "opened": self.opened,
+            "rejected": self.rejected
+        }
+
+class ModelStats:
+    """Breaker, latency histogram and call counts of one model"""
+
+    def __init__(self):
+        self.breaker = CircuitBreaker()
+        self.latency_ms = Histogram(LLM_LATENCY_BUCKETS_MS)
+        self.calls = 0
+        self.failures = 0
+        self.hedged = 0
+        self.hedge_wins = 0
+
+    def hedge_delay(self) -> Optional[float]:
+        """Seconds to wait before sending a duplicate, or None for no hedging"""
+        if not LLM_HEDGE_ENABLED or self.latency_ms.count < LLM_HEDGE_MIN_SAMPLES:
+            return None
+        bound = self.latency_ms.quantile(LLM_HEDGE_PERCENTILE)
+        return bound / 1000 if bound is not None else None
+
+models: Dict[str, ModelStats] = {}
+
+def model_stats(model: str) -> ModelStats:
+    if model not in models:
+        models[model] = ModelStats()
+    return models[model]
+
+def _timed_create(stats: ModelStats, params: Dict[str, Any], deadline: Optional[float]) -> Any:
+    if deadline is not None:
+        # The client gives up at the caller's deadline too, so a hung call
+        # does not keep its worker (shared with CSV parsing) any longer
+        params = {**params, "request_timeout": max(1.0, deadline - time.monotonic())}
+    # Timed in the worker: queue wait on a busy pool is not model latency and
+    # must not shorten the hedge delay
+    started = time.monotonic()
+    response = openai.ChatCompletion.create(**params)
+    stats.latency_ms.observe((time.monotonic() - started) * 1000)
+    return response
+
+async def _attempt(stats: ModelStats, user: Optional[Dict[str, Any]], params: Dict[str, Any], deadline: Optional[float]) -> Any:
+    # Blocking client call: run on the analysis pool
+    return await run_job("analysis", user, _timed_create, stats, params, deadline)
+
+def _discard(task: asyncio.Future) -> None:
+    # Losing or abandoned attempts finish in their worker; nothing awaits them
+    if not task.cancelled():
+        task.exception()
+
+async def _hedged(stats: ModelStats, user: Optional[Dict[str, Any]], params: Dict[str, Any]) -> Any:
+    deadline = time.monotonic() + LLM_TIMEOUT_SECONDS if LLM_TIMEOUT_SECONDS > 0 else None
+    attempts = [asyncio.ensure_future(_attempt(stats, user, params, deadline))]
+    hedge_delay = stats.hedge_delay()
+    error: Optional[BaseException] = None
+    try:
+        while True:
+            pending = [task for task in attempts if not task.done()]
+            if not pending:
+                raise error
+            timeout = None if deadline is None else max(0.0, deadline - time.monotonic())
+            if hedge_delay is not None and len(attempts) == 1:
+                timeout = hedge_delay if timeout is None else min(timeout, hedge_delay)
+            done, _ = await asyncio.wait(pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    if task is not attempts[0]:
+                        stats.hedge_wins += 1
+                    return task.result()
+                error = task.exception()
+            if done:
+                continue
+            if deadline is not None and time.monotonic() >= deadline:
+                raise asyncio.TimeoutError(f"No response within {LLM_TIMEOUT_SECONDS}s")
+            # Slower than the hedge percentile: send a duplicate, keep both
+            stats.hedged += 1
+            attempts.append(asyncio.ensure_future(_attempt(stats, user, params, deadline)))
+    finally:
+        for task in attempts:
+            if not task.done():
+                task.add_done_callback(_discard)
+
+async def chat_completion(user: Optional[Dict[str, Any]] = None, **params) -> Any:
+    """
+    openai.ChatCompletion.create(**params) behind the model's circuit breaker,
+    with hedging; raises CircuitOpenError without calling while it is open
+    """
+    stats = model_stats(params["model"])
+    if not stats.breaker.allow():
+        raise CircuitOpenError(f"Circuit open for {params['model']}")
+    stats.calls += 1
+    try:
+        response = await _hedged(stats, user, params)
+    except asyncio.CancelledError:
+        # A caller that went away says nothing about the model
+        stats.breaker.release()
+        raise
+    except Exception:
+        stats.failures += 1
+        stats.breaker.record_failure()
+        raise
+    stats.breaker.record_success()
+    return response
+
+def llm_health() -> Dict[str, Any]:
+    return {model: stats.breaker.snapshot() for model, stats in models.items()}
+
+def llm_stats() -> Dict[str, Any]:
+    return {
+        model: {
+            "calls": stats.calls,
+            "failures": stats.failures,
+            "hedged": stats.hedged,
+            "hedge_wins": stats.hedge_wins,
+            "breaker": stats.breaker.snapshot(),
+            "latency_ms": stats.latency_ms.snapshot()
+        }
+        for model, stats in models.items()
+    }
@@ -0,0 +1,100 @@
+import asyncio
+import os
+from typing import Any, Awaitable, Callable, Dict, Optional, Set
+from services.cache import TTLCache
+
+# Speculative precomputation: once an analysis is stored, its default
+# forecast and explanation are computed as background scheduler jobs so the
+# follow-up requests find them in the model and explanation caches. Opt-in
+# with PREFETCH_ENABLED, as the work is wasted when no follow-up comes; the
+# hit rate in /metrics is what tells whether it pays off. At most
+# PREFETCH_MAX_PENDING prefetches run or wait at once; further ones are skipped.
+PREFETCH_ENABLED = os.getenv("PREFETCH_ENABLED", "false").lower() in ("1", "true", "yes")
+PREFETCH_MAX_PENDING = int(os.getenv("PREFETCH_MAX_PENDING", "32"))
+# How long a prefetched result counts towards the hit rate; keep it no longer
+# than the model and explanation cache TTLs
+PREFETCH_TRACK_TTL_SECONDS = int(os.getenv("PREFETCH_TRACK_TTL_SECONDS", "3600"))
+
+PrefetchJob = Callable[[str, Dict[str, Any]], Awaitable[None]]
+
+class Prefetcher:
+    """Runs the registered prefetch jobs for new analyses and tracks their use"""
+
+    def __init__(self):
+        self._jobs: Dict[str, PrefetchJob] = {}
+        # (kind, analysis_id) -> "pending" or "ready" until a request claims it
+        self._state = TTLCache(maxsize=max(1, PREFETCH_MAX_PENDING) * 64, ttl=PREFETCH_TRACK_TTL_SECONDS)
+        self._tasks: Set[asyncio.Future] = set()
+        self.counters: Dict[str, Dict[str, int]] = {}
+
+    def register(self, kind: str, job: PrefetchJob) -> None:
+        """job(analysis_id, user) computes the default result into its cache, raising if it could not"""
+        self._jobs[kind] = job
+        self.counters[kind] = {
+            "scheduled": 0, "skipped": 0, "completed": 0, "failed": 0,
+            "hits": 0, "pending": 0, "missing": 0
+        }
+
+    def schedule(self, analysis_id: str, user: Dict[str, Any]) -> int:
+        """Start the prefetch jobs for a stored analysis; returns how many started"""
+        if not PREFETCH_ENABLED:
+            return 0
+        started = 0
+        for kind, job in self._jobs.items():
+            if len(self._tasks) >= PREFETCH_MAX_PENDING:
+                self.counters[kind]["skipped"] += 1
+                continue
+            self._state.set((kind, analysis_id), "pending")
+            task = asyncio.ensure_future(self._run(kind, job, analysis_id, user))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+            self.counters[kind]["scheduled"] += 1
+            started += 1
+        return started
+
+    async def _run(self, kind: str, job: PrefetchJob, analysis_id: str, user: Dict[str, Any]) -> None:
+        try:
+            await job(analysis_id, user)
+        except Exception as e:
+            self.counters[kind]["failed"] += 1
+            self._state.invalidate((kind, analysis_id))
+            print(f"Prefetching {kind} for analysis {analysis_id} failed: {e}")
+            return
+        self.counters[kind]["completed"] += 1
+        # Not re-armed when a request already claimed it while it ran
+        if (kind, analysis_id) in self._state:
+            self._state.set((kind, analysis_id), "ready")
+
+    def claim(self, kind: str, analysis_id: str, cached: bool) -> Optional[str]:
+        """
+        Record a request for a result that was prefetched: "hits" if it is in
+        the cache, "pending" if the prefetch is still running (the request
+        joins it), "missing" if it was evicted. None if it was not prefetched.
+        """
+        state = self._state.get((kind, analysis_id))
+        if state is None:
+            return None
+        self._state.invalidate((kind, analysis_id))
+        outcome = "pending" if state == "pending" else "hits" if cached else "missing"
+        self.counters[kind][outcome] += 1
+        return outcome
+
+    def cancel(self) -> None:
+        for task in list(self._tasks):
+            task.cancel()
+
+    def stats(self) -> Dict[str, Any]:
+        kinds = {}
+        for kind, counters in self.counters.items():
+            completed = counters["completed"]
+            kinds[kind] = {
+                **counters,
+                # Share of completed prefetches a request went on to use
+                "hit_rate": round(counters["hits"] / completed, 4) if completed else None
+            }
+        return {"enabled": PREFETCH_ENABLED, "running": len(self._tasks), "kinds": kinds}
+
+prefetcher = Prefetcher()
+
+def prefetch_stats() -> Dict[str, Any]:
+    return prefetcher.stats()
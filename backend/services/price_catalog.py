@@ -0,0 +1,118 @@
+import asyncio
+import hashlib
+import json
+import os
+import time
+from typing import Any, Dict, Optional
+import stripe
+
+# The pricing page reads prices from memory instead of calling Stripe. The
+# catalogue is loaded at startup, reloaded when Stripe sends price.* or
+# product.* events, and reloaded after the TTL in case an event was missed.
+PRICE_CATALOG_TTL_SECONDS = int(os.getenv("PRICE_CATALOG_TTL_SECONDS", "3600"))
+
+_catalog: Optional[Dict[str, Any]] = None
+# Bumped by invalidate_catalog; a reload clears staleness only if no
+# invalidation arrived while it was fetching
+_generation = 0
+_loaded_generation = 0
+_refresh_lock: Optional[asyncio.Lock] = None
+_background_refresh: Optional[asyncio.Task] = None
+
+def build_plan_mapping() -> Dict[str, str]:
+    """Map Stripe price IDs to our plan names; configure these in your .env (see .env.example)"""
+    plan_mapping: Dict[str, str] = {}
+    price_pro_monthly = os.getenv("STRIPE_PRICE_PRO_MONTHLY")
+    price_business_monthly = os.getenv("STRIPE_PRICE_BUSINESS_MONTHLY")
+    if price_pro_monthly:
+        plan_mapping[price_pro_monthly] = "pro"
+    if price_business_monthly:
+        plan_mapping[price_business_monthly] = "business"
+    return plan_mapping
+
+def load_catalog() -> Dict[str, Any]:
+    """Fetch active recurring prices from Stripe (blocking)"""
+    prices = stripe.Price.list(active=True, type='recurring', limit=100)
+    plan_mapping = build_plan_mapping()
+    entries = [
+        {
+            "id": price.id,
+            "amount": price.unit_amount,
+            "currency": price.currency,
+            "interval": price.recurring.interval,
+            "product": price.product,
+            "plan": plan_mapping.get(price.id)
+        }
+        for price in prices.data
+    ]
+    body = json.dumps(entries, sort_keys=True, default=str).encode()
+    return {
+        "prices": entries,
+        "plan_mapping": plan_mapping,
+        "etag": '"' + hashlib.sha256(body).hexdigest()[:32] + '"',
+        "loaded_at": time.time()
+    }
+
+async def refresh_catalog() -> Dict[str, Any]:
+    """Reload the catalogue; concurrent callers share one Stripe request"""
+    global _catalog, _loaded_generation, _refresh_lock
+    if _refresh_lock is None:
+        _refresh_lock = asyncio.Lock()
+    loaded_at = _catalog["loaded_at"] if _catalog else None
+    async with _refresh_lock:
+        # Another caller refreshed while this one waited
+        if _catalog and _catalog["loaded_at"] != loaded_at:
+            return _catalog
+        generation = _generation
+        _catalog = await asyncio.to_thread(load_catalog)
+        _loaded_generation = generation
+        return _catalog
+
+def _expired() -> bool:
+    return _catalog is None or _loaded_generation != _generation or time.time() - _catalog["loaded_at"] > PRICE_CATALOG_TTL_SECONDS
+
+async def get_catalog() -> Dict[str, Any]:
+    """
+    Current catalogue, reloading it when stale. If Stripe is unreachable the
+    last loaded catalogue keeps being served.
+    """
+    if not _expired():
+        return _catalog
+    try:
+        return await refresh_catalog()
+    except Exception as e:
+        if _catalog is None:
+            raise
+        print(f"Price catalogue refresh failed, serving cached prices: {e}")
+        return _catalog
+
+async def _refresh_in_background() -> None:
+    try:
+        await get_catalog()
+    except Exception as e:
+        print(f"Price catalogue refresh failed: {e}")
+
+def invalidate_catalog() -> None:
+    """Mark the catalogue stale (a price or product changed) and reload it in the background"""
+    global _generation, _background_refresh
+    _generation += 1
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        # Not on the event loop; the next read reloads
+        return
+    if _background_refresh is None or _background_refresh.done():
+        _background_refresh = loop.create_task(_refresh_in_background())
+
+def plan_for_price(price_id: str) -> str:
+    """Plan name for a Stripe price ID; unknown prices map to free"""
+    plan_mapping = _catalog["plan_mapping"] if _catalog else build_plan_mapping()
+    return plan_mapping.get(price_id, "free")
+
+def catalog_stats() -> Dict[str, Any]:
+    return {
+        "loaded": _catalog is not None,
+        "prices": len(_catalog["prices"]) if _catalog else 0,
+        "age_seconds": round(time.time() - _catalog["loaded_at"], 1) if _catalog else None,
+        "stale": _expired()
+    }
@@ -0,0 +1,160 @@
+import math
+import os
+import threading
+import time
+from abc import ABC, abstractmethod
+from typing import Any, Dict, NamedTuple, Optional, Tuple
+from fastapi import Depends, HTTPException, status
+from services.auth import require_user
+from services.cache import TTLCache
+
+# Route classes with separate budgets: "cpu" for model fits and SHAP,
+# "llm" for routes that call OpenAI
+ROUTE_CLASSES = ("cpu", "llm")
+PLANS = ("free", "pro", "business")
+
+class Limit(NamedTuple):
+    capacity: float
+    refill_per_second: float
+
+def _limit_from_env(route_class: str, plan: str, default: str) -> Limit:
+    # RATE_LIMIT_<CLASS>_<PLAN>="<burst>:<requests per minute>", e.g. RATE_LIMIT_CPU_FREE="5:10"
+    burst, per_minute = os.getenv(f"RATE_LIMIT_{route_class.upper()}_{plan.upper()}", default).split(":")
+    return Limit(float(burst), float(per_minute) / 60.0)
+
+PLAN_LIMITS: Dict[Tuple[str, str], Limit] = {
+    ("cpu", "free"): _limit_from_env("cpu", "free", "5:10"),
+    ("cpu", "pro"): _limit_from_env("cpu", "pro", "20:60"),
+    ("cpu", "business"): _limit_from_env("cpu", "business", "60:240"),
+    ("llm", "free"): _limit_from_env("llm", "free", "3:5"),
+    ("llm", "pro"): _limit_from_env("llm", "pro", "10:30"),
+    ("llm", "business"): _limit_from_env("llm", "business", "30:120"),
+}
+
+# Admission control: concurrent heavy requests per route class across all
+# users; free-plan requests may only take a share of the slots so paying
+# users always find capacity
+ADMISSION_MAX_CONCURRENT = {
+    "cpu": int(os.getenv("ADMISSION_MAX_CONCURRENT_CPU", str(2 * (os.cpu_count() or 1)))),
+    "llm": int(os.getenv("ADMISSION_MAX_CONCURRENT_LLM", "32")),
+}
+ADMISSION_FREE_SHARE = float(os.getenv("ADMISSION_FREE_SHARE", "0.5"))
+
+class RateLimitBackend(ABC):
+    """
+    Token-bucket storage. Implementations shared between server processes
+    (e.g. Redis) must make acquire atomic per key.
+    """
+
+    @abstractmethod
+    async def acquire(self, key: str, limit: Limit, cost: float = 1.0) -> Tuple[bool, float]:
+        """Take cost tokens from the bucket; returns (allowed, seconds until allowed)"""
+
+    @abstractmethod
+    async def reset(self) -> None:
+        """Forget all buckets"""
+
+class InMemoryBackend(RateLimitBackend):
+    """Per-process buckets; idle buckets expire once they would be full again"""
+
+    def __init__(self, maxsize: int = 100000):
+        self._buckets = TTLCache(maxsize=maxsize, ttl=3600)
+        self._lock = threading.Lock()
+
+    async def acquire(self, key: str, limit: Limit, cost: float = 1.0) -> Tuple[bool, float]:
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated = self._buckets.get(key, (limit.capacity, now))
+            tokens = min(limit.capacity, tokens + (now - updated) * limit.refill_per_second)
+            allowed = tokens >= cost
+            if allowed:
+                tokens -= cost
+            refill_ttl = (limit.capacity - tokens) / limit.refill_per_second if limit.refill_per_second > 0 else None
+            self._buckets.set(key, (tokens, now), ttl=max(refill_ttl, 1.0) if refill_ttl is not None else None)
+        if allowed:
+            return True, 0.0
+        if limit.refill_per_second <= 0:
+            return False, math.inf
+        return False, (cost - tokens) / limit.refill_per_second
+
+    async def reset(self) -> None:
+        self._buckets.clear()
+
+_backend: RateLimitBackend = InMemoryBackend()
+
+def get_backend() -> RateLimitBackend:
+    return _backend
+
+def set_backend(backend: RateLimitBackend) -> None:
+    """Swap the bucket storage, e.g. for one shared by all server processes"""
+    global _backend
+    _backend = backend
+
+def plan_limit(route_class: str, plan: Optional[str]) -> Limit:
+    """Limit for a plan; unknown plans get the free limits"""
+    return PLAN_LIMITS.get((route_class, plan)) or PLAN_LIMITS[(route_class, "free")]
+
+class _Admission:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.in_flight = {route_class: 0 for route_class in ROUTE_CLASSES}
+        self.rejected = {route_class: 0 for route_class in ROUTE_CLASSES}
+
+    def try_enter(self, route_class: str, plan: str) -> bool:
+        limit = ADMISSION_MAX_CONCURRENT[route_class]
+        if plan == "free":
+            limit = max(1, int(limit * ADMISSION_FREE_SHARE))
+        with self._lock:
+            if self.in_flight[route_class] >= limit:
+                self.rejected[route_class] += 1
+                return False
+            self.in_flight[route_class] += 1
+            return True
+
+    def leave(self, route_class: str) -> None:
+        with self._lock:
+            self.in_flight[route_class] -= 1
+
+admission = _Admission()
+
+def _retry_after(seconds: float) -> Dict[str, str]:
+    return {"Retry-After": str(max(1, math.ceil(seconds))) if math.isfinite(seconds) else "3600"}
+
+def rate_limited(route_class: str):
+    """
+    Dependency for heavy routes: applies the user's plan bucket for the route
+    class (429 when empty) and admission control (503 when saturated), both
+    with Retry-After. Yields the authenticated user.
+    """
+    if route_class not in ROUTE_CLASSES:
+        raise ValueError(f"Unknown route class: {route_class}")
+
+    async def dependency(user: Dict[str, Any] = Depends(require_user)):
+        plan = user.get("plan") or "free"
+        # Admission first: a request turned away as "busy" must not use up quota
+        if not admission.try_enter(route_class, plan):
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="Server is busy, please retry shortly",
+                headers=_retry_after(1)
+            )
+        try:
+            allowed, wait = await get_backend().acquire(f"{route_class}:{user['id']}", plan_limit(route_class, plan))
+            if not allowed:
+                raise HTTPException(
+                    status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                    detail=f"Rate limit exceeded for the {plan} plan",
+                    headers=_retry_after(wait)
+                )
+            yield user
+        finally:
+            admission.leave(route_class)
+
+    return dependency
+
+def admission_stats() -> Dict[str, Any]:
+    return {
+        "in_flight": dict(admission.in_flight),
+        "rejected": dict(admission.rejected),
+        "max_concurrent": dict(ADMISSION_MAX_CONCURRENT)
+    }
@@ -0,0 +1,329 @@
+import importlib.util
+import os
+from datetime import date
+from typing import Any, Dict, List, Optional, Tuple, Union
+import httpx
+
+# Async data access over Supabase's REST APIs (PostgREST for tables, GoTrue
+# for auth). One pooled client is shared by the whole process, so requests
+# reuse keep-alive (HTTP/2 when available) connections instead of blocking
+# the event loop on the synchronous supabase-py client.
+SUPABASE_POOL_SIZE = int(os.getenv("SUPABASE_POOL_SIZE", "20"))
+SUPABASE_POOL_KEEPALIVE = int(os.getenv("SUPABASE_POOL_KEEPALIVE", "10"))
+SUPABASE_KEEPALIVE_SECONDS = float(os.getenv("SUPABASE_KEEPALIVE_SECONDS", "30"))
+SUPABASE_TIMEOUT_SECONDS = float(os.getenv("SUPABASE_TIMEOUT_SECONDS", "10"))
+SUPABASE_HTTP2 = os.getenv("SUPABASE_HTTP2", "true").lower() in ("1", "true", "yes")
+# "rest" (PostgREST) or "postgres" (direct pooled connection to DATABASE_URL,
+# see services.sql_repository); auth always goes through Supabase
+DATA_BACKEND = os.getenv("DATA_BACKEND", "rest").lower()
+
+# A filter value is either matched with eq or given as (operator, value),
+# e.g. {"user_id": "u1", "expires_at": ("lt", "2024-01-01T00:00:00+00:00")}
+Filter = Union[Any, Tuple[str, Any]]
+
+# Primary keys of the tables insert_rows writes to; the result tables
+# partitioned by month are keyed by (id, created_at), see services.schema
+_PRIMARY_KEYS = {"forecast_results": "id,created_at", "explanation_results": "id,created_at"}
+
+class RepositoryError(Exception):
+    """A Supabase request that returned an error status"""
+
+    def __init__(self, status_code: int, message: str):
+        super().__init__(f"{status_code}: {message}")
+        self.status_code = status_code
+        self.message = message
+
+    @property
+    def permanent(self) -> bool:
+        """Whether retrying the same request cannot succeed (the request itself was rejected)"""
+        return 400 <= self.status_code < 500 and self.status_code not in (401, 403, 408, 429)
+
+def _http2_available() -> bool:
+    # httpx needs the optional h2 package (httpx[http2]) for HTTP/2
+    return importlib.util.find_spec("h2") is not None
+
+def _filter_params(filters: Optional[Dict[str, Filter]]) -> List[Tuple[str, str]]:
+    params = []
+    for column, value in (filters or {}).items():
+        if column in ("or", "and"):
+            # Logical groups are passed through, e.g. {"or": "(a.lt.1,b.eq.2)"}
+            params.append((column, value))
+            continue
+        operator, operand = value if isinstance(value, tuple) else ("eq", value)
+        if operator == "in":
+            operand = "(" + ",".join(str(v) for v in operand) + ")"
+        params.append((column, f"{operator}.{operand}"))
+    return params
+
+class SupabaseRestClient:
+    """Thin async client for the PostgREST and GoTrue endpoints of a Supabase project"""
+
+    def __init__(self, url: str, key: str, transport: Optional[httpx.AsyncBaseTransport] = None):
+        http2 = SUPABASE_HTTP2 and transport is None and _http2_available()
+        if SUPABASE_HTTP2 and transport is None and not http2:
+            print("h2 is not installed; Supabase requests use HTTP/1.1 keep-alive")
+        self._client = httpx.AsyncClient(
+            base_url=url.rstrip("/"),
+            headers={"apikey": key, "Authorization": f"Bearer {key}"},
+            http2=http2,
+            limits=httpx.Limits(
+                max_connections=SUPABASE_POOL_SIZE,
+                max_keepalive_connections=SUPABASE_POOL_KEEPALIVE,
+                keepalive_expiry=SUPABASE_KEEPALIVE_SECONDS
+            ),
+            timeout=SUPABASE_TIMEOUT_SECONDS,
+            transport=transport
+        )
+
+    async def _request(self, method: str, path: str, **kwargs) -> Any:
+        response = await self._client.request(method, path, **kwargs)
+        if response.status_code >= 400:
+            try:
+                body = response.json()
+                message = body.get("message") or body.get("msg") or body.get("error_description") or response.text
+            except ValueError:
+                message = response.text
+            raise RepositoryError(response.status_code, message)
+        if not response.content:
+            return None
+        return response.json()
+
+    async def select(
+        self,
+        table: str,
+        columns: str = "*",
+        filters: Optional[Dict[str, Filter]] = None,
+        order: Optional[str] = None,
+        limit: Optional[int] = None
+    ) -> List[Dict[str, Any]]:
+        params = [("select", columns)] + _filter_params(filters)
+        if order:
+            params.append(("order", order))
+        if limit is not None:
+            params.append(("limit", str(limit)))
+        return await self._request("GET", f"/rest/v1/{table}", params=params) or []
+
+    async def insert(
+        self,
+        table: str,
+        rows: Union[Dict[str, Any], List[Dict[str, Any]]],
+        returning: bool = True,
+        on_conflict: Optional[str] = None
+    ) -> List[Dict[str, Any]]:
+        prefer = ["return=representation" if returning else "return=minimal"]
+        params = []
+        if on_conflict:
+            # Rows whose key already exists are left untouched
+            prefer.append("resolution=ignore-duplicates")
+            params.append(("on_conflict", on_conflict))
+        result = await self._request(
+            "POST", f"/rest/v1/{table}", json=rows, params=params, headers={"Prefer": ",".join(prefer)}
+        )
+        return result or []
+
+    async def update(self, table: str, values: Dict[str, Any], filters: Dict[str, Filter]) -> None:
+        await self._request(
+            "PATCH", f"/rest/v1/{table}", json=values, params=_filter_params(filters), headers={"Prefer": "return=minimal"}
+        )
+
+    async def rpc(self, function: str, params: Dict[str, Any]) -> Any:
+        return await self._request("POST", f"/rest/v1/rpc/{function}", json=params)
+
+    async def delete(self, table: str, filters: Dict[str, Filter]) -> None:
+        await self._request("DELETE", f"/rest/v1/{table}", params=_filter_params(filters), headers={"Prefer": "return=minimal"})
+
+    async def auth(self, path: str, payload: Dict[str, Any], params: Optional[Dict[str, str]] = None) -> Dict[str, Any]:
+        return await self._request("POST", f"/auth/v1/{path}", json=payload, params=params) or {}
+
+    async def aclose(self) -> None:
+        await self._client.aclose()
+
+class Repository:
+    """Typed queries used by the routers and services"""
+
+    def __init__(self, client: SupabaseRestClient):
+        self.client = client
+
+    # Auth
+    async def sign_in(self, email: str, password: str) -> Optional[Dict[str, Any]]:
+        """The auth user for valid credentials (raises RepositoryError otherwise)"""
+        session = await self.client.auth("token", {"email": email, "password": password}, params={"grant_type": "password"})
+        return session.get("user")
+
+    async def sign_up(self, email: str, password: str, metadata: Optional[Dict[str, Any]] = None) -> Optional[Dict[str, Any]]:
+        """Register an auth user and return it"""
+        result = await self.client.auth("signup", {"email": email, "password": password, "data": metadata or {}})
+        # With auto-confirm the response is a session wrapping the user
+        return result.get("user") or (result if result.get("id") else None)
+
+    # Users
+    async def get_user(self, user_id: str) -> Optional[Dict[str, Any]]:
+        rows = await self.client.select("users", filters={"id": user_id}, limit=1)
+        return rows[0] if rows else None
+
+    async def create_user(self, profile: Dict[str, Any]) -> None:
+        """Insert a user profile; a profile that already exists is kept"""
+        await self.client.insert("users", profile, returning=False, on_conflict="id")
+
+    async def update_users_by_customer(self, customer_id: str, fields: Dict[str, Any]) -> None:
+        await self.client.update("users", fields, {"stripe_customer_id": customer_id})
+
+    # Analyses
+    async def create_analysis(self, row: Dict[str, Any]) -> Optional[str]:
+        """Insert an analysis and return its ID"""
+        rows = await self.client.insert("analysis_results", row)
+        return rows[0]["id"] if rows else None
+
+    async def get_analysis(self, analysis_id: str, user_id: str, columns: str = "*") -> Optional[Dict[str, Any]]:
+        """An analysis owned by the user, or None"""
+        rows = await self.client.select("analysis_results", columns, {"id": analysis_id, "user_id": user_id}, limit=1)
+        return rows[0] if rows else None
+
+    async def get_analyses(self, analysis_ids: List[str], user_id: str, columns: str = "*") -> List[Dict[str, Any]]:
+        """Those of the analyses owned by the user"""
+        return await self.client.select("analysis_results", columns, {"id": ("in", analysis_ids), "user_id": user_id})
+
+    async def insert_rows(self, table: str, rows: List[Dict[str, Any]]) -> None:
+        """Bulk insert of rows with client-assigned IDs; rows whose ID exists are skipped"""
+        await self.client.insert(table, rows, returning=False, on_conflict=_PRIMARY_KEYS.get(table, "id"))
+
+    async def history(
+        self,
+        table: str,
+        columns: str,
+        user_id: str,
+        before: Optional[Tuple[str, str]],
+        limit: int
+    ) -> List[Dict[str, Any]]:
+        """
+        A user's rows newest first, starting after the (created_at, id) key
+        before; served by the (user_id, created_at, id) indexes
+        """
+        filters: Dict[str, Filter] = {"user_id": user_id}
+        if before is not None:
+            created_at, row_id = before
+            filters["or"] = f"(created_at.lt.{created_at},and(created_at.eq.{created_at},id.lt.{row_id}))"
+        return await self.client.select(table, columns, filters, order="created_at.desc,id.desc", limit=limit)
+
+    async def get_result(self, table: str, result_id: str, user_id: str) -> Optional[Dict[str, Any]]:
+        """A forecast or explanation row owned by the user, or None"""
+        rows = await self.client.select(table, "*", {"id": result_id, "user_id": user_id}, limit=1)
+        return rows[0] if rows else None
+
+    # Retention
+    async def aging_rows(
+        self,
+        table: str,
+        columns: str,
+        older_than: str,
+        after: Optional[Tuple[str, str]],
+        limit: int,
+        unarchived_only: bool = False
+    ) -> List[Dict[str, Any]]:
+        """Rows created before older_than, oldest first, starting after the (created_at, id) key after"""
+        filters: Dict[str, Filter] = {"created_at": ("lt", older_than)}
+        if unarchived_only:
+            filters["archived_at"] = ("is", "null")
+        if after is not None:
+            created_at, row_id = after
+            filters["or"] = f"(created_at.gt.{created_at},and(created_at.eq.{created_at},id.gt.{row_id}))"
+        return await self.client.select(table, columns, filters, order="created_at.asc,id.asc", limit=limit)
+
+    async def results_by_id(self, table: str, result_ids: List[str], columns: str = "*") -> List[Dict[str, Any]]:
+        return await self.client.select(table, columns, {"id": ("in", result_ids)})
+
+    async def user_plans(self, user_ids: List[str]) -> Dict[str, Optional[str]]:
+        """Plan of each existing user, by ID"""
+        rows = await self.client.select("users", "id,plan", {"id": ("in", user_ids)})
+        return {row["id"]: row.get("plan") for row in rows}
+
+    async def mark_archived(self, table: str, archive_keys: Dict[str, str], blob_columns: Tuple[str, ...], archived_at: str) -> None:
+        """Clear the blobs of archived rows and record where they went (ID -> archive key)"""
+        if not archive_keys:
+            return
+        # Each row gets its own key, which one PATCH cannot express: one RPC call per batch
+        await self.client.rpc("mark_archived", {
+            "target": table,
+            "archive_keys": archive_keys,
+            "blob_columns": list(blob_columns),
+            "archived": archived_at
+        })
+
+    async def delete_results(self, table: str, result_ids: List[str]) -> None:
+        await self.client.delete(table, {"id": ("in", result_ids)})
+
+    # Partitions are DDL, which PostgREST does not expose: over REST these do
+    # nothing, and expired rows are deleted row by row instead
+    async def ensure_partitions(self, table: str, months: List[date]) -> List[str]:
+        """Create the monthly partitions that do not exist yet; returns their names"""
+        return []
+
+    async def drop_partitions_before(self, table: str, month: date) -> Dict[str, int]:
+        """Drop monthly partitions entirely before month; returns their sizes in bytes by name"""
+        return {}
+
+    async def table_size(self, table: str) -> Optional[int]:
+        """On-disk size of a table with its partitions, indexes and TOAST data (None if unknown)"""
+        return None
+
+    # Revoked tokens
+    async def add_revoked_token(self, jti: str, user_id: Optional[str], expires_at: str, revoked_at: str) -> None:
+        await self.client.insert("revoked_tokens", {
+            "jti": jti,
+            "user_id": user_id,
+            "expires_at": expires_at,
+            "revoked_at": revoked_at
+        }, returning=False)
+
+    async def is_token_revoked(self, jti: str) -> bool:
+        return bool(await self.client.select("revoked_tokens", "jti", {"jti": jti}, limit=1))
+
+    async def revoked_token_ids(self, expires_after: Optional[str] = None, revoked_since: Optional[str] = None) -> List[str]:
+        filters: Dict[str, Filter] = {}
+        if expires_after is not None:
+            filters["expires_at"] = ("gt", expires_after)
+        if revoked_since is not None:
+            filters["revoked_at"] = ("gte", revoked_since)
+        return [row["jti"] for row in await self.client.select("revoked_tokens", "jti", filters)]
+
+    async def purge_revoked_tokens(self, expired_before: str) -> None:
+        await self.client.delete("revoked_tokens", {"expires_at": ("lt", expired_before)})
+
+    async def close(self) -> None:
+        await self.client.aclose()
+
+_repository: Optional[Repository] = None
+
+def get_repository() -> Repository:
+    """Shared repository for the configured DATA_BACKEND (created on first use)"""
+    global _repository
+    if _repository is None:
+        url = os.getenv("SUPABASE_URL")
+        key = os.getenv("SUPABASE_ANON_KEY")
+        if not url or not key:
+            raise ValueError("SUPABASE_URL and SUPABASE_ANON_KEY must be set")
+        rest = Repository(SupabaseRestClient(url, key))
+        if DATA_BACKEND == "postgres":
+            database_url = os.getenv("DATABASE_URL")
+            if not database_url:
+                raise ValueError("DATABASE_URL must be set when DATA_BACKEND=postgres")
+            # Imported lazily: SQLAlchemy and asyncpg are only needed for this backend
+            from services.sql_repository import SqlRepository
+            _repository = SqlRepository(database_url, auth=rest)
+        elif DATA_BACKEND == "rest":
+            _repository = rest
+        else:
+            raise ValueError(f"Unknown DATA_BACKEND: {DATA_BACKEND}")
+    return _repository
+
+def set_repository(repository: Optional[Repository]) -> None:
+    """Replace the shared repository (e.g. with one pointed at a test server)"""
+    global _repository
+    _repository = repository
+
+async def close_repositories() -> None:
+    """Close pooled connections; called on app shutdown"""
+    global _repository
+    if _repository is not None:
+        await _repository.close()
+    _repository = None
@@ -0,0 +1,226 @@
+import asyncio
+import json
+import os
+import time
+from datetime import date, datetime, timedelta
+from typing import Any, AsyncIterator, Dict, List, NamedTuple, Optional
+from services import archive
+from services.cache import TTLCache
+from services.repository import Repository, get_repository
+from services.write_behind import result_writer
+
+# Forecasts and explanations are kept per the owner's plan: after
+# archive_after_days their JSONB blobs move to the compressed archive
+# (services.archive) and the row keeps only its metadata; after
+# delete_after_days the row is deleted. 0 means never. Both tables are
+# partitioned by month, so once a month has expired for every plan its
+# partition is dropped whole instead of row by row.
+RESULT_BLOBS = {
+    "forecast_results": ("forecast_data",),
+    "explanation_results": ("feature_importance", "shap_values"),
+}
+RETENTION_INTERVAL_SECONDS = int(os.getenv("RETENTION_INTERVAL_SECONDS", "3600"))
+RETENTION_BATCH_SIZE = int(os.getenv("RETENTION_BATCH_SIZE", "100"))
+# Monthly partitions created ahead of the current month
+RETENTION_PARTITIONS_AHEAD = int(os.getenv("RETENTION_PARTITIONS_AHEAD", "2"))
+RETENTION_REHYDRATE_CACHE_SIZE = int(os.getenv("RETENTION_REHYDRATE_CACHE_SIZE", "256"))
+RETENTION_REHYDRATE_CACHE_TTL_SECONDS = int(os.getenv("RETENTION_REHYDRATE_CACHE_TTL_SECONDS", "600"))
+
+class RetentionPolicy(NamedTuple):
+    archive_after_days: int
+    delete_after_days: int
+
+def _policy_from_env(plan: str, default: str) -> RetentionPolicy:
+    # RETENTION_<PLAN>="<archive after days>:<delete after days>", e.g. RETENTION_FREE="7:90"
+    archive_after, delete_after = os.getenv(f"RETENTION_{plan.upper()}", default).split(":")
+    return RetentionPolicy(int(archive_after), int(delete_after))
+
+PLAN_RETENTION: Dict[str, RetentionPolicy] = {
+    "free": _policy_from_env("free", "7:90"),
+    "pro": _policy_from_env("pro", "30:365"),
+    "business": _policy_from_env("business", "90:0"),
+}
+
+def retention_policy(plan: Optional[str]) -> RetentionPolicy:
+    """Policy for a plan; unknown plans get the free policy"""
+    return PLAN_RETENTION.get(plan) or PLAN_RETENTION["free"]
+
+rehydrated = TTLCache(maxsize=RETENTION_REHYDRATE_CACHE_SIZE, ttl=RETENTION_REHYDRATE_CACHE_TTL_SECONDS)
+_last_report: Optional[Dict[str, Any]] = None
+_totals = {"runs": 0, "deleted_rows": 0, "archived_rows": 0, "reclaimed_bytes": 0}
+
+def _month_start(moment: datetime, months_ahead: int = 0) -> date:
+    month = moment.year * 12 + moment.month - 1 + months_ahead
+    return date(month // 12, month % 12 + 1, 1)
+
+def _cutoffs(now: datetime, field: str) -> Dict[str, str]:
+    """Per plan, the creation time before which the policy field applies"""
+    return {
+        plan: (now - timedelta(days=getattr(policy, field))).isoformat()
+        for plan, policy in PLAN_RETENTION.items()
+        if getattr(policy, field) > 0
+    }
+
+async def _aging_batches(repository: Repository, table: str, columns: str, older_than: str, unarchived_only: bool) -> AsyncIterator[List[Dict[str, Any]]]:
+    after = None
+    while True:
+        rows = await repository.aging_rows(table, columns, older_than, after, RETENTION_BATCH_SIZE, unarchived_only)
+        if rows:
+            yield rows
+        if len(rows) < RETENTION_BATCH_SIZE:
+            return
+        after = (rows[-1]["created_at"], rows[-1]["id"])
+
+async def _due(repository: Repository, table: str, field: str, now: datetime, unarchived_only: bool) -> AsyncIterator[List[Dict[str, Any]]]:
+    """Batches of rows past their owner's cutoff for the policy field"""
+    cutoffs = _cutoffs(now, field)
+    if not cutoffs:
+        return
+    # Rows younger than every plan's cutoff are never due
+    async for rows in _aging_batches(repository, table, "id,user_id,created_at", max(cutoffs.values()), unarchived_only):
+        plans = await repository.user_plans(sorted({row["user_id"] for row in rows if row.get("user_id")}))
+        due = []
+        for row in rows:
+            policy_plan = plans.get(row.get("user_id"))
+            cutoff = cutoffs.get(policy_plan if policy_plan in PLAN_RETENTION else "free")
+            if cutoff is not None and row["created_at"] < cutoff:
+                due.append(row)
+        if due:
+            yield due
+
+def _expired_months_cutoff(now: datetime) -> Optional[date]:
+    """Start of the oldest month not yet expired for every plan (None if some plan keeps results)"""
+    policies = list(PLAN_RETENTION.values())
+    if any(policy.delete_after_days <= 0 for policy in policies):
+        return None
+    return _month_start(now - timedelta(days=max(policy.delete_after_days for policy in policies)))
+
+async def _drop_expired_partitions(repository: Repository, table: str, now: datetime, report: Dict[str, Any]) -> None:
+    cutoff = _expired_months_cutoff(now)
+    if cutoff is not None:
+        report["partitions_dropped"] = await repository.drop_partitions_before(table, cutoff)
+
+async def _drop_expired_segments(repository: Repository, table: str, now: datetime, report: Dict[str, Any]) -> None:
+    cutoff = _expired_months_cutoff(now)
+    if cutoff is None:
+        return
+    # Only once no row of those months is left to point into the segments
+    # (without partitions they are deleted row by row, which may have failed)
+    if await repository.aging_rows(table, "id", datetime.combine(cutoff, datetime.min.time()).isoformat(), None, 1):
+        return
+    report["archive_segments_dropped"] = await asyncio.to_thread(archive.drop_before, table, cutoff)
+
+async def _delete_expired(repository: Repository, table: str, now: datetime, report: Dict[str, Any]) -> None:
+    async for rows in _due(repository, table, "delete_after_days", now, unarchived_only=False):
+        await repository.delete_results(table, [row["id"] for row in rows])
+        report["deleted_rows"] += len(rows)
+
+async def _archive_aged(repository: Repository, table: str, now: datetime, report: Dict[str, Any]) -> None:
+    blob_columns = RESULT_BLOBS[table]
+    async for rows in _due(repository, table, "archive_after_days", now, unarchived_only=True):
+        # Blobs are only read for the rows being archived
+        full_rows = await repository.results_by_id(table, [row["id"] for row in rows], "id,created_at," + ",".join(blob_columns))
+        by_month: Dict[str, list] = {}
+        for row in full_rows:
+            payload = {column: row.get(column) for column in blob_columns}
+            by_month.setdefault(archive.month_of(row["created_at"]), []).append((row["id"], payload))
+            report["archived_inline_bytes"] += len(json.dumps(payload, separators=(",", ":"), default=str))
+        archive_keys = {}
+        for month, payloads in by_month.items():
+            # Stored (and fsynced) before the rows drop their blobs
+            stored = await asyncio.to_thread(archive.store, table, month, payloads)
+            for row_id, (archive_key, size) in stored.items():
+                archive_keys[row_id] = archive_key
+                report["archived_compressed_bytes"] += size
+        await repository.mark_archived(table, archive_keys, blob_columns, now.isoformat())
+        report["archived_rows"] += len(archive_keys)
+
+async def run_retention(now: Optional[datetime] = None) -> Dict[str, Any]:
+    """
+    One retention pass over the results tables: create upcoming partitions,
+    drop fully expired months, delete expired rows, archive aged blobs.
+    Returns a report of what was done and the space reclaimed.
+    """
+    global _last_report
+    now = now or datetime.utcnow()
+    started = time.monotonic()
+    repository = get_repository()
+    tables = {}
+    for table in RESULT_BLOBS:
+        report: Dict[str, Any] = {
+            "size_before": await repository.table_size(table),
+            "partitions_created": [],
+            "partitions_dropped": {},
+            "archive_segments_dropped": {},
+            "deleted_rows": 0,
+            "archived_rows": 0,
+            "archived_inline_bytes": 0,
+            "archived_compressed_bytes": 0
+        }
+        months = [_month_start(now, ahead) for ahead in range(RETENTION_PARTITIONS_AHEAD + 1)]
+        report["partitions_created"] = await repository.ensure_partitions(table, months)
+        await _drop_expired_partitions(repository, table, now, report)
+        await _delete_expired(repository, table, now, report)
+        await _drop_expired_segments(repository, table, now, report)
+        await _archive_aged(repository, table, now, report)
+        report["size_after"] = await repository.table_size(table)
+        report["archive_bytes"] = await asyncio.to_thread(archive.archive_size, table)
+        # Rows deleted one by one free space for reuse after VACUUM; that
+        # shows in size_after on later runs rather than here
+        report["reclaimed_bytes"] = (
+            report["archived_inline_bytes"] - report["archived_compressed_bytes"]
+            + sum(report["partitions_dropped"].values())
+            + sum(report["archive_segments_dropped"].values())
+        )
+        tables[table] = report
+
+    _last_report = {
+        "ran_at": now.isoformat(),
+        "duration_seconds": round(time.monotonic() - started, 3),
+        "reclaimed_bytes": sum(report["reclaimed_bytes"] for report in tables.values()),
+        "tables": tables
+    }
+    _totals["runs"] += 1
+    _totals["reclaimed_bytes"] += _last_report["reclaimed_bytes"]
+    for report in tables.values():
+        _totals["deleted_rows"] += report["deleted_rows"]
+        _totals["archived_rows"] += report["archived_rows"]
+    return _last_report
+
+async def run_retention_loop() -> None:
+    """Background task: a retention pass every RETENTION_INTERVAL_SECONDS"""
+    while True:
+        await asyncio.sleep(RETENTION_INTERVAL_SECONDS)
+        try:
+            report = await run_retention()
+            deleted = sum(table["deleted_rows"] for table in report["tables"].values())
+            archived = sum(table["archived_rows"] for table in report["tables"].values())
+            print(f"Retention: {deleted} rows deleted, {archived} archived, {report['reclaimed_bytes']} bytes reclaimed")
+        except Exception as e:
+            print(f"Retention run failed: {e}")
+
+async def get_result(table: str, result_id: str, user_id: str) -> Optional[Dict[str, Any]]:
+    """
+    A user's forecast or explanation row; the blobs of an archived row are
+    read back from the archive (KeyError if they are no longer there)
+    """
+    pending = result_writer.pending(table, result_id)
+    if pending is not None:
+        return pending if pending.get("user_id") == user_id else None
+    row = await get_repository().get_result(table, result_id, user_id)
+    if row is None or not row.get("archive_key"):
+        return row
+    blobs = rehydrated.get(row["archive_key"])
+    if blobs is None:
+        blobs = await asyncio.to_thread(archive.load, row["archive_key"])
+        rehydrated.set(row["archive_key"], blobs)
+    return {**row, **blobs}
+
+def retention_stats() -> Dict[str, Any]:
+    """Policies, the last run's report and running totals"""
+    return {
+        "policy": {plan: policy._asdict() for plan, policy in PLAN_RETENTION.items()},
+        "last_run": _last_report,
+        "totals": dict(_totals),
+        "rehydration_cache": rehydrated.stats()
+    }
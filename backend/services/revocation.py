@@ -0,0 +1,156 @@
+import asyncio
+import hashlib
+import math
+import os
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Optional, Set
+from services.repository import get_repository
+from services.cache import TTLCache
+
+# Revoked token IDs (jti) are persisted in the revoked_tokens table and
+# mirrored in an in-memory Bloom filter, so the common "not revoked" answer
+# needs no round trip; only filter hits are confirmed against the table.
+REVOCATION_BLOOM_CAPACITY = int(os.getenv("REVOCATION_BLOOM_CAPACITY", "100000"))
+REVOCATION_BLOOM_ERROR_RATE = float(os.getenv("REVOCATION_BLOOM_ERROR_RATE", "0.001"))
+# How often revocations made by other server processes are pulled in
+REVOCATION_SYNC_SECONDS = int(os.getenv("REVOCATION_SYNC_SECONDS", "30"))
+# Full rebuilds drop entries for tokens that have expired since
+REVOCATION_REBUILD_SECONDS = int(os.getenv("REVOCATION_REBUILD_SECONDS", "3600"))
+# Each sync re-reads this far before the previous one: revoked_at is stamped by
+# the revoking process before its insert commits, and clocks differ between hosts
+REVOCATION_SYNC_OVERLAP_SECONDS = int(os.getenv("REVOCATION_SYNC_OVERLAP_SECONDS", "10"))
+# Retry interval while the filter has never been loaded (e.g. the database was
+# unreachable at startup); until then every token is checked against the table
+REVOCATION_RETRY_SECONDS = int(os.getenv("REVOCATION_RETRY_SECONDS", "5"))
+
+class BloomFilter:
+    """Fixed-size Bloom filter over strings (double hashing on one blake2b digest)"""
+
+    def __init__(self, capacity: int, error_rate: float):
+        self.capacity = max(capacity, 1)
+        self.size = max(8, math.ceil(-self.capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / self.capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def _positions(self, item: str):
+        digest = hashlib.blake2b(item.encode("utf-8"), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        return [(h1 + i * h2) % self.size for i in range(self.hashes)]
+
+    def add(self, item: str) -> None:
+        for pos in self._positions(item):
+            self.bits[pos >> 3] |= 1 << (pos & 7)
+        self.count += 1
+
+    def __contains__(self, item: str) -> bool:
+        return all(self.bits[pos >> 3] & (1 << (pos & 7)) for pos in self._positions(item))
+
+_filter = BloomFilter(REVOCATION_BLOOM_CAPACITY, REVOCATION_BLOOM_ERROR_RATE)
+_filter_lock = threading.Lock()
+_last_sync: Optional[float] = None
+# Revocations made while a rebuild reads the denylist, carried over into the new filter
+_added_during_rebuild: Optional[Set[str]] = None
+
+# Confirmed answers for filter hits
+_confirmed = TTLCache(maxsize=10000, ttl=3600)
+
+def _iso(timestamp: float) -> str:
+    return datetime.fromtimestamp(timestamp, tz=timezone.utc).isoformat()
+
+def _add(jti: str) -> None:
+    with _filter_lock:
+        _filter.add(jti)
+        if _added_during_rebuild is not None:
+            _added_during_rebuild.add(jti)
+
+async def revoke_token(jti: str, expires_at: float, user_id: Optional[str] = None) -> None:
+    """Persist a token revocation and add it to the in-memory filter"""
+    _add(jti)
+    _confirmed.set(jti, True, ttl=max(expires_at - time.time(), 1.0))
+    await get_repository().add_revoked_token(jti, user_id, _iso(expires_at), _iso(time.time()))
+
+async def is_revoked(jti: str) -> bool:
+    """
+    Whether a token ID was revoked. Filter misses are definite once the filter
+    is loaded; hits are confirmed against the denylist (and treated as revoked
+    if it is unreachable).
+    """
+    if _last_sync is not None and jti not in _filter:
+        return False
+    confirmed = _confirmed.get(jti)
+    if confirmed is not None:
+        return confirmed
+    try:
+        revoked = await get_repository().is_token_revoked(jti)
+    except Exception as e:
+        print(f"Error confirming token revocation: {e}")
+        return True
+    # A "not revoked" answer may be overtaken by another process revoking the token
+    _confirmed.set(jti, revoked, ttl=None if revoked else REVOCATION_SYNC_SECONDS)
+    return revoked
+
+async def rebuild_filter() -> int:
+    """
+    Drop expired denylist entries and rebuild the filter from the rest, sized
+    for the current number of revocations. Called from the app lifespan.
+    """
+    global _filter, _last_sync, _added_during_rebuild
+    started = time.time()
+    now = _iso(started)
+    repository = get_repository()
+    with _filter_lock:
+        _added_during_rebuild = set()
+    try:
+        await repository.purge_revoked_tokens(now)
+        jtis = await repository.revoked_token_ids(expires_after=now)
+
+        rebuilt = BloomFilter(max(REVOCATION_BLOOM_CAPACITY, 2 * len(jtis)), REVOCATION_BLOOM_ERROR_RATE)
+        for jti in jtis:
+            rebuilt.add(jti)
+        with _filter_lock:
+            # A token revoked after the read above is not in jtis
+            for jti in _added_during_rebuild:
+                rebuilt.add(jti)
+            _filter = rebuilt
+            _last_sync = started
+    finally:
+        with _filter_lock:
+            _added_during_rebuild = None
+    return len(jtis)
+
+async def sync_filter() -> int:
+    """Add revocations recorded since the last sync (e.g. by other processes)"""
+    global _last_sync
+    # Past capacity the false-positive rate climbs; rebuild at a larger size instead
+    if _last_sync is None or _filter.count >= _filter.capacity:
+        return await rebuild_filter()
+    started = time.time()
+    jtis = await get_repository().revoked_token_ids(revoked_since=_iso(_last_sync - REVOCATION_SYNC_OVERLAP_SECONDS))
+    # The overlap returns recent revocations again; re-adding them would only
+    # inflate the count that triggers rebuilds
+    added = [jti for jti in jtis if jti not in _filter]
+    for jti in added:
+        _add(jti)
+    _last_sync = started
+    return len(added)
+
+async def run_sync_loop() -> None:
+    """Background task: periodic sync, with a full rebuild every REVOCATION_REBUILD_SECONDS"""
+    last_rebuild = time.monotonic()
+    while True:
+        await asyncio.sleep(REVOCATION_SYNC_SECONDS if _last_sync is not None else REVOCATION_RETRY_SECONDS)
+        try:
+            if time.monotonic() - last_rebuild >= REVOCATION_REBUILD_SECONDS:
+                await rebuild_filter()
+                last_rebuild = time.monotonic()
+            else:
+                await sync_filter()
+        except Exception as e:
+            if _last_sync is None:
+                print(f"Token revocation filter still not loaded, retrying in {REVOCATION_RETRY_SECONDS}s: {e}")
+            else:
+                print(f"Error syncing token revocations: {e}")
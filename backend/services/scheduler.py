@@ -0,0 +1,248 @@
+import asyncio
+import functools
+import heapq
+import itertools
+import os
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Dict, Hashable, List, Optional
+
+# CPU-heavy work (Prophet fits, SHAP, CSV parsing and LLM calls) runs on one
+# worker pool per job type. Each pool serves users by start-time fair queuing
+# weighted by plan, so a user submitting many jobs only delays their own.
+SCHEDULER_PLAN_WEIGHTS = {
+    "free": float(os.getenv("SCHEDULER_WEIGHT_FREE", "1")),
+    "pro": float(os.getenv("SCHEDULER_WEIGHT_PRO", "4")),
+    "business": float(os.getenv("SCHEDULER_WEIGHT_BUSINESS", "8")),
+}
+SCHEDULER_POOL_WORKERS = {
+    "forecast": int(os.getenv("SCHEDULER_FORECAST_WORKERS", str(os.cpu_count() or 1))),
+    "explain": int(os.getenv("SCHEDULER_EXPLAIN_WORKERS", "2")),
+    "analysis": int(os.getenv("SCHEDULER_ANALYSIS_WORKERS", "8")),
+}
+# Workers that batch jobs may never occupy, so small jobs start promptly
+# while batch jobs run in the background
+SCHEDULER_RESERVED_SLOTS = int(os.getenv("SCHEDULER_RESERVED_SLOTS", "1"))
+
+# Upper bounds (ms) of the queue-wait histogram buckets
+QUEUE_WAIT_BUCKETS_MS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000, 60000)
+
+class Histogram:
+    """Cumulative-bucket latency histogram (thread-safe)"""
+
+    def __init__(self, buckets=QUEUE_WAIT_BUCKETS_MS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.total = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float) -> None:
+        index = next((i for i, bound in enumerate(self.buckets) if value <= bound), len(self.buckets))
+        with self._lock:
+            self.counts[index] += 1
+            self.count += 1
+            self.total += value
+
+    def quantile(self, q: float) -> Optional[float]:
+        """Upper bound of the bucket holding the q-quantile (None when empty or beyond the last bucket)"""
+        with self._lock:
+            if self.count == 0:
+                return None
+            rank = q * self.count
+            seen = 0
+            for bound, count in zip(self.buckets, self.counts):
+                seen += count
+                if seen >= rank:
+                    return float(bound)
+            return None
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "buckets_ms": list(self.buckets) + ["+Inf"],
+            "counts": list(self.counts),
+            "count": self.count,
+            "mean_ms": round(self.total / self.count, 3) if self.count else None,
+            "p50_ms": self.quantile(0.5),
+            "p99_ms": self.quantile(0.99)
+        }
+
+class _Job:
+    __slots__ = ("call", "flow", "plan", "batch", "background", "key", "start_tag", "enqueued", "started", "result")
+
+    def __init__(self, call, flow, plan, batch, key, background=False):
+        self.call = call
+        self.flow = flow
+        self.plan = plan
+        self.batch = batch or background
+        self.background = background
+        self.key = key
+        self.start_tag = 0.0
+        self.started = False
+        self.enqueued = time.monotonic()
+        self.result: Future = Future()
+
+class FairScheduler:
+    """
+    Weighted fair queue in front of a thread pool.
+
+    Each job gets a start tag max(V, last finish of its user); its user's
+    finish advances by cost / weight(plan). The free worker takes the job
+    with the smallest start tag and V moves to it. Jobs with the same dedup
+    key share one execution while queued or running.
+
+    Background jobs (speculative work nobody is waiting for yet) start only
+    when no other job is queued, take batch slots and are not charged to
+    their user. One that a foreground job joins by dedup key while still
+    queued is promoted to that job's queue.
+    """
+
+    def __init__(self, name: str, workers: int, reserved_slots: int = SCHEDULER_RESERVED_SLOTS):
+        self.name = name
+        self.workers = max(1, workers)
+        self.batch_slots = max(1, self.workers - reserved_slots)
+        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix=f"{name}-job")
+        self._lock = threading.Lock()
+        self._queues: Dict[bool, List] = {False: [], True: []}
+        self._background: List = []
+        self._seq = itertools.count()
+        self._virtual_time = 0.0
+        self._finish: Dict[Hashable, float] = {}
+        self._running = 0
+        self._running_batch = 0
+        self._inflight: Dict[Hashable, _Job] = {}
+        self.deduplicated = 0
+        self.wait_ms = {plan: Histogram() for plan in SCHEDULER_PLAN_WEIGHTS}
+
+    def submit(
+        self,
+        call: Callable[[], Any],
+        flow: Hashable,
+        plan: str = "free",
+        cost: float = 1.0,
+        batch: bool = False,
+        dedup_key: Optional[Hashable] = None,
+        background: bool = False
+    ) -> Future:
+        """Queue call() for flow (a user) and return a Future for its result"""
+        plan = plan if plan in SCHEDULER_PLAN_WEIGHTS else "free"
+        with self._lock:
+            if dedup_key is not None and dedup_key in self._inflight:
+                self.deduplicated += 1
+                job = self._inflight[dedup_key]
+                if not (job.background and not background and not job.started):
+                    return job.result
+                # Someone is waiting for it now; its background entry is skipped
+                job.background, job.batch = False, batch
+                self._enqueue(job, cost)
+            else:
+                job = _Job(call, flow, plan, batch, dedup_key, background)
+                if background:
+                    heapq.heappush(self._background, (self._virtual_time, next(self._seq), job))
+                else:
+                    self._enqueue(job, cost)
+                if dedup_key is not None:
+                    self._inflight[dedup_key] = job
+            ready = self._take_ready()
+        self._start(ready)
+        return job.result
+
+    def _enqueue(self, job: _Job, cost: float) -> None:
+        # Called with the lock held
+        job.start_tag = max(self._virtual_time, self._finish.get(job.flow, 0.0))
+        self._finish[job.flow] = job.start_tag + cost / SCHEDULER_PLAN_WEIGHTS[job.plan]
+        heapq.heappush(self._queues[job.batch], (job.start_tag, next(self._seq), job))
+
+    def _take_ready(self) -> List[_Job]:
+        # Called with the lock held
+        ready = []
+        while self._background and not self._background[0][2].background:
+            heapq.heappop(self._background)
+        while self._running < self.workers:
+            candidates = [q for batch, q in self._queues.items() if q and (not batch or self._running_batch < self.batch_slots)]
+            if not candidates:
+                if self._queues[True] or not self._background or self._running_batch >= self.batch_slots:
+                    break
+                candidates = [self._background]
+            _, _, job = heapq.heappop(min(candidates, key=lambda q: q[0][:2]))
+            if job.started:
+                continue
+            job.started = True
+            self._virtual_time = max(self._virtual_time, job.start_tag)
+            self._running += 1
+            self._running_batch += job.batch
+            ready.append(job)
+        # Users whose finish tag V has passed need no state
+        if len(self._finish) > 1024:
+            self._finish = {flow: tag for flow, tag in self._finish.items() if tag > self._virtual_time}
+        return ready
+
+    def _start(self, jobs: List[_Job]) -> None:
+        for job in jobs:
+            if not job.background:
+                self.wait_ms[job.plan].observe((time.monotonic() - job.enqueued) * 1000)
+            self._executor.submit(self._run, job)
+
+    def _run(self, job: _Job) -> None:
+        try:
+            # A job whose future was cancelled while queued is not run
+            if job.result.set_running_or_notify_cancel():
+                try:
+                    job.result.set_result(job.call())
+                except BaseException as e:
+                    job.result.set_exception(e)
+        finally:
+            with self._lock:
+                self._running -= 1
+                self._running_batch -= job.batch
+                if job.key is not None:
+                    self._inflight.pop(job.key, None)
+                ready = self._take_ready()
+            self._start(ready)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            queued = {
+                "interactive": len(self._queues[False]),
+                "batch": len(self._queues[True]),
+                "background": sum(job.background for _, _, job in self._background)
+            }
+            running = self._running
+        return {
+            "workers": self.workers,
+            "running": running,
+            "queued": queued,
+            "deduplicated": self.deduplicated,
+            "queue_wait_ms": {plan: histogram.snapshot() for plan, histogram in self.wait_ms.items()}
+        }
+
+schedulers = {name: FairScheduler(name, workers) for name, workers in SCHEDULER_POOL_WORKERS.items()}
+
+async def run_job(
+    pool: str,
+    user: Optional[Dict[str, Any]],
+    func: Callable[..., Any],
+    *args,
+    cost: float = 1.0,
+    batch: bool = False,
+    dedup_key: Optional[Hashable] = None,
+    background: bool = False,
+    **kwargs
+) -> Any:
+    """
+    Run func(*args, **kwargs) on a scheduler pool on behalf of a user and
+    await its result. Requests without a user share one anonymous flow.
+    """
+    flow = user["id"] if user else None
+    plan = (user or {}).get("plan") or "free"
+    future = schedulers[pool].submit(
+        functools.partial(func, *args, **kwargs), flow, plan, cost, batch,
+        None if dedup_key is None else (flow, dedup_key), background
+    )
+    # Shielded: with dedup the job may be shared, and one waiter going away
+    # must not cancel it for the others
+    return await asyncio.shield(asyncio.wrap_future(future))
+
+def scheduler_stats() -> Dict[str, Any]:
+    return {name: scheduler.stats() for name, scheduler in schedulers.items()}
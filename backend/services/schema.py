@@ -0,0 +1,114 @@
+from sqlalchemy import (
+    Column, DateTime, ForeignKey, Index, Integer, MetaData, String, Table, Text, text
+)
+from sqlalchemy.dialects.postgresql import JSONB, UUID
+from typing import List
+
+# SQLAlchemy version of the DDL in services.database.create_tables_sql, used
+# by the direct Postgres backend and as the target of Alembic migrations.
+# Keep the two in sync. The monthly partitions of forecast_results and
+# explanation_results (<table>_yYYYYmMM, <table>_default) are created at
+# runtime by services.retention and are not part of this metadata.
+metadata = MetaData()
+
+def _uuid_pk() -> Column:
+    return Column("id", UUID(as_uuid=False), primary_key=True, server_default=text("gen_random_uuid()"))
+
+def _created_at() -> Column:
+    return Column("created_at", DateTime, server_default=text("NOW()"))
+
+def _partition_key() -> Column:
+    # Monthly range partitions need the key in the primary key: (id, created_at)
+    return Column("created_at", DateTime, primary_key=True, server_default=text("NOW()"))
+
+def _archive_columns() -> List[Column]:
+    # Set when the row's JSONB blobs were moved to the archive (services.archive)
+    return [Column("archived_at", DateTime), Column("archive_key", String(255))]
+
+def _user_fk() -> Column:
+    return Column("user_id", UUID(as_uuid=False), ForeignKey("users.id", ondelete="CASCADE"))
+
+def _history_index(table: str, *include: str) -> Index:
+    # Serves the user_id lookups and, scanned backwards, the keyset-paginated
+    # history pages (newest first); the included columns make those pages
+    # index-only scans. See services.history.HISTORY_COLUMNS.
+    return Index(f"idx_{table}_history", "user_id", "created_at", "id", postgresql_include=list(include))
+
+users = Table(
+    "users", metadata,
+    _uuid_pk(),
+    Column("email", String(255), unique=True, nullable=False),
+    Column("plan", String(50), server_default=text("'free'")),
+    Column("stripe_customer_id", String(255)),
+    Column("subscription_id", String(255)),
+    Column("subscription_status", String(50)),
+    Column("payment_status", String(50)),
+    Column("last_payment_date", DateTime),
+    _created_at(),
+    Column("updated_at", DateTime, server_default=text("NOW()")),
+    Index("idx_users_email", "email"),
+)
+
+sales_data = Table(
+    "sales_data", metadata,
+    _uuid_pk(),
+    _user_fk(),
+    Column("filename", String(255), nullable=False),
+    Column("file_size", Integer),
+    Column("upload_date", DateTime, server_default=text("NOW()")),
+    Column("data_points", Integer),
+    Column("columns", JSONB),
+    Index("idx_sales_data_user_id", "user_id"),
+)
+
+analysis_results = Table(
+    "analysis_results", metadata,
+    _uuid_pk(),
+    _user_fk(),
+    Column("sales_data_id", UUID(as_uuid=False), ForeignKey("sales_data.id", ondelete="CASCADE")),
+    Column("filename", String(255)),
+    Column("summary", Text),
+    Column("key_factors", JSONB),
+    Column("recommendations", JSONB),
+    Column("data_points", Integer),
+    Column("text_insight", JSONB),
+    Column("visual_insight", JSONB),
+    _created_at(),
+    _history_index("analysis_results", "filename", "data_points"),
+)
+
+forecast_results = Table(
+    "forecast_results", metadata,
+    _uuid_pk(),
+    _user_fk(),
+    Column("analysis_id", UUID(as_uuid=False), ForeignKey("analysis_results.id", ondelete="CASCADE")),
+    Column("forecast_days", Integer),
+    Column("forecast_data", JSONB),
+    _partition_key(),
+    *_archive_columns(),
+    _history_index("forecast_results", "analysis_id", "forecast_days"),
+    postgresql_partition_by="RANGE (created_at)",
+)
+
+explanation_results = Table(
+    "explanation_results", metadata,
+    _uuid_pk(),
+    _user_fk(),
+    Column("analysis_id", UUID(as_uuid=False), ForeignKey("analysis_results.id", ondelete="CASCADE")),
+    Column("feature_importance", JSONB),
+    Column("shap_values", JSONB),
+    _partition_key(),
+    *_archive_columns(),
+    _history_index("explanation_results", "analysis_id"),
+    postgresql_partition_by="RANGE (created_at)",
+)
+
+revoked_tokens = Table(
+    "revoked_tokens", metadata,
+    Column("jti", String(64), primary_key=True),
+    _user_fk(),
+    Column("expires_at", DateTime(timezone=True), nullable=False),
+    Column("revoked_at", DateTime(timezone=True), server_default=text("NOW()")),
+    Index("idx_revoked_tokens_expires_at", "expires_at"),
+    Index("idx_revoked_tokens_revoked_at", "revoked_at"),
+)
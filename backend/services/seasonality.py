@@ -0,0 +1,77 @@
+import numpy as np
+from typing import Dict, List, Any
+
+# Days since the Unix epoch for the fixed evaluation grids.
+# 1970-01-05 is a Monday, so index 0 of the weekly grid matches pandas' dayofweek.
+_WEEK_START = 4
+_YEAR_START_365 = 19358  # 2023-01-01
+_YEAR_START_366 = 19723  # 2024-01-01
+
+_MONTH_LENGTHS_365 = [31, 28, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31]
+_MONTH_LENGTHS_366 = [31, 29, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31]
+
+RESOLUTIONS = ("daily", "weekly", "monthly")
+
+def fourier_features(t: np.ndarray, period: float, order: int) -> np.ndarray:
+    """
+    Fourier design matrix in Prophet's column order (sin, cos per harmonic).
+    t is measured in days since the epoch.
+    """
+    angles = 2.0 * np.pi * np.outer(t, np.arange(1, order + 1)) / period
+    features = np.empty((len(t), 2 * order))
+    features[:, 0::2] = np.sin(angles)
+    features[:, 1::2] = np.cos(angles)
+    return features
+
+def seasonal_component(model: Any, name: str, t: np.ndarray) -> np.ndarray:
+    """
+    Evaluate a fitted Prophet seasonality in closed form at times t.
+
+    Uses the posterior-mean Fourier coefficients, matching the component
+    column Prophet would produce from predict().
+    """
+    spec = model.seasonalities[name]
+    mask = model.train_component_cols[name].to_numpy().astype(bool)
+    beta = np.nanmean(np.atleast_2d(model.params["beta"]), axis=0)[mask]
+    values = fourier_features(t, spec["period"], spec["fourier_order"]) @ beta
+    if name in model.component_modes["additive"]:
+        values = values * model.y_scale
+    return values
+
+def compute_seasonal_profile(model: Any) -> Dict[str, np.ndarray]:
+    """
+    Evaluate the weekly and yearly seasonalities of a fitted model on fixed
+    grids: 7 weekdays, and the days of a common (yearly_365) and a leap year
+    (yearly_366). The result is meant to be computed once and cached with the model.
+    """
+    profile: Dict[str, np.ndarray] = {}
+    seasonalities = getattr(model, "seasonalities", None) or {}
+    if "weekly" in seasonalities:
+        profile["weekly"] = seasonal_component(model, "weekly", _WEEK_START + np.arange(7, dtype=float))
+    if "yearly" in seasonalities:
+        grid = np.concatenate([
+            _YEAR_START_365 + np.arange(365, dtype=float),
+            _YEAR_START_366 + np.arange(366, dtype=float)
+        ])
+        yearly = seasonal_component(model, "yearly", grid)
+        profile["yearly_365"] = yearly[:365]
+        profile["yearly_366"] = yearly[365:]
+    return profile
+
+def bucket_yearly(yearly: np.ndarray, resolution: str = "daily") -> List[float]:
+    """
+    Aggregate a day-of-year pattern to daily, weekly (52 buckets) or monthly
+    (12 buckets) resolution.
+    """
+    if resolution == "daily":
+        return yearly.tolist()
+    if resolution == "weekly":
+        buckets = np.minimum(np.arange(len(yearly)) // 7, 51)
+    elif resolution == "monthly":
+        lengths = _MONTH_LENGTHS_366 if len(yearly) == 366 else _MONTH_LENGTHS_365
+        buckets = np.repeat(np.arange(12), lengths)
+    else:
+        raise ValueError(f"Unsupported resolution: {resolution}")
+    sums = np.bincount(buckets, weights=yearly)
+    counts = np.bincount(buckets)
+    return (sums / counts).tolist()
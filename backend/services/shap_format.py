@@ -0,0 +1,139 @@
+import base64
+import numpy as np
+from typing import Dict, List, Any, Optional
+
+# Compact explanation layout stored in explanation_results.shap_values:
+# feature names once, values and SHAP values as base64-encoded 2-D arrays
+# (float32, or per-feature scaled int16/int8), plus precomputed chart summaries.
+FORMAT_VERSION = "matrix-v1"
+QUANTIZATIONS = ("int16", "int8")
+SUMMARY_BINS = 20
+
+def encode_matrix(array: np.ndarray, quantize: Optional[str] = None) -> Dict[str, Any]:
+    """Encode a 2-D array as little-endian bytes in base64, optionally quantized per column"""
+    array = np.asarray(array, dtype=np.float32)
+    encoded: Dict[str, Any] = {"shape": list(array.shape)}
+    if quantize is None:
+        encoded["dtype"] = "float32"
+        data = array.astype("<f4")
+    elif quantize in QUANTIZATIONS:
+        dtype = np.dtype(quantize).newbyteorder("<")
+        limit = np.iinfo(dtype).max
+        max_abs = np.abs(array).max(axis=0) if array.size else np.zeros(array.shape[1:])
+        scale = np.where(max_abs > 0, max_abs / limit, 1.0).astype(np.float32)
+        encoded["dtype"] = quantize
+        encoded["scale"] = scale.tolist()
+        data = np.round(array / scale).astype(dtype)
+    else:
+        raise ValueError(f"Unsupported quantization: {quantize}")
+    encoded["data"] = base64.b64encode(data.tobytes()).decode("ascii")
+    return encoded
+
+def decode_matrix(encoded: Dict[str, Any]) -> np.ndarray:
+    """Inverse of encode_matrix (quantized arrays are rescaled to float32)"""
+    dtype = np.dtype(encoded["dtype"]).newbyteorder("<")
+    array = np.frombuffer(base64.b64decode(encoded["data"]), dtype=dtype).reshape(encoded["shape"])
+    if "scale" in encoded:
+        return array.astype(np.float32) * np.asarray(encoded["scale"], dtype=np.float32)
+    return array.astype(np.float32)
+
+def _bin_per_column(matrix: np.ndarray, bins: int) -> np.ndarray:
+    """Equal-width bin index (0..bins-1) of every cell within its own column"""
+    lo = matrix.min(axis=0)
+    span = matrix.max(axis=0) - lo
+    span = np.where(span > 0, span, 1.0)
+    return np.minimum(((matrix - lo) / span * bins).astype(np.int64), bins - 1)
+
+def _per_bin(bin_index: np.ndarray, weights: Optional[np.ndarray], bins: int) -> np.ndarray:
+    """Sum weights (or count) per (feature, bin) in one bincount over all columns"""
+    n_features = bin_index.shape[1]
+    flat = (bin_index + np.arange(n_features) * bins).ravel()
+    counts = np.bincount(flat, weights=None if weights is None else weights.ravel(), minlength=n_features * bins)
+    return counts.reshape(n_features, bins)
+
+def summarize(values: np.ndarray, shap_values: np.ndarray, bins: int = SUMMARY_BINS) -> Dict[str, Any]:
+    """
+    Aggregates behind the standard charts, computed for all features at once:
+    - mean_abs: global importance (mean |SHAP|)
+    - beeswarm: SHAP histogram per feature with the mean normalized feature
+      value in each bin (for colouring)
+    - dependence: mean and spread of SHAP over feature-value quantile bins
+    """
+    n_rows, n_features = shap_values.shape
+    if n_rows == 0:
+        return {"mean_abs": [0.0] * n_features, "beeswarm": [], "dependence": []}
+
+    # Beeswarm: bin SHAP values per feature, colour by normalized feature value
+    shap_bins = _bin_per_column(shap_values, bins)
+    counts = _per_bin(shap_bins, None, bins)
+    value_range = values.max(axis=0) - values.min(axis=0)
+    normalized = (values - values.min(axis=0)) / np.where(value_range > 0, value_range, 1.0)
+    color = _per_bin(shap_bins, normalized, bins) / np.maximum(counts, 1)
+    shap_lo, shap_hi = shap_values.min(axis=0), shap_values.max(axis=0)
+
+    # Dependence: quantile bins of the feature value via per-column ranks
+    ranks = np.argsort(np.argsort(values, axis=0, kind="stable"), axis=0)
+    value_bins = np.minimum(ranks * bins // n_rows, bins - 1)
+    dep_counts = _per_bin(value_bins, None, bins)
+    dep_shap = _per_bin(value_bins, shap_values, bins) / np.maximum(dep_counts, 1)
+    dep_value = _per_bin(value_bins, values, bins) / np.maximum(dep_counts, 1)
+    dep_sq = _per_bin(value_bins, shap_values ** 2, bins) / np.maximum(dep_counts, 1)
+    dep_std = np.sqrt(np.maximum(dep_sq - dep_shap ** 2, 0.0))
+
+    def rounded(array: np.ndarray) -> List:
+        return np.round(array, 6).tolist()
+
+    return {
+        "mean_abs": rounded(np.abs(shap_values).mean(axis=0)),
+        "beeswarm": [
+            {
+                "shap_min": float(shap_lo[j]),
+                "shap_max": float(shap_hi[j]),
+                "counts": counts[j].astype(int).tolist(),
+                "value_mean": rounded(color[j])
+            }
+            for j in range(n_features)
+        ],
+        "dependence": [
+            {
+                "value_mean": rounded(dep_value[j][dep_counts[j] > 0]),
+                "shap_mean": rounded(dep_shap[j][dep_counts[j] > 0]),
+                "shap_std": rounded(dep_std[j][dep_counts[j] > 0]),
+                "counts": dep_counts[j][dep_counts[j] > 0].astype(int).tolist()
+            }
+            for j in range(n_features)
+        ]
+    }
+
+def build_compact_explanation(
+    features: List[str],
+    values: np.ndarray,
+    shap_values: np.ndarray,
+    base_value: float,
+    quantize: Optional[str] = None,
+    impacts: Optional[List[str]] = None
+) -> Dict[str, Any]:
+    """Compact, storable explanation with summaries precomputed server-side"""
+    values = np.asarray(values, dtype=np.float64).reshape(-1, len(features))
+    shap_values = np.asarray(shap_values, dtype=np.float64).reshape(-1, len(features))
+    if impacts is None:
+        mean_shap = shap_values.mean(axis=0) if len(shap_values) else np.zeros(len(features))
+        impacts = ["positive" if m > 0 else "negative" if m < 0 else "variable" for m in mean_shap]
+    return {
+        "format": FORMAT_VERSION,
+        "features": features,
+        "base_value": float(base_value),
+        "n_samples": int(len(shap_values)),
+        "values": encode_matrix(values, quantize),
+        "shap_values": encode_matrix(shap_values, quantize),
+        "summaries": summarize(values, shap_values),
+        "summary": {
+            "total_features": len(features),
+            "positive_features": impacts.count("positive"),
+            "negative_features": impacts.count("negative")
+        }
+    }
+
+def without_matrices(compact: Dict[str, Any]) -> Dict[str, Any]:
+    """The explanation minus the raw matrices, for responses that only draw summary charts"""
+    return {k: v for k, v in compact.items() if k not in ("values", "shap_values")}
@@ -0,0 +1,104 @@
+import asyncio
+import functools
+import hashlib
+import os
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional, Tuple
+from services.cache import TTLCache
+
+# Identical requests arriving together (a dashboard firing the same forecast
+# twice) share one computation, and one stored row, instead of each running
+# its own. Keys are per process: duplicates landing on different workers
+# still run separately.
+IDEMPOTENCY_CACHE_SIZE = int(os.getenv("IDEMPOTENCY_CACHE_SIZE", "10000"))
+IDEMPOTENCY_TTL_SECONDS = int(os.getenv("IDEMPOTENCY_TTL_SECONDS", "86400"))
+
+class SingleFlight:
+    """Runs one computation per key at a time; concurrent callers with the same key share its result"""
+
+    def __init__(self):
+        self._inflight: Dict[Hashable, asyncio.Task] = {}
+        self.started = 0
+        self.coalesced = 0
+
+    async def run(self, key: Hashable, func: Callable[[], Awaitable[Any]]) -> Any:
+        task = self._inflight.get(key)
+        if task is None:
+            # A task of its own, so the callers still waiting are unaffected
+            # if the one that started it disconnects
+            task = asyncio.ensure_future(func())
+            self._inflight[key] = task
+            task.add_done_callback(functools.partial(self._done, key))
+            self.started += 1
+        else:
+            self.coalesced += 1
+        return await asyncio.shield(task)
+
+    def _done(self, key: Hashable, task: asyncio.Task) -> None:
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        if not task.cancelled():
+            # Raised to the waiting callers; retrieved here so an exception
+            # nobody waited for is not reported as unhandled
+            task.exception()
+
+    def stats(self) -> Dict[str, Any]:
+        return {"in_flight": len(self._inflight), "started": self.started, "coalesced": self.coalesced}
+
+single_flight = SingleFlight()
+
+def flight_key(user_id: str, endpoint: str, params: Dict[str, Any], data_fingerprint: Optional[str]) -> Hashable:
+    """Key of a request: the same parameters on the same data share a computation"""
+    return (user_id, endpoint, tuple(sorted(params.items())), data_fingerprint)
+
+def request_fingerprint(*parts: Optional[bytes]) -> str:
+    """Hash of a request's payload, to tell a retry from a different request reusing its key"""
+    digest = hashlib.sha256()
+    for part in parts:
+        data = part or b""
+        digest.update(len(data).to_bytes(8, "big"))
+        digest.update(data)
+    return digest.hexdigest()
+
+class IdempotencyConflict(Exception):
+    """An idempotency key reused for a different request"""
+
+# Completed results by (user, endpoint, idempotency key), with the payload fingerprint
+_completed = TTLCache(maxsize=IDEMPOTENCY_CACHE_SIZE, ttl=IDEMPOTENCY_TTL_SECONDS)
+_running: Dict[Hashable, str] = {}
+_replayed = 0
+
+async def run_idempotent(
+    user_id: str,
+    endpoint: str,
+    idempotency_key: str,
+    fingerprint: str,
+    func: Callable[[], Awaitable[Any]]
+) -> Tuple[Any, bool]:
+    """
+    Result of func for a client idempotency key, and whether it was replayed:
+    a retry with the same key gets the stored result, or waits for the run in
+    progress, instead of running again. Failed runs are not stored.
+    """
+    global _replayed
+    key = (user_id, endpoint, idempotency_key)
+    stored = _completed.get(key)
+    if stored is not None:
+        if stored[0] != fingerprint:
+            raise IdempotencyConflict("Idempotency key was already used for a different request")
+        _replayed += 1
+        return stored[1], True
+    if _running.get(key, fingerprint) != fingerprint:
+        raise IdempotencyConflict("Idempotency key is in use by a different request")
+    _running[key] = fingerprint
+
+    async def run_once():
+        try:
+            result = await func()
+            _completed.set(key, (fingerprint, result))
+            return result
+        finally:
+            _running.pop(key, None)
+    return await single_flight.run(("idempotency",) + key, run_once), False
+
+def single_flight_stats() -> Dict[str, Any]:
+    return {**single_flight.stats(), "idempotent_replays": _replayed, "idempotency_keys": len(_completed)}
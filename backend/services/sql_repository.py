@@ -0,0 +1,291 @@
+import os
+import re
+from datetime import date, datetime, timezone
+from typing import Any, Dict, List, Optional, Tuple
+from sqlalchemy import DateTime, Table, bindparam, delete, func, literal, null, select, text, tuple_, update
+from sqlalchemy.exc import DataError, IntegrityError
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncEngine, create_async_engine
+from services.repository import Repository, RepositoryError
+from services.schema import analysis_results, metadata, revoked_tokens, users
+
+# Direct Postgres backend (DATA_BACKEND=postgres): the same queries as the
+# REST repository over a pooled asyncpg engine. Statements are built once
+# with bind parameters, so each pooled connection prepares them on first use
+# and reuses the plan afterwards.
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+DB_POOL_RECYCLE_SECONDS = int(os.getenv("DB_POOL_RECYCLE_SECONDS", "1800"))
+# Prepared statements cached per connection; set to 0 behind a transaction-mode
+# pooler (e.g. Supabase's port 6543), which cannot keep them across transactions
+DB_STATEMENT_CACHE_SIZE = int(os.getenv("DB_STATEMENT_CACHE_SIZE", "256"))
+
+def async_database_url(url: str) -> str:
+    """postgres:// or postgresql:// URL with the asyncpg driver"""
+    for prefix in ("postgres://", "postgresql://", "postgresql+psycopg2://"):
+        if url.startswith(prefix):
+            return "postgresql+asyncpg://" + url[len(prefix):]
+    return url
+
+def create_engine(url: str) -> AsyncEngine:
+    statement_cache = {"prepared_statement_cache_size": DB_STATEMENT_CACHE_SIZE}
+    if DB_STATEMENT_CACHE_SIZE == 0:
+        statement_cache["statement_cache_size"] = 0
+    return create_async_engine(
+        async_database_url(url),
+        pool_size=DB_POOL_SIZE,
+        max_overflow=DB_MAX_OVERFLOW,
+        pool_recycle=DB_POOL_RECYCLE_SECONDS,
+        pool_pre_ping=True,
+        connect_args=statement_cache
+    )
+
+def _to_datetime(value: Any, aware: bool) -> Any:
+    # PostgREST accepts ISO strings and our callers pass them (or Unix
+    # timestamps, e.g. Stripe's "created"); asyncpg needs datetimes
+    if isinstance(value, (int, float)):
+        value = datetime.fromtimestamp(value, tz=timezone.utc)
+    elif isinstance(value, str):
+        value = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    if isinstance(value, datetime) and not aware and value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+def _coerce(table: Table, values: Dict[str, Any]) -> Dict[str, Any]:
+    """Keep known columns, converting timestamp values for asyncpg"""
+    coerced = {}
+    for name, value in values.items():
+        if name not in table.c:
+            continue
+        column_type = table.c[name].type
+        if value is not None and isinstance(column_type, DateTime):
+            value = _to_datetime(value, bool(column_type.timezone))
+        coerced[name] = value
+    return coerced
+
+# Monthly partitions as created by ensure_monthly_partition(), e.g. forecast_results_y2024m01
+_MONTHLY_PARTITION = re.compile(r"_y(\d{4})m(\d{2})$")
+
+def _json_row(row) -> Dict[str, Any]:
+    # Same shapes as PostgREST returns: timestamps as ISO strings
+    return {
+        key: value.isoformat() if isinstance(value, (datetime, date)) else value
+        for key, value in row._mapping.items()
+    }
+
+class SqlRepository(Repository):
+    """
+    Repository over a direct Postgres connection pool. Auth still goes
+    through Supabase (GoTrue), via the REST repository passed as auth.
+    """
+
+    def __init__(self, database_url: str, auth: Repository, engine: Optional[AsyncEngine] = None):
+        self.auth = auth
+        self.engine = engine or create_engine(database_url)
+        self._projections: Dict[Tuple, Any] = {}
+        self._get_user = select(users).where(users.c.id == bindparam("user_id"))
+        self._update_users_by_customer = update(users).where(users.c.stripe_customer_id == bindparam("customer_id"))
+        self._token_revoked = select(revoked_tokens.c.jti).where(revoked_tokens.c.jti == bindparam("jti"))
+
+    async def _fetch(self, statement, params: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+        async with self.engine.connect() as conn:
+            result = await conn.execute(statement, params or {})
+            return [_json_row(row) for row in result]
+
+    async def _execute(self, statement, params: Optional[Any] = None):
+        async with self.engine.begin() as conn:
+            return await conn.execute(statement, params or {})
+
+    async def _insert_returning_id(self, table: Table, row: Dict[str, Any]) -> Optional[str]:
+        async with self.engine.begin() as conn:
+            result = await conn.execute(insert(table).returning(table.c.id), _coerce(table, row))
+            return result.scalar_one_or_none()
+
+    def _analysis_projection(self, columns: str, bulk: bool = False):
+        """Statement selecting only the requested columns, built once per column list"""
+        key = ("analysis_results", columns, bulk)
+        statement = self._projections.get(key)
+        if statement is None:
+            selected = list(analysis_results.c) if columns == "*" else [analysis_results.c[name.strip()] for name in columns.split(",")]
+            # An expanding parameter renders as one placeholder per ID
+            by_id = analysis_results.c.id.in_(bindparam("analysis_ids", expanding=True)) if bulk else analysis_results.c.id == bindparam("analysis_id")
+            statement = select(*selected).where(by_id, analysis_results.c.user_id == bindparam("user_id"))
+            self._projections[key] = statement
+        return statement
+
+    # Auth
+    async def sign_in(self, email: str, password: str) -> Optional[Dict[str, Any]]:
+        return await self.auth.sign_in(email, password)
+
+    async def sign_up(self, email: str, password: str, metadata: Optional[Dict[str, Any]] = None) -> Optional[Dict[str, Any]]:
+        return await self.auth.sign_up(email, password, metadata)
+
+    # Users
+    async def get_user(self, user_id: str) -> Optional[Dict[str, Any]]:
+        rows = await self._fetch(self._get_user, {"user_id": user_id})
+        return rows[0] if rows else None
+
+    async def create_user(self, profile: Dict[str, Any]) -> None:
+        await self._execute(insert(users).on_conflict_do_nothing(index_elements=[users.c.id]), _coerce(users, profile))
+
+    async def update_users_by_customer(self, customer_id: str, fields: Dict[str, Any]) -> None:
+        await self._execute(self._update_users_by_customer.values(**_coerce(users, fields)), {"customer_id": customer_id})
+
+    # Analyses
+    async def create_analysis(self, row: Dict[str, Any]) -> Optional[str]:
+        return await self._insert_returning_id(analysis_results, row)
+
+    async def get_analysis(self, analysis_id: str, user_id: str, columns: str = "*") -> Optional[Dict[str, Any]]:
+        rows = await self._fetch(self._analysis_projection(columns), {"analysis_id": analysis_id, "user_id": user_id})
+        return rows[0] if rows else None
+
+    async def get_analyses(self, analysis_ids: List[str], user_id: str, columns: str = "*") -> List[Dict[str, Any]]:
+        return await self._fetch(self._analysis_projection(columns, bulk=True), {"analysis_ids": list(analysis_ids), "user_id": user_id})
+
+    def _history_statement(self, table: str, columns: str, paged: bool):
+        key = (table, columns, paged)
+        statement = self._projections.get(key)
+        if statement is None:
+            target = metadata.tables[table]
+            statement = select(*[target.c[name.strip()] for name in columns.split(",")]).where(target.c.user_id == bindparam("user_id"))
+            if paged:
+                # Row-value comparison, so the composite index serves the seek
+                statement = statement.where(
+                    tuple_(target.c.created_at, target.c.id) < tuple_(bindparam("created_at", type_=DateTime()), bindparam("row_id", type_=target.c.id.type))
+                )
+            statement = statement.order_by(target.c.created_at.desc(), target.c.id.desc()).limit(bindparam("limit"))
+            self._projections[key] = statement
+        return statement
+
+    async def history(
+        self,
+        table: str,
+        columns: str,
+        user_id: str,
+        before: Optional[Tuple[str, str]],
+        limit: int
+    ) -> List[Dict[str, Any]]:
+        params: Dict[str, Any] = {"user_id": user_id, "limit": limit}
+        if before is not None:
+            params["created_at"] = _to_datetime(before[0], False)
+            params["row_id"] = before[1]
+        return await self._fetch(self._history_statement(table, columns, before is not None), params)
+
+    async def insert_rows(self, table: str, rows: List[Dict[str, Any]]) -> None:
+        target = metadata.tables[table]
+        try:
+            await self._execute(
+                insert(target).on_conflict_do_nothing(index_elements=list(target.primary_key.columns)),
+                [_coerce(target, row) for row in rows]
+            )
+        except (IntegrityError, DataError) as e:
+            # Reported like PostgREST's 4xx: the rows, not the connection, are the problem
+            raise RepositoryError(400, str(e.orig))
+
+    async def get_result(self, table: str, result_id: str, user_id: str) -> Optional[Dict[str, Any]]:
+        target = metadata.tables[table]
+        rows = await self._fetch(select(target).where(target.c.id == result_id, target.c.user_id == user_id).limit(1))
+        return rows[0] if rows else None
+
+    # Retention
+    async def aging_rows(
+        self,
+        table: str,
+        columns: str,
+        older_than: str,
+        after: Optional[Tuple[str, str]],
+        limit: int,
+        unarchived_only: bool = False
+    ) -> List[Dict[str, Any]]:
+        target = metadata.tables[table]
+        statement = select(*[target.c[name.strip()] for name in columns.split(",")]).where(target.c.created_at < _to_datetime(older_than, False))
+        if unarchived_only:
+            statement = statement.where(target.c.archived_at.is_(None))
+        if after is not None:
+            statement = statement.where(tuple_(target.c.created_at, target.c.id) > tuple_(literal(_to_datetime(after[0], False), DateTime()), literal(after[1], target.c.id.type)))
+        return await self._fetch(statement.order_by(target.c.created_at, target.c.id).limit(limit))
+
+    async def results_by_id(self, table: str, result_ids: List[str], columns: str = "*") -> List[Dict[str, Any]]:
+        target = metadata.tables[table]
+        selected = list(target.c) if columns == "*" else [target.c[name.strip()] for name in columns.split(",")]
+        return await self._fetch(select(*selected).where(target.c.id.in_(result_ids)))
+
+    async def user_plans(self, user_ids: List[str]) -> Dict[str, Optional[str]]:
+        rows = await self._fetch(select(users.c.id, users.c.plan).where(users.c.id.in_(user_ids)))
+        return {row["id"]: row["plan"] for row in rows}
+
+    async def mark_archived(self, table: str, archive_keys: Dict[str, str], blob_columns: Tuple[str, ...], archived_at: str) -> None:
+        if not archive_keys:
+            return
+        target = metadata.tables[table]
+        statement = update(target).where(target.c.id == bindparam("row_id")).values(
+            archived_at=_to_datetime(archived_at, False),
+            archive_key=bindparam("key"),
+            **{column: null() for column in blob_columns}
+        )
+        await self._execute(statement, [{"row_id": row_id, "key": key} for row_id, key in archive_keys.items()])
+
+    async def delete_results(self, table: str, result_ids: List[str]) -> None:
+        target = metadata.tables[table]
+        await self._execute(delete(target).where(target.c.id.in_(result_ids)))
+
+    async def ensure_partitions(self, table: str, months: List[date]) -> List[str]:
+        metadata.tables[table]  # only known tables
+        async with self.engine.begin() as conn:
+            # Serializes partition DDL between processes running the retention job
+            await conn.execute(select(func.pg_advisory_xact_lock(func.hashtext("ensure_monthly_partition"))))
+            created = []
+            for month in months:
+                name = (await conn.execute(select(func.ensure_monthly_partition(table, month)))).scalar_one()
+                if name is not None:
+                    created.append(name)
+            return created
+
+    async def drop_partitions_before(self, table: str, month: date) -> Dict[str, int]:
+        metadata.tables[table]
+        dropped = {}
+        async with self.engine.begin() as conn:
+            partitions = await conn.execute(text(
+                "SELECT c.relname, pg_total_relation_size(c.oid) FROM pg_inherits i "
+                "JOIN pg_class c ON c.oid = i.inhrelid WHERE i.inhparent = CAST(:parent AS regclass)"
+            ), {"parent": table})
+            for name, size in partitions.all():
+                match = _MONTHLY_PARTITION.search(name)
+                if match and date(int(match.group(1)), int(match.group(2)), 1) < month:
+                    await conn.execute(text(f'DROP TABLE "{name}"'))
+                    dropped[name] = size
+        return dropped
+
+    async def table_size(self, table: str) -> int:
+        metadata.tables[table]
+        rows = await self._fetch(text(
+            "SELECT COALESCE(SUM(pg_total_relation_size(relid)), 0) AS size FROM pg_partition_tree(CAST(:table AS regclass))"
+        ), {"table": table})
+        return int(rows[0]["size"])
+
+    # Revoked tokens
+    async def add_revoked_token(self, jti: str, user_id: Optional[str], expires_at: str, revoked_at: str) -> None:
+        await self._execute(insert(revoked_tokens).on_conflict_do_nothing(), _coerce(revoked_tokens, {
+            "jti": jti,
+            "user_id": user_id,
+            "expires_at": expires_at,
+            "revoked_at": revoked_at
+        }))
+
+    async def is_token_revoked(self, jti: str) -> bool:
+        return bool(await self._fetch(self._token_revoked, {"jti": jti}))
+
+    async def revoked_token_ids(self, expires_after: Optional[str] = None, revoked_since: Optional[str] = None) -> List[str]:
+        statement = select(revoked_tokens.c.jti)
+        if expires_after is not None:
+            statement = statement.where(revoked_tokens.c.expires_at > _to_datetime(expires_after, True))
+        if revoked_since is not None:
+            statement = statement.where(revoked_tokens.c.revoked_at >= _to_datetime(revoked_since, True))
+        return [row["jti"] for row in await self._fetch(statement)]
+
+    async def purge_revoked_tokens(self, expired_before: str) -> None:
+        await self._execute(delete(revoked_tokens).where(revoked_tokens.c.expires_at < _to_datetime(expired_before, True)))
+
+    async def close(self) -> None:
+        await self.engine.dispose()
+        await self.auth.close()
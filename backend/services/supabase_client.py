@@ -1,35 +0,0 @@
-from supabase import create_client, Client
-import os
-from typing import Optional
-
-_supabase_client: Optional[Client] = None
-
-def get_supabase_client() -> Client:
-    """
-    Get Supabase client instance (singleton pattern)
-    """
-    global _supabase_client
-    
-    if _supabase_client is None:
-        url = os.getenv("SUPABASE_URL")
-        key = os.getenv("SUPABASE_ANON_KEY")
-        
-        if not url or not key:
-            raise ValueError("SUPABASE_URL and SUPABASE_ANON_KEY must be set")
-        
-        _supabase_client = create_client(url, key)
-    
-    return _supabase_client
-
-def get_supabase_admin_client() -> Client:
-    """
-    Get Supabase admin client with service role key
-    """
-    url = os.getenv("SUPABASE_URL")
-    service_key = os.getenv("SUPABASE_SERVICE_ROLE_KEY")
-    
-    if not url or not service_key:
-        raise ValueError("SUPABASE_URL and SUPABASE_SERVICE_ROLE_KEY must be set")
-    
-    return create_client(url, service_key)
-
@@ -0,0 +1,170 @@
+import asyncio
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+# Verified Stripe events are persisted in a local SQLite queue and the webhook
+# acknowledges immediately; a background consumer applies them. The queue
+# deduplicates redeliveries by event ID and keeps retry state across restarts.
+STRIPE_EVENT_QUEUE_PATH = os.getenv("STRIPE_EVENT_QUEUE_PATH", "data/stripe_events.sqlite3")
+STRIPE_QUEUE_POLL_SECONDS = float(os.getenv("STRIPE_QUEUE_POLL_SECONDS", "1.0"))
+STRIPE_QUEUE_BATCH_SIZE = int(os.getenv("STRIPE_QUEUE_BATCH_SIZE", "500"))
+STRIPE_QUEUE_MAX_ATTEMPTS = int(os.getenv("STRIPE_QUEUE_MAX_ATTEMPTS", "8"))
+# Processed event IDs are kept this long to recognise Stripe redeliveries (Stripe retries for up to 3 days)
+STRIPE_QUEUE_RETENTION_DAYS = int(os.getenv("STRIPE_QUEUE_RETENTION_DAYS", "7"))
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS stripe_events (
+    event_id TEXT PRIMARY KEY,
+    event_type TEXT NOT NULL,
+    customer_id TEXT,
+    created INTEGER NOT NULL,
+    payload TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_attempt_at REAL NOT NULL DEFAULT 0,
+    last_error TEXT,
+    received_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_stripe_events_pending ON stripe_events(status, customer_id, created);
+"""
+
+_lock = threading.Lock()
+_initialized_path: Optional[str] = None
+_wakeup: Optional[asyncio.Event] = None
+
+def _connect() -> sqlite3.Connection:
+    global _initialized_path
+    directory = os.path.dirname(STRIPE_EVENT_QUEUE_PATH)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    conn = sqlite3.connect(STRIPE_EVENT_QUEUE_PATH, timeout=10)
+    if _initialized_path != STRIPE_EVENT_QUEUE_PATH:
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.executescript(_SCHEMA)
+        _initialized_path = STRIPE_EVENT_QUEUE_PATH
+    return conn
+
+def enqueue_event(event_id: str, event_type: str, customer_id: Optional[str], created: int, payload: Dict[str, Any]) -> bool:
+    """Persist an event for processing; False if this event ID was already received"""
+    with _lock:
+        conn = _connect()
+        try:
+            with conn:
+                cursor = conn.execute(
+                    "INSERT OR IGNORE INTO stripe_events (event_id, event_type, customer_id, created, payload, received_at) "
+                    "VALUES (?, ?, ?, ?, ?, ?)",
+                    (event_id, event_type, customer_id, int(created), json.dumps(payload, default=str), time.time())
+                )
+            inserted = cursor.rowcount == 1
+        finally:
+            conn.close()
+    if inserted and _wakeup is not None:
+        _wakeup.set()
+    return inserted
+
+def _pending_batch(now: float) -> Dict[Optional[str], List[sqlite3.Row]]:
+    """
+    Pending events grouped by customer, oldest first. A customer whose oldest
+    pending event is still backing off is skipped entirely, so later events
+    never overtake an earlier one.
+    """
+    with _lock:
+        conn = _connect()
+        conn.row_factory = sqlite3.Row
+        try:
+            rows = conn.execute(
+                "SELECT * FROM stripe_events WHERE status = 'pending' ORDER BY created, received_at LIMIT ?",
+                (STRIPE_QUEUE_BATCH_SIZE,)
+            ).fetchall()
+        finally:
+            conn.close()
+    groups: Dict[Optional[str], List[sqlite3.Row]] = {}
+    for row in rows:
+        groups.setdefault(row["customer_id"], []).append(row)
+    return {customer: events for customer, events in groups.items() if events[0]["next_attempt_at"] <= now}
+
+def _mark(event_ids: List[str], status: str, error: Optional[str] = None) -> None:
+    with _lock:
+        conn = _connect()
+        try:
+            with conn:
+                if status == "done":
+                    conn.executemany("UPDATE stripe_events SET status = 'done', last_error = NULL WHERE event_id = ?", [(e,) for e in event_ids])
+                else:
+                    # Exponential backoff per attempt; give up after STRIPE_QUEUE_MAX_ATTEMPTS
+                    for event_id in event_ids:
+                        conn.execute(
+                            "UPDATE stripe_events SET attempts = attempts + 1, last_error = ?, "
+                            "next_attempt_at = ? + min(3600, 2 * (1 << attempts)), "
+                            "status = CASE WHEN attempts + 1 >= ? THEN 'failed' ELSE 'pending' END "
+                            "WHERE event_id = ?",
+                            (error, time.time(), STRIPE_QUEUE_MAX_ATTEMPTS, event_id)
+                        )
+        finally:
+            conn.close()
+
+def purge_processed() -> int:
+    """Drop processed events past the redelivery window"""
+    cutoff = time.time() - STRIPE_QUEUE_RETENTION_DAYS * 86400
+    with _lock:
+        conn = _connect()
+        try:
+            with conn:
+                return conn.execute("DELETE FROM stripe_events WHERE status = 'done' AND received_at < ?", (cutoff,)).rowcount
+        finally:
+            conn.close()
+
+# apply(customer_id, events) writes one customer's events
+EventApplier = Callable[[Optional[str], List[Dict[str, Any]]], Awaitable[None]]
+
+async def process_pending(apply: EventApplier) -> int:
+    """
+    Apply all due events. apply(customer_id, events) receives each customer's
+    events in order and should write them as one coalesced update; if it
+    raises, those events are retried later. Returns the number of events applied.
+    """
+    applied = 0
+    batch = await asyncio.to_thread(_pending_batch, time.time())
+    for customer_id, rows in batch.items():
+        event_ids = [row["event_id"] for row in rows]
+        try:
+            await apply(customer_id, [json.loads(row["payload"]) for row in rows])
+        except Exception as e:
+            print(f"Error applying Stripe events for customer {customer_id}: {e}")
+            await asyncio.to_thread(_mark, event_ids, "retry", str(e))
+            continue
+        await asyncio.to_thread(_mark, event_ids, "done")
+        applied += len(rows)
+    return applied
+
+async def run_consumer(apply: EventApplier) -> None:
+    """Background task: apply queued events as they arrive (and at least every poll interval)"""
+    global _wakeup
+    _wakeup = asyncio.Event()
+    last_purge = 0.0
+    while True:
+        try:
+            await process_pending(apply)
+            if time.time() - last_purge > 3600:
+                await asyncio.to_thread(purge_processed)
+                last_purge = time.time()
+        except Exception as e:
+            print(f"Stripe event consumer error: {e}")
+        try:
+            await asyncio.wait_for(_wakeup.wait(), timeout=STRIPE_QUEUE_POLL_SECONDS)
+        except asyncio.TimeoutError:
+            pass
+        _wakeup.clear()
+
+def queue_stats() -> Dict[str, int]:
+    with _lock:
+        conn = _connect()
+        try:
+            counts = dict(conn.execute("SELECT status, count(*) FROM stripe_events GROUP BY status").fetchall())
+        finally:
+            conn.close()
+    return {status: counts.get(status, 0) for status in ("pending", "done", "failed")}
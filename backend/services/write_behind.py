@@ -0,0 +1,208 @@
+import asyncio
+import json
+import os
+import secrets
+import threading
+import time
+import uuid
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+from services.repository import RepositoryError, get_repository
+
+# Result rows (analyses, forecasts, explanations) are not inserted on the
+# request path. They get a client-side UUIDv7 and are buffered, then inserted
+# in batches when WRITE_BEHIND_BATCH_SIZE rows are waiting or every
+# WRITE_BEHIND_FLUSH_SECONDS. Batches that cannot be written are appended to
+# spill files and replayed on later flushes; inserts ignore IDs that already
+# exist, so replays are idempotent. Rows the database rejects outright
+# (constraint or type errors) are moved to a .rejected.jsonl file instead of
+# blocking their table.
+RESULT_TABLES = ("analysis_results", "forecast_results", "explanation_results")
+WRITE_BEHIND_BATCH_SIZE = int(os.getenv("WRITE_BEHIND_BATCH_SIZE", "100"))
+WRITE_BEHIND_FLUSH_SECONDS = float(os.getenv("WRITE_BEHIND_FLUSH_SECONDS", "0.5"))
+WRITE_BEHIND_SPILL_DIR = os.getenv("WRITE_BEHIND_SPILL_DIR", "data/write_behind")
+
+_uuid7_lock = threading.Lock()
+_uuid7_last = (0, 0)
+
+def uuid7() -> str:
+    """
+    Time-ordered UUID (RFC 9562 version 7): 48-bit Unix milliseconds, then a
+    12-bit counter for IDs made in the same millisecond, then random bits
+    """
+    global _uuid7_last
+    with _uuid7_lock:
+        millis = time.time_ns() // 1_000_000
+        last_millis, counter = _uuid7_last
+        if millis <= last_millis:
+            millis, counter = last_millis, counter + 1
+            if counter > 0xFFF:
+                millis, counter = millis + 1, 0
+        else:
+            counter = secrets.randbits(8)
+        _uuid7_last = (millis, counter)
+    value = (millis << 80) | (0x7 << 76) | (counter << 64) | (0b10 << 62) | secrets.randbits(62)
+    return str(uuid.UUID(int=value))
+
+class WriteBehindWriter:
+    """Buffers result inserts and writes them in batches"""
+
+    def __init__(self, spill_dir: str = WRITE_BEHIND_SPILL_DIR):
+        self.spill_dir = spill_dir
+        self._buffers: Dict[str, List[Dict[str, Any]]] = {table: [] for table in RESULT_TABLES}
+        # Rows accepted but not yet confirmed written (buffered, in flight or spilled)
+        self._unconfirmed: Dict[str, Dict[str, Dict[str, Any]]] = {table: {} for table in RESULT_TABLES}
+        self._wakeup: Optional[asyncio.Event] = None
+        self._flush_lock: Optional[asyncio.Lock] = None
+        self.written = 0
+        self.batches = 0
+        self.spilled = 0
+        self.failures = 0
+        self.rejected = 0
+        self._load_spilled()
+
+    def _spill_path(self, table: str) -> str:
+        return os.path.join(self.spill_dir, f"{table}.jsonl")
+
+    def _read_spill(self, table: str) -> List[Dict[str, Any]]:
+        path = self._spill_path(table)
+        if not os.path.exists(path):
+            return []
+        rows = []
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if line:
+                    try:
+                        rows.append(json.loads(line))
+                    except ValueError:
+                        # A torn last line from a crash mid-write
+                        print(f"Skipping unreadable spilled {table} row")
+        return rows
+
+    def _load_spilled(self) -> None:
+        # Spilled rows from a previous run stay readable until they are replayed
+        for table in RESULT_TABLES:
+            for row in self._read_spill(table):
+                self._unconfirmed[table][row["id"]] = row
+
+    def _append(self, path: str, rows: List[Dict[str, Any]]) -> None:
+        os.makedirs(self.spill_dir, exist_ok=True)
+        with open(path, "a", encoding="utf-8") as f:
+            for row in rows:
+                f.write(json.dumps(row, default=str) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+    def _spill(self, table: str, rows: List[Dict[str, Any]]) -> None:
+        self._append(self._spill_path(table), rows)
+        self.spilled += len(rows)
+
+    def submit(self, table: str, row: Dict[str, Any]) -> str:
+        """Queue a row for insertion and return its ID"""
+        if table not in self._buffers:
+            raise ValueError(f"Not a write-behind table: {table}")
+        # created_at is set here, not by the database default, so history
+        # order matches request order however late the row is flushed
+        row = {**row, "id": row.get("id") or uuid7(), "created_at": row.get("created_at") or datetime.utcnow().isoformat()}
+        self._buffers[table].append(row)
+        self._unconfirmed[table][row["id"]] = row
+        if self._wakeup is not None and sum(len(rows) for rows in self._buffers.values()) >= WRITE_BEHIND_BATCH_SIZE:
+            self._wakeup.set()
+        return row["id"]
+
+    def pending(self, table: str, row_id: str) -> Optional[Dict[str, Any]]:
+        """A row accepted by submit that may not be in the database yet"""
+        return self._unconfirmed.get(table, {}).get(row_id)
+
+    def pending_rows(self, table: str, user_id: str) -> List[Dict[str, Any]]:
+        """A user's rows that may not be in the database yet"""
+        return [row for row in list(self._unconfirmed.get(table, {}).values()) if row.get("user_id") == user_id]
+
+    async def _insert(self, table: str, rows: List[Dict[str, Any]]) -> None:
+        repository = get_repository()
+        for start in range(0, len(rows), WRITE_BEHIND_BATCH_SIZE):
+            await repository.insert_rows(table, rows[start:start + WRITE_BEHIND_BATCH_SIZE])
+            self.batches += 1
+        self.written += len(rows)
+        for row in rows:
+            self._unconfirmed[table].pop(row["id"], None)
+
+    async def _write(self, table: str, rows: List[Dict[str, Any]]) -> None:
+        """Insert rows, isolating any the database rejects; raises on retryable errors"""
+        try:
+            await self._insert(table, rows)
+        except RepositoryError as e:
+            if not e.permanent:
+                raise
+            if len(rows) > 1:
+                for row in rows:
+                    await self._write(table, [row])
+                return
+            print(f"Rejected {table} row {rows[0]['id']}: {e}")
+            self._append(os.path.join(self.spill_dir, f"{table}.rejected.jsonl"), rows)
+            self._unconfirmed[table].pop(rows[0]["id"], None)
+            self.rejected += 1
+
+    async def flush(self) -> int:
+        """Replay spilled rows, then write buffered ones; returns rows written"""
+        if self._flush_lock is None:
+            self._flush_lock = asyncio.Lock()
+        written = self.written
+        async with self._flush_lock:
+            for table in RESULT_TABLES:
+                spilled = self._read_spill(table)
+                if spilled:
+                    try:
+                        await self._write(table, spilled)
+                        os.remove(self._spill_path(table))
+                    except Exception as e:
+                        self.failures += 1
+                        print(f"Replaying spilled {table} rows failed: {e}")
+
+                rows, self._buffers[table] = self._buffers[table], []
+                if not rows:
+                    continue
+                try:
+                    await self._write(table, rows)
+                except asyncio.CancelledError:
+                    # Shutting down mid-write: keep the rows (replays skip any already written)
+                    self._spill(table, rows)
+                    raise
+                except Exception as e:
+                    self.failures += 1
+                    print(f"Writing {len(rows)} {table} rows failed, spilling to disk: {e}")
+                    self._spill(table, rows)
+        return self.written - written
+
+    async def run(self) -> None:
+        """Background task: flush on the size threshold or the flush interval"""
+        self._wakeup = asyncio.Event()
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=WRITE_BEHIND_FLUSH_SECONDS)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            try:
+                await self.flush()
+            except Exception as e:
+                print(f"Write-behind flush error: {e}")
+
+    async def close(self) -> None:
+        """Final flush on shutdown; rows that cannot be written are spilled"""
+        self._wakeup = None
+        await self.flush()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "buffered": {table: len(rows) for table, rows in self._buffers.items()},
+            "unconfirmed": sum(len(rows) for rows in self._unconfirmed.values()),
+            "written": self.written,
+            "batches": self.batches,
+            "spilled": self.spilled,
+            "failures": self.failures,
+            "rejected": self.rejected
+        }
+
+result_writer = WriteBehindWriter()
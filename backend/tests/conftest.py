@@ -5,6 +5,8 @@ import json
 import base64
 import random
 import math
+import datetime
+import tempfile
 import pytest
 
 # Ensure backend package-relative imports (e.g., 'routers', 'services') resolve
@@ -22,13 +24,18 @@ os.environ.setdefault("SUPABASE_ANON_KEY", "anon_test_key")
 os.environ.setdefault("OPENAI_API_KEY", "sk-test")
 os.environ.setdefault("STRIPE_SECRET_KEY", "sk_test_123")
 os.environ.setdefault("STRIPE_WEBHOOK_SECRET", "whsec_test")
+os.environ.setdefault("DATASET_STORAGE_DIR", tempfile.mkdtemp(prefix="datasets-"))
+os.environ.setdefault("STRIPE_EVENT_QUEUE_PATH", os.path.join(tempfile.mkdtemp(prefix="stripe-events-"), "queue.sqlite3"))
+os.environ.setdefault("WRITE_BEHIND_SPILL_DIR", tempfile.mkdtemp(prefix="write-behind-"))
+os.environ.setdefault("RETENTION_ARCHIVE_DIR", tempfile.mkdtemp(prefix="archive-"))
+os.environ.setdefault("METRICS_TOKEN", "test-metrics-token")
 
 # Stub openai
 fake_openai = types.SimpleNamespace()
 
 class _FakeChatCompletion:
     @staticmethod
-    def create(model: str, messages, max_tokens: int, temperature: float):
+    def create(model: str, messages, max_tokens: int, temperature: float, request_timeout: float = None):
         class _Choice:
             def __init__(self):
                 self.message = types.SimpleNamespace(content="Test analysis output with positive sentiment")
@@ -37,79 +44,19 @@ class _FakeChatCompletion:
 fake_openai.ChatCompletion = _FakeChatCompletion
 sys.modules.setdefault("openai", fake_openai)
 
-# Stub supabase module so import in services.supabase_client succeeds
-fake_supabase_mod = types.ModuleType("supabase")
-class _SupabaseClient:  # placeholder for type annotation in code
-    pass
-def _fake_create_client(url, key):
-    return _SupabaseClient()
-fake_supabase_mod.create_client = _fake_create_client
-fake_supabase_mod.Client = _SupabaseClient
-sys.modules.setdefault("supabase", fake_supabase_mod)
-
-# Stub supabase client behavior used in code
-class _FakeAuth:
-    def sign_in_with_password(self, payload):
-        email = payload.get("email", "user@example.com")
-        return types.SimpleNamespace(user=types.SimpleNamespace(id="user_1", email=email, created_at="2023-01-01"))
-
-    def sign_up(self, payload):
-        email = payload.get("email", "user@example.com")
-        return types.SimpleNamespace(user=types.SimpleNamespace(id="user_2", email=email, created_at="2023-01-01"))
-
-class _FakeQuery:
-    def __init__(self, table_name):
-        self.table_name = table_name
-        self._op = None
-        self._filters = []
-        self._payload = None
-
-    def select(self, *_args, **_kwargs):
-        self._op = "select"
-        return self
-
-    def eq(self, column, value):
-        self._filters.append((column, value))
-        return self
-
-    def update(self, payload):
-        self._op = "update"
-        self._payload = payload
-        return self
-
-    def insert(self, payload):
-        self._op = "insert"
-        self._payload = payload
-        return self
-
-    def execute(self):
-        # Return shapes compatible with code expectations
-        if self._op == "select":
-            # Ensure existence checks pass
-            return types.SimpleNamespace(data=[{"id": "row_1"}])
-        if self._op == "insert":
-            return types.SimpleNamespace(data=[{"id": "new_id"}])
-        if self._op == "update":
-            return types.SimpleNamespace(data=[{"updated": True}])
-        return types.SimpleNamespace(data=[])
-
-class _FakeSupabase:
-    def __init__(self):
-        self.auth = _FakeAuth()
-
-    def table(self, name):
-        return _FakeQuery(name)
-
-# Monkeypatch get_supabase_client to return fake
+# Point the data-access layer at the in-memory PostgREST/GoTrue server
 @pytest.fixture(autouse=True)
-def _stub_supabase(monkeypatch):
-    from backend import services
-    def _get_fake_client():
-        return _FakeSupabase()
-    # Patch the service function
-    import backend.services.supabase_client as sc
-    monkeypatch.setattr(sc, "get_supabase_client", _get_fake_client)
-    yield
+def _fake_postgrest():
+    import httpx
+    from services import repository
+    from tests import fake_postgrest
+    client = repository.SupabaseRestClient(
+        os.environ["SUPABASE_URL"], os.environ["SUPABASE_ANON_KEY"],
+        transport=httpx.ASGITransport(app=fake_postgrest.app)
+    )
+    repository.set_repository(repository.Repository(client))
+    yield fake_postgrest
+    repository.set_repository(None)
 
 # Stub stripe
 fake_stripe = types.ModuleType("stripe")
@@ -182,6 +129,7 @@ class _FakeRandomNS:
             return [loc for _ in range(size)]
         return loc
 
+fake_numpy.ndarray = list
 fake_numpy.linspace = _linspace
 fake_numpy.random = _FakeRandomNS()
 sys.modules.setdefault("numpy", fake_numpy)
@@ -274,8 +222,13 @@ fake_jose = types.ModuleType("jose")
 fake_jwt_mod = types.ModuleType("jose.jwt")
 class JWTError(Exception):
     pass
+def _jwt_claim(value):
+    # Like python-jose: datetimes become integer timestamps (naive means UTC)
+    if isinstance(value, datetime.datetime):
+        return int(value.replace(tzinfo=datetime.timezone.utc).timestamp())
+    return str(value)
 def _jwt_encode(payload, secret, algorithm=None):
-    data = json.dumps(payload).encode("utf-8")
+    data = json.dumps(payload, default=_jwt_claim).encode("utf-8")
     return base64.urlsafe_b64encode(data).decode("ascii")
 def _jwt_decode(token, secret, algorithms=None):
     try:
@@ -285,6 +238,9 @@ def _jwt_decode(token, secret, algorithms=None):
         raise JWTError(str(e))
 fake_jwt_mod.encode = _jwt_encode
 fake_jwt_mod.decode = _jwt_decode
+fake_jwk_mod = types.ModuleType("jose.jwk")
+fake_jwk_mod.construct = lambda key, algorithm=None: key
 fake_jose.JWTError = JWTError
 sys.modules.setdefault("jose", fake_jose)
 sys.modules.setdefault("jose.jwt", fake_jwt_mod)
+sys.modules.setdefault("jose.jwk", fake_jwk_mod)
@@ -0,0 +1,156 @@
+"""
+In-memory stand-in for the Supabase REST endpoints the repository uses:
+PostgREST table reads/writes (eq/neq/gt/gte/lt/lte/in/is filters, or/and
+groups, select projection, multi-column order, limit, on_conflict), the
+mark_archived RPC and GoTrue password sign-up/sign-in.
+"""
+import datetime
+import uuid
+from collections import defaultdict
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse, Response
+from starlette.routing import Route
+
+tables = defaultdict(list)
+auth_users = {}
+
+def reset():
+    tables.clear()
+    auth_users.clear()
+
+def _now():
+    # TIMESTAMP columns come back without an offset
+    return datetime.datetime.utcnow().isoformat()
+
+def _matches(row, column, expression):
+    operator, _, operand = expression.partition(".")
+    value = row.get(column)
+    if operator == "in":
+        return str(value) in operand.strip("()").split(",")
+    if operator == "is":
+        return value is None if operand == "null" else str(value).lower() == operand
+    if operator in ("eq", "neq"):
+        return (str(value) == operand) == (operator == "eq")
+    if value is None:
+        return False
+    return {"gt": str(value) > operand, "gte": str(value) >= operand, "lt": str(value) < operand, "lte": str(value) <= operand}[operator]
+
+def _split(group):
+    # Top-level comma-separated conditions of "(a.eq.1,and(b.eq.2,c.lt.3))"
+    parts, depth, current = [], 0, ""
+    for char in group[1:-1]:
+        if char == "," and depth == 0:
+            parts.append(current)
+            current = ""
+            continue
+        depth += {"(": 1, ")": -1}.get(char, 0)
+        current += char
+    return parts + [current]
+
+def _matches_group(row, operator, group):
+    results = []
+    for condition in _split(group):
+        if condition.startswith(("or(", "and(")):
+            nested, _, rest = condition.partition("(")
+            results.append(_matches_group(row, nested, "(" + rest))
+        else:
+            column, _, expression = condition.partition(".")
+            results.append(_matches(row, column, expression))
+    return any(results) if operator == "or" else all(results)
+
+def _filtered(request: Request, rows):
+    reserved = {"select", "order", "limit", "on_conflict"}
+    filters = [(k, v) for k, v in request.query_params.multi_items() if k not in reserved]
+    return [
+        row for row in rows
+        if all(
+            _matches_group(row, column, expression) if column in ("or", "and") else _matches(row, column, expression)
+            for column, expression in filters
+        )
+    ]
+
+def _project(rows, columns):
+    if columns == "*":
+        return [dict(row) for row in rows]
+    names = columns.split(",")
+    return [{name: row.get(name) for name in names} for row in rows]
+
+async def table_endpoint(request: Request):
+    table = tables[request.path_params["table"]]
+    prefer = request.headers.get("prefer", "")
+
+    if request.method == "GET":
+        rows = _filtered(request, table)
+        order = request.query_params.get("order")
+        if order:
+            # Stable sorts, least significant column first
+            for term in reversed(order.split(",")):
+                column, _, direction = term.partition(".")
+                rows = sorted(rows, key=lambda row: str(row.get(column)), reverse=direction == "desc")
+        if "limit" in request.query_params:
+            rows = rows[:int(request.query_params["limit"])]
+        return JSONResponse(_project(rows, request.query_params.get("select", "*")))
+
+    if request.method == "POST":
+        payload = await request.json()
+        inserted = []
+        key = request.query_params.get("on_conflict", "id").split(",")
+        for row in payload if isinstance(payload, list) else [payload]:
+            row = {"id": str(uuid.uuid4()), "created_at": _now(), **row}
+            if any(all(existing.get(column) == row.get(column) for column in key) for existing in table):
+                if "resolution=ignore-duplicates" in prefer:
+                    continue
+                return JSONResponse({"message": "duplicate key value violates unique constraint"}, status_code=409)
+            table.append(row)
+            inserted.append(row)
+        if "return=representation" in prefer:
+            return JSONResponse(inserted, status_code=201)
+        return Response(status_code=201)
+
+    if request.method == "PATCH":
+        values = await request.json()
+        for row in _filtered(request, table):
+            row.update(values)
+        return Response(status_code=204)
+
+    if request.method == "DELETE":
+        doomed = {id(row) for row in _filtered(request, table)}
+        table[:] = [row for row in table if id(row) not in doomed]
+        return Response(status_code=204)
+
+async def rpc_endpoint(request: Request):
+    params = await request.json()
+    if request.path_params["function"] != "mark_archived":
+        return JSONResponse({"message": "function not found"}, status_code=404)
+    for row in tables[params["target"]]:
+        if row["id"] in params["archive_keys"]:
+            row.update({column: None for column in params["blob_columns"]})
+            row.update(archived_at=params["archived"], archive_key=params["archive_keys"][row["id"]])
+    return Response(status_code=204)
+
+async def signup(request: Request):
+    payload = await request.json()
+    email = payload["email"]
+    # Repeated sign-ups return the existing user, as with email confirmation enabled
+    if email not in auth_users:
+        auth_users[email] = {"id": f"user_{email}", "email": email, "created_at": _now(), "password": payload["password"]}
+    user = {k: v for k, v in auth_users[email].items() if k != "password"}
+    return JSONResponse(user)
+
+async def token(request: Request):
+    payload = await request.json()
+    user = auth_users.get(payload.get("email"))
+    if user is None or user["password"] != payload.get("password"):
+        return JSONResponse({"error": "invalid_grant", "error_description": "Invalid login credentials"}, status_code=400)
+    return JSONResponse({
+        "access_token": "fake-session",
+        "user": {k: v for k, v in user.items() if k != "password"}
+    })
+
+app = Starlette(routes=[
+    Route("/rest/v1/rpc/{function}", rpc_endpoint, methods=["POST"]),
+    Route("/rest/v1/{table}", table_endpoint, methods=["GET", "POST", "PATCH", "DELETE"]),
+    Route("/auth/v1/signup", signup, methods=["POST"]),
+    Route("/auth/v1/token", token, methods=["POST"]),
+])
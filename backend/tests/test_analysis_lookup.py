@@ -0,0 +1,55 @@
+import asyncio
+from services import analysis_lookup, repository
+from services.analysis_lookup import analysis_cache, find_analyses, find_analysis
+from services.write_behind import result_writer
+
+
+def _seed(fake, analysis_id, user_id):
+    fake.tables["analysis_results"].append({
+        "id": analysis_id, "user_id": user_id, "filename": "a.csv", "data_points": 3,
+        "created_at": "2024-01-01T00:00:00", "summary": "long", "key_factors": ["x"] * 100
+    })
+
+
+def _count_queries(monkeypatch, name):
+    calls = []
+    original = getattr(repository.Repository, name)
+
+    async def counted(self, *args, **kwargs):
+        calls.append(args)
+        return await original(self, *args, **kwargs)
+    monkeypatch.setattr(repository.Repository, name, counted)
+    return calls
+
+
+def test_lookup_projects_metadata_and_caches_ownership(monkeypatch, _fake_postgrest):
+    analysis_cache.clear()
+    _seed(_fake_postgrest, "a1", "owner")
+    calls = _count_queries(monkeypatch, "get_analysis")
+
+    row = asyncio.run(find_analysis("a1", "owner"))
+    assert row["filename"] == "a.csv" and "summary" not in row and "key_factors" not in row
+    assert asyncio.run(find_analysis("a1", "owner")) == row
+    assert asyncio.run(find_analysis("a1", "intruder")) is None
+    assert len(calls) == 1
+
+    # Misses are not cached: the analysis may be written later
+    assert asyncio.run(find_analysis("a2", "owner")) is None
+    _seed(_fake_postgrest, "a2", "owner")
+    assert asyncio.run(find_analysis("a2", "owner")) is not None
+
+
+def test_bulk_lookup_uses_cache_pending_rows_and_one_query(monkeypatch, _fake_postgrest):
+    analysis_cache.clear()
+    for analysis_id in ("b1", "b2", "b3"):
+        _seed(_fake_postgrest, analysis_id, "owner")
+    _seed(_fake_postgrest, "theirs", "intruder")
+    asyncio.run(find_analysis("b1", "owner"))
+    pending = result_writer.submit("analysis_results", {"user_id": "owner", "filename": "p.csv"})
+    calls = _count_queries(monkeypatch, "get_analyses")
+
+    found = asyncio.run(find_analyses(["b1", "b2", "b3", pending, "theirs", "missing", "b2"], "owner"))
+    assert set(found) == {"b1", "b2", "b3", pending}
+    assert found[pending]["filename"] == "p.csv"
+    assert calls == [(["b2", "b3", "theirs", "missing"], "owner", analysis_lookup.ANALYSIS_META_COLUMNS)]
+    assert "b3" in analysis_cache
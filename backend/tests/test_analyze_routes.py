@@ -21,3 +21,48 @@ def test_analyze_upload_and_store():
     body = resp.json()
     assert body["success"] is True
     assert body["insights"]
+
+
+def test_analyze_is_rate_limited_per_plan(monkeypatch):
+    import asyncio
+    from services import rate_limit
+
+    monkeypatch.setitem(rate_limit.PLAN_LIMITS, ("llm", "free"), rate_limit.Limit(2, 1 / 60))
+    asyncio.run(rate_limit.get_backend().reset())
+    token = _get_token()
+    files = {"file": ("data.csv", "date,value\n2024-01-01,10\n", "text/csv")}
+    headers = {"Authorization": f"Bearer {token}"}
+
+    for _ in range(2):
+        assert client.post("/analyze/", files=files, headers=headers).status_code == 200
+    resp = client.post("/analyze/", files=files, headers=headers)
+    assert resp.status_code == 429
+    assert 1 <= int(resp.headers["retry-after"]) <= 60
+    assert rate_limit.admission.in_flight["llm"] == 0
+
+
+def test_analysis_rows_are_scoped_to_their_owner():
+    import asyncio
+    from services import rate_limit
+    from services.analysis_lookup import analysis_cache, find_analysis
+    from services.write_behind import result_writer
+
+    asyncio.run(rate_limit.get_backend().reset())
+    token = _get_token()
+    files = {"file": ("data.csv", "date,value\n2024-01-01,10\n", "text/csv")}
+    analysis_id = client.post("/analyze/", files=files, headers={"Authorization": f"Bearer {token}"}).json()["analysis_id"]
+    assert analysis_id
+
+    other = client.post("/auth/signup", json={"email": "intruder@example.com", "password": "x"}).json()["access_token"]
+    more = {"file": ("more.csv", "date,value\n2024-01-02,20\n", "text/csv")}
+    resp = client.post(f"/analyze/{analysis_id}/rows", files=more, headers={"Authorization": f"Bearer {other}"})
+    assert resp.status_code == 404
+
+    # Once written, the analysis is cached on lookup; a successful append drops it
+    asyncio.run(result_writer.flush())
+    owner_id = client.get("/auth/me", headers={"Authorization": f"Bearer {token}"}).json()["user"]["id"]
+    assert asyncio.run(find_analysis(analysis_id, owner_id)) is not None
+    assert analysis_id in analysis_cache
+    resp = client.post(f"/analyze/{analysis_id}/rows", files=more, headers={"Authorization": f"Bearer {token}"})
+    assert resp.status_code == 200
+    assert analysis_id not in analysis_cache
@@ -1,6 +1,9 @@
+import asyncio
+import time
 import pytest
 from fastapi.testclient import TestClient
 from main import app
+from services import auth, revocation
 
 client = TestClient(app)
 
@@ -22,3 +25,105 @@ def test_signup_and_login_flow():
     resp = client.post("/auth/refresh", headers={"Authorization": f"Bearer {token}"})
     assert resp.status_code == 200
     assert "access_token" in resp.json()
+
+
+def test_user_cache_serves_repeat_requests_and_invalidates():
+    from services.auth import user_cache, invalidate_user
+
+    resp = client.post("/auth/signup", json={"email": "cache@example.com", "password": "pass1234"})
+    token = resp.json()["access_token"]
+    user_id = resp.json()["user"]["id"]
+    invalidate_user(user_id)
+
+    hits_before = user_cache.hits
+    for _ in range(3):
+        resp = client.get("/auth/me", headers={"Authorization": f"Bearer {token}"})
+        assert resp.status_code == 200
+    assert user_cache.hits - hits_before == 2
+
+    invalidate_user(user_id)
+    assert user_id not in user_cache
+
+    resp = client.get("/metrics", headers={"Authorization": "Bearer test-metrics-token"})
+    assert resp.status_code == 200
+    assert "hit_rate" in resp.json()["caches"]["auth_users"]
+
+
+def test_invalid_or_missing_token_is_401_not_500():
+    resp = client.get("/auth/me")
+    assert resp.status_code == 401
+
+    resp = client.get("/auth/me", headers={"Authorization": "Bearer not-a-token"})
+    assert resp.status_code == 401
+    assert resp.headers["www-authenticate"] == "Bearer"
+
+    files = {"file": ("data.csv", "date,value\n2024-01-01,10\n", "text/csv")}
+    resp = client.post("/analyze/", files=files, headers={"Authorization": "Bearer not-a-token"})
+    assert resp.status_code == 401
+
+
+def test_logout_revokes_token():
+    resp = client.post("/auth/signup", json={"email": "logout@example.com", "password": "pass1234"})
+    token = resp.json()["access_token"]
+    headers = {"Authorization": f"Bearer {token}"}
+
+    assert client.get("/auth/me", headers=headers).status_code == 200
+    resp = client.post("/auth/logout", headers=headers)
+    assert resp.status_code == 200
+    assert resp.json()["token_revoked"] is True
+    assert client.get("/auth/me", headers=headers).status_code == 401
+
+    # Other tokens stay valid
+    resp = client.post("/auth/signup", json={"email": "other@example.com", "password": "pass1234"})
+    other = {"Authorization": f"Bearer {resp.json()['access_token']}"}
+    assert client.get("/auth/me", headers=other).status_code == 200
+
+
+def test_sync_picks_up_revocations_committed_after_an_earlier_sync(_fake_postgrest):
+    # Stamped by another process before our last sync, committed after it
+    revocation._last_sync = time.time()
+    _fake_postgrest.tables["revoked_tokens"].append({
+        "jti": "late-commit", "user_id": None,
+        "expires_at": revocation._iso(time.time() + 3600), "revoked_at": revocation._iso(time.time() - 2)
+    })
+    assert asyncio.run(revocation.sync_filter()) == 1
+    assert "late-commit" in revocation._filter
+    # Seen again through the overlap, but not counted twice
+    assert asyncio.run(revocation.sync_filter()) == 0
+
+
+def test_a_revocation_during_a_rebuild_survives_the_swap(monkeypatch):
+    repository = revocation.get_repository()
+    original = repository.revoked_token_ids
+
+    async def read_then_revoke(*args, **kwargs):
+        # The denylist is read before the concurrent logout's insert commits
+        jtis = await original(*args, **kwargs)
+        await revocation.revoke_token("mid-rebuild", time.time() + 3600)
+        return jtis
+    monkeypatch.setattr(repository, "revoked_token_ids", read_then_revoke)
+    asyncio.run(revocation.rebuild_filter())
+    assert "mid-rebuild" in revocation._filter
+    assert asyncio.run(revocation.is_revoked("mid-rebuild")) is True
+
+
+def test_an_unloaded_filter_checks_the_denylist(monkeypatch, _fake_postgrest):
+    _fake_postgrest.tables["revoked_tokens"].append({
+        "jti": "revoked-elsewhere", "user_id": None,
+        "expires_at": revocation._iso(time.time() + 3600), "revoked_at": revocation._iso(time.time())
+    })
+    # The startup rebuild failed: an empty filter must not answer "not revoked"
+    monkeypatch.setattr(revocation, "_filter", revocation.BloomFilter(10, 0.01))
+    monkeypatch.setattr(revocation, "_last_sync", None)
+    assert asyncio.run(revocation.is_revoked("revoked-elsewhere")) is True
+
+
+def test_login_checks_credentials_against_auth_server():
+    client.post("/auth/signup", json={"email": "login@example.com", "password": "right"})
+
+    resp = client.post("/auth/login", json={"email": "login@example.com", "password": "right"})
+    assert resp.status_code == 200
+    assert resp.json()["user"]["id"] == "user_login@example.com"
+
+    resp = client.post("/auth/login", json={"email": "login@example.com", "password": "wrong"})
+    assert resp.status_code == 401
@@ -38,3 +38,77 @@ def test_forecast_flow():
     body = resp.json()
     assert body["success"] is True
     assert body["forecast"]["forecast"]["dates"]
+
+
+def test_progress_tracks_concurrent_explanation_jobs_separately(monkeypatch):
+    import asyncio
+    import sys
+    import threading
+    import types
+    import httpx
+    from routers import explain
+
+    token = client.post("/auth/signup", json={"email": "progress@example.com", "password": "pw"}).json()["access_token"]
+    user = client.get("/auth/me", headers={"Authorization": f"Bearer {token}"}).json()["user"]
+    released = {"sales": threading.Event(), "units": threading.Event()}
+
+    def explain_dataset(df, target_column, explain_rows, report):
+        report(5, 10)
+        released[target_column].wait(5)
+        report(10, 10)
+        return {}
+    fake_explainer = types.SimpleNamespace(EXPLAIN_MAX_ROWS=1000, explain_dataset=explain_dataset, extend_explanation=None)
+    monkeypatch.setitem(sys.modules, "services.explainer", fake_explainer)
+    monkeypatch.setattr(explain, "load_dataset", lambda analysis_id: ("frame", "fingerprint"))
+
+    async def scenario():
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as http:
+            async def progress():
+                resp = await http.get("/explain/progress-analysis/progress", headers={"Authorization": f"Bearer {token}"})
+                return resp.json()
+            jobs = [asyncio.ensure_future(explain.generate_shap_explanations("progress-analysis", column, None, user)) for column in released]
+            for _ in range(500):
+                if len((await progress()).get("jobs", [])) == 2:
+                    break
+                await asyncio.sleep(0.01)
+            released["sales"].set()
+            await jobs[0]
+            # The finished job does not hide the one still running
+            during = await progress()
+            released["units"].set()
+            await jobs[1]
+            return during, await progress()
+    during, after = asyncio.run(scenario())
+
+    assert during["status"] == "running" and (during["rows_done"], during["rows_total"]) == (5, 10)
+    assert {job["target_column"]: job["status"] for job in during["jobs"]} == {"sales": "completed", "units": "running"}
+    assert after["status"] == "completed"
+
+
+def test_bad_explain_input_is_a_400_and_fallbacks_are_not_stored(monkeypatch, _fake_postgrest):
+    import asyncio
+    import sys
+    import types
+    from routers import explain
+    from services import rate_limit
+    from services.write_behind import result_writer
+
+    asyncio.run(rate_limit.get_backend().reset())
+    token = client.post("/auth/signup", json={"email": "explain-errors@example.com", "password": "pw"}).json()["access_token"]
+    headers = {"Authorization": f"Bearer {token}"}
+    analysis_id = _create_analysis(token)
+
+    def explain_dataset(df, target_column, explain_rows, report):
+        if target_column == "missing":
+            raise ValueError("Target column 'missing' not found")
+        raise RuntimeError("surrogate fit failed")
+    fake_explainer = types.SimpleNamespace(EXPLAIN_MAX_ROWS=1000, explain_dataset=explain_dataset, extend_explanation=None)
+    monkeypatch.setitem(sys.modules, "services.explainer", fake_explainer)
+    monkeypatch.setattr(explain, "load_dataset", lambda analysis_id: ("frame", "fingerprint"))
+
+    resp = client.post("/explain/", params={"analysis_id": analysis_id, "target_column": "missing"}, headers=headers)
+    assert resp.status_code == 400 and "missing" in resp.json()["detail"]
+    resp = client.post("/explain/", params={"analysis_id": analysis_id, "target_column": "sales"}, headers=headers)
+    assert resp.status_code == 200 and resp.json()["explanation_id"] is None
+    asyncio.run(result_writer.flush())
+    assert not [row for row in _fake_postgrest.tables["explanation_results"] if row["analysis_id"] == analysis_id]
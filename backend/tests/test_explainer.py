@@ -0,0 +1,22 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+if not hasattr(np, "linalg"):
+    pytest.skip("needs numpy", allow_module_level=True)
+pytest.importorskip("shap")
+
+from services.explainer import detect_target_column, fit_feature_spec, transform_features
+
+
+def test_all_missing_categoricals_get_a_constant_fill():
+    df = pd.DataFrame({"sales": [1.0, 2.0, 3.0], "price": [1.0, None, 3.0], "store": [None, None, None]})
+    spec = fit_feature_spec(df, "sales")
+    assert [f["name"] for f in spec["features"]] == ["price", "store"]
+    assert spec["fill_values"] == [2.0, 0.0]
+    np.testing.assert_array_equal(transform_features(df, spec), [[1.0, 0.0], [2.0, 0.0], [3.0, 0.0]])
+
+
+def test_an_unknown_target_column_is_a_value_error():
+    with pytest.raises(ValueError):
+        detect_target_column(pd.DataFrame({"sales": [1.0]}), "revenue")
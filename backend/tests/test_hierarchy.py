@@ -0,0 +1,82 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+if not hasattr(np, "linalg") or not hasattr(pd, "to_datetime"):
+    pytest.skip("needs numpy, pandas and scipy", allow_module_level=True)
+pytest.importorskip("scipy")
+
+from services.hierarchy import RECONCILIATION_METHODS, build_hierarchy, node_history, projection_matrix, reconcile, shrink_covariance
+
+STORES = {"s1": "north", "s2": "north", "s3": "south", "s4": "south"}
+
+
+def _hierarchy(days=56):
+    rng = np.random.default_rng(0)
+    dates = pd.date_range("2024-01-01", periods=days, freq="D")
+    rows = [
+        {"date": date, "region": region, "store": store, "sales": float(rng.integers(5, 50))}
+        for date in dates for store, region in STORES.items()
+    ]
+    return build_hierarchy(pd.DataFrame(rows), "date", "sales", ["region", "store"])
+
+
+def _assert_coherent(hierarchy, forecast):
+    S = hierarchy["S"].toarray()
+    bottom = forecast[:, hierarchy["level_slices"]["store"][0]:]
+    np.testing.assert_allclose(forecast, bottom @ S.T, atol=1e-6)
+
+
+def test_summing_matrix_orders_total_then_levels():
+    hierarchy = _hierarchy()
+    S = hierarchy["S"].toarray()
+    assert S.shape == (7, 4)
+    assert hierarchy["level_slices"] == {"total": (0, 1), "region": (1, 3), "store": (3, 7)}
+    np.testing.assert_array_equal(S[0], [1, 1, 1, 1])
+    np.testing.assert_array_equal(S[1:3], [[1, 1, 0, 0], [0, 0, 1, 1]])
+    np.testing.assert_array_equal(S[3:], np.eye(4))
+    assert hierarchy["labels"][1] == {"region": "north"}
+    history = node_history(hierarchy)
+    np.testing.assert_allclose(history[:, 0], history[:, 3:].sum(axis=1))
+
+
+def test_a_level_named_total_is_rejected():
+    frame = pd.DataFrame({"date": ["2024-01-01"], "total": ["a"], "sales": [1.0]})
+    with pytest.raises(ValueError, match="total"):
+        build_hierarchy(frame, "date", "sales", ["total"])
+
+
+@pytest.mark.parametrize("method", ["ols", "wls", "mint"])
+def test_projection_reproduces_coherent_forecasts(method):
+    hierarchy = _hierarchy()
+    S = hierarchy["S"]
+    residuals = np.random.default_rng(1).normal(size=(40, S.shape[0]))
+    G = projection_matrix(S, method, residuals)
+    # Unbiased: an already coherent forecast is left unchanged
+    np.testing.assert_allclose(G @ S.toarray(), np.eye(S.shape[1]), atol=1e-8)
+
+
+@pytest.mark.parametrize("method", RECONCILIATION_METHODS)
+def test_reconciled_totals_are_coherent(method):
+    hierarchy = _hierarchy()
+    T, horizon = len(hierarchy["dates"]), 14
+    rng = np.random.default_rng(2)
+    for level in ("store", "region"):
+        start, stop = hierarchy["level_slices"][level]
+        forecast = rng.uniform(10, 40, size=(horizon, stop - start))
+        fitted = node_history(hierarchy)[:, start:stop] + rng.normal(size=(T, stop - start))
+        reconciled = reconcile(hierarchy, level, forecast, fitted, method)
+        assert reconciled.shape == (horizon, 7)
+        _assert_coherent(hierarchy, reconciled)
+        if method == "bottom_up" and level == "store":
+            np.testing.assert_allclose(reconciled[:, start:stop], forecast)
+
+
+def test_shrunk_covariance_is_positive_definite():
+    residuals = np.random.default_rng(3).normal(size=(10, 7))
+    # More series than observations would make the sample covariance singular,
+    # and a constant series has zero variance
+    residuals = np.hstack([residuals, residuals[:, :5] * 2.0, np.zeros((10, 1))])
+    W = shrink_covariance(residuals)
+    np.testing.assert_allclose(W, W.T)
+    assert np.linalg.eigvalsh(W).min() > 0
@@ -0,0 +1,43 @@
+import asyncio
+from fastapi.testclient import TestClient
+from main import app
+from services.write_behind import result_writer
+
+client = TestClient(app)
+
+
+def _headers(email):
+    token = client.post("/auth/signup", json={"email": email, "password": "x"}).json()["access_token"]
+    return {"Authorization": f"Bearer {token}"}
+
+
+def _pages(path, headers, limit):
+    items, cursor = [], None
+    while True:
+        params = {"limit": limit, **({"cursor": cursor} if cursor else {})}
+        page = client.get(path, params=params, headers=headers).json()
+        items += page["items"]
+        cursor = page["next_cursor"]
+        if cursor is None:
+            return items
+
+
+def test_history_pages_cover_written_and_pending_rows_once(_fake_postgrest):
+    headers = _headers("history@example.com")
+    user_id = client.get("/auth/me", headers=headers).json()["user"]["id"]
+    ids = [result_writer.submit("forecast_results", {"user_id": user_id, "forecast_days": days}) for days in range(7)]
+    asyncio.run(result_writer.flush())
+    # Not yet written: still listed, in order
+    ids += [result_writer.submit("forecast_results", {"user_id": user_id, "forecast_days": days}) for days in range(7, 10)]
+    result_writer.submit("forecast_results", {"user_id": "someone-else", "forecast_days": 1})
+
+    items = _pages("/forecast/history", headers, limit=3)
+    assert [item["id"] for item in items] == ids[::-1]
+    assert set(items[0]) == {"id", "created_at", "analysis_id", "forecast_days"}
+
+
+def test_history_rejects_bad_cursors(_fake_postgrest):
+    headers = _headers("history-cursor@example.com")
+    assert client.get("/analyze/history", params={"cursor": "not-a-cursor"}, headers=headers).status_code == 400
+    assert client.get("/explain/history", params={"limit": 0}, headers=headers).status_code == 422
+    assert client.get("/explain/history").status_code in (401, 403)
@@ -0,0 +1,70 @@
+import asyncio
+import threading
+import time
+import types
+import pytest
+from fastapi.testclient import TestClient
+from main import app
+from services import llm
+
+client = TestClient(app)
+
+
+def _response(content):
+    return types.SimpleNamespace(choices=[types.SimpleNamespace(message=types.SimpleNamespace(content=content))])
+
+
+def _call():
+    return asyncio.run(llm.chat_completion(None, model="test-model", messages=[], max_tokens=10, temperature=0))
+
+
+def test_breaker_opens_fails_fast_and_recovers_after_a_probe(monkeypatch):
+    monkeypatch.setattr(llm, "models", {})
+    calls = []
+
+    def failing(**params):
+        calls.append(params["model"])
+        # The client call is bounded too, not only the wait for it
+        assert 0 < params["request_timeout"] <= llm.LLM_TIMEOUT_SECONDS
+        raise RuntimeError("upstream unavailable")
+    monkeypatch.setattr(llm.openai.ChatCompletion, "create", failing)
+
+    for _ in range(llm.LLM_BREAKER_FAILURES):
+        with pytest.raises(RuntimeError):
+            _call()
+    with pytest.raises(llm.CircuitOpenError):
+        _call()
+    assert len(calls) == llm.LLM_BREAKER_FAILURES
+
+    health = client.get("/health").json()
+    assert health["status"] == "degraded"
+    assert health["llm"]["test-model"]["state"] == "open"
+
+    # After the reset period one probe goes through; its success closes the breaker
+    monkeypatch.setattr(llm.openai.ChatCompletion, "create", lambda **params: _response("ok"))
+    llm.models["test-model"].breaker.opened_at -= llm.LLM_BREAKER_RESET_SECONDS
+    assert _call().choices[0].message.content == "ok"
+    assert client.get("/health").json()["llm"]["test-model"]["state"] == "closed"
+
+
+def test_slow_call_is_hedged_and_the_first_answer_wins(monkeypatch):
+    monkeypatch.setattr(llm, "models", {})
+    monkeypatch.setattr(llm, "LLM_HEDGE_ENABLED", True)
+    stats = llm.model_stats("test-model")
+    for _ in range(llm.LLM_HEDGE_MIN_SAMPLES):
+        stats.latency_ms.observe(100)
+    lock = threading.Lock()
+    attempts = []
+
+    def first_slow(**params):
+        with lock:
+            attempts.append(1)
+            attempt = len(attempts)
+        if attempt == 1:
+            time.sleep(0.5)
+        return _response(f"attempt {attempt}")
+    monkeypatch.setattr(llm.openai.ChatCompletion, "create", first_slow)
+
+    assert _call().choices[0].message.content == "attempt 2"
+    assert (stats.hedged, stats.hedge_wins) == (1, 1)
+    assert client.get("/metrics", headers={"Authorization": "Bearer test-metrics-token"}).json()["llm"]["test-model"]["latency_ms"]["count"] >= llm.LLM_HEDGE_MIN_SAMPLES
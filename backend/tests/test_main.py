@@ -14,3 +14,9 @@ def test_health():
     assert response.status_code == 200
     assert response.json()["status"] == "healthy"
 
+
+def test_metrics_need_the_metrics_token():
+    assert client.get("/metrics").status_code == 401
+    assert client.get("/metrics", headers={"Authorization": "Bearer wrong"}).status_code == 401
+    resp = client.get("/metrics", headers={"Authorization": "Bearer test-metrics-token"})
+    assert resp.status_code == 200 and "caches" in resp.json()
@@ -0,0 +1,85 @@
+import asyncio
+import httpx
+from fastapi.testclient import TestClient
+from main import app
+from routers import explain, forecast
+from services import prefetch, rate_limit
+from services.prefetch import prefetcher
+from services.write_behind import result_writer
+
+client = TestClient(app)
+
+
+def _headers(email):
+    token = client.post("/auth/signup", json={"email": email, "password": "x"}).json()["access_token"]
+    return {"Authorization": f"Bearer {token}"}
+
+
+def test_prefetched_forecast_and_explanation_are_served_from_cache(monkeypatch, _fake_postgrest):
+    asyncio.run(rate_limit.get_backend().reset())
+    monkeypatch.setattr(prefetch, "PREFETCH_ENABLED", True)
+    headers = _headers("prefetch@example.com")
+    fits = []
+
+    def fake_build(days, analysis_id, resolution):
+        if analysis_id not in forecast.model_cache:
+            fits.append(analysis_id)
+            forecast.model_cache.set(analysis_id, {"model": None})
+        return {"forecast": [], "days": days}
+    monkeypatch.setattr(forecast, "build_prophet_forecast", fake_build)
+
+    async def fake_explanations(analysis_id, target_column=None, explain_rows=None, user=None, quantize=None, background=False):
+        if (analysis_id, target_column) in explain.explanation_cache:
+            return {"feature_importance": [], "shap_values": {}, "cache_status": "hit"}
+        explain.explanation_cache.set((analysis_id, target_column), {"explanation_id": None})
+        return {"feature_importance": [], "shap_values": {}, "cache_status": "miss"}
+    monkeypatch.setattr(explain, "generate_shap_explanations", fake_explanations)
+    before = {kind: dict(counters) for kind, counters in prefetcher.counters.items()}
+
+    async def scenario():
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as http:
+            files = {"file": ("data.csv", "date,value\n2024-01-01,10\n2024-01-02,20\n", "text/csv")}
+            analysis_id = (await http.post("/analyze/", files=files, headers=headers)).json()["analysis_id"]
+            await asyncio.gather(*prefetcher._tasks)
+            forecasted = await http.post("/forecast/", params={"analysis_id": analysis_id}, headers=headers)
+            explained = await http.post("/explain/", params={"analysis_id": analysis_id}, headers=headers)
+            return analysis_id, forecasted, explained
+    analysis_id, forecasted, explained = asyncio.run(scenario())
+
+    assert forecasted.status_code == explained.status_code == 200
+    assert fits == [analysis_id]
+    assert explained.json()["explanations"]["cache_status"] == "hit"
+    stats = client.get("/metrics", headers={"Authorization": "Bearer test-metrics-token"}).json()["prefetch"]
+    for kind in ("forecast", "explain"):
+        assert stats["kinds"][kind]["completed"] == before[kind]["completed"] + 1
+        assert stats["kinds"][kind]["hits"] == before[kind]["hits"] + 1
+
+
+def test_explanations_served_from_a_prefetch_store_one_row(monkeypatch, _fake_postgrest):
+    asyncio.run(rate_limit.get_backend().reset())
+    monkeypatch.setattr(prefetch, "PREFETCH_ENABLED", True)
+    headers = _headers("prefetch-rows@example.com")
+    monkeypatch.setattr(forecast, "build_prophet_forecast", lambda days, analysis_id, resolution: {"forecast": []})
+
+    async def fake_explanations(analysis_id, target_column=None, explain_rows=None, user=None, quantize=None, background=False):
+        # Like the real one: a computed entry has no stored explanation yet
+        if (analysis_id, target_column) in explain.explanation_cache:
+            return {"feature_importance": [], "shap_values": {}, "cache_status": "hit"}
+        explain.explanation_cache.set((analysis_id, target_column), {"explanation_id": None})
+        return {"feature_importance": [], "shap_values": {}, "cache_status": "miss"}
+    monkeypatch.setattr(explain, "generate_shap_explanations", fake_explanations)
+
+    async def scenario():
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as http:
+            files = {"file": ("data.csv", "date,value\n2024-01-01,10\n", "text/csv")}
+            analysis_id = (await http.post("/analyze/", files=files, headers=headers)).json()["analysis_id"]
+            await asyncio.gather(*prefetcher._tasks)
+            first = await http.post("/explain/", params={"analysis_id": analysis_id}, headers=headers)
+            second = await http.post("/explain/", params={"analysis_id": analysis_id}, headers=headers)
+            await result_writer.flush()
+            return analysis_id, first.json(), second.json()
+    analysis_id, first, second = asyncio.run(scenario())
+
+    assert first["explanation_id"] == second["explanation_id"]
+    stored = [row for row in _fake_postgrest.tables["explanation_results"] if row["analysis_id"] == analysis_id]
+    assert len(stored) == 1
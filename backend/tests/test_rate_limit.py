@@ -0,0 +1,67 @@
+import pytest
+from fastapi.testclient import TestClient
+from main import app
+from services import rate_limit
+from services.rate_limit import RateLimitBackend
+
+client = TestClient(app)
+
+
+class RecordingBackend(RateLimitBackend):
+    def __init__(self, allowed=True, wait=0.0):
+        self.allowed = allowed
+        self.wait = wait
+        self.keys = []
+
+    async def acquire(self, key, limit, cost=1.0):
+        self.keys.append(key)
+        return self.allowed, self.wait
+
+    async def reset(self):
+        self.keys.clear()
+
+
+def _headers(email):
+    token = client.post("/auth/signup", json={"email": email, "password": "x"}).json()["access_token"]
+    return {"Authorization": f"Bearer {token}"}
+
+
+def _with_backend(backend, request):
+    previous = rate_limit.get_backend()
+    rate_limit.set_backend(backend)
+    try:
+        return request()
+    finally:
+        rate_limit.set_backend(previous)
+
+
+def test_empty_bucket_returns_429_with_retry_after():
+    headers = _headers("limited@example.com")
+    backend = RecordingBackend(allowed=False, wait=12.3)
+    resp = _with_backend(backend, lambda: client.post("/forecast/", params={"analysis_id": "a"}, headers=headers))
+
+    assert resp.status_code == 429
+    assert resp.headers["Retry-After"] == "13"
+    assert backend.keys == ["cpu:user_limited@example.com"]
+    # The admission slot taken for the rejected request was given back
+    assert rate_limit.admission.in_flight["cpu"] == 0
+
+
+def test_busy_server_returns_503_without_using_quota(monkeypatch):
+    headers = _headers("busy@example.com")
+    monkeypatch.setitem(rate_limit.admission.in_flight, "cpu", rate_limit.ADMISSION_MAX_CONCURRENT["cpu"])
+    backend = RecordingBackend()
+    resp = _with_backend(backend, lambda: client.post("/forecast/", params={"analysis_id": "a"}, headers=headers))
+
+    assert resp.status_code == 503
+    assert resp.headers["Retry-After"] == "1"
+    assert backend.keys == []
+
+
+def test_a_backend_missing_a_method_fails_when_created():
+    class AcquireOnly(RateLimitBackend):
+        async def acquire(self, key, limit, cost=1.0):
+            return True, 0.0
+
+    with pytest.raises(TypeError):
+        AcquireOnly()
@@ -0,0 +1,97 @@
+import asyncio
+from datetime import datetime, timedelta
+import pytest
+from fastapi.testclient import TestClient
+from main import app
+from services import archive, retention
+from services.repository import Repository
+
+client = TestClient(app)
+NOW = datetime(2024, 6, 15, 12, 0, 0)
+
+
+def _forecast(fake, user_id, age_days):
+    row = {
+        "id": f"f-{user_id}-{age_days}", "user_id": user_id, "analysis_id": None, "forecast_days": 7,
+        "forecast_data": {"forecast": [{"ds": "2024-01-01", "yhat": 1.5}] * 200},
+        "created_at": (NOW - timedelta(days=age_days)).isoformat(), "archived_at": None, "archive_key": None
+    }
+    fake.tables["forecast_results"].append(row)
+    return row
+
+
+def test_retention_deletes_and_archives_per_plan(monkeypatch, _fake_postgrest):
+    calls = []
+    original = Repository.mark_archived
+
+    async def counted(self, table, archive_keys, *args):
+        calls.append(len(archive_keys))
+        return await original(self, table, archive_keys, *args)
+    monkeypatch.setattr(Repository, "mark_archived", counted)
+    _fake_postgrest.tables["users"] += [{"id": "free-user", "plan": "free"}, {"id": "biz-user", "plan": "business"}]
+    expired = _forecast(_fake_postgrest, "free-user", 120)
+    aged = _forecast(_fake_postgrest, "free-user", 10)
+    fresh = _forecast(_fake_postgrest, "free-user", 1)
+    kept = _forecast(_fake_postgrest, "biz-user", 120)
+
+    report = asyncio.run(retention.run_retention(NOW))
+
+    ids = {row["id"] for row in _fake_postgrest.tables["forecast_results"]}
+    assert expired["id"] not in ids and {aged["id"], fresh["id"], kept["id"]} <= ids
+    assert aged["forecast_data"] is None and aged["archive_key"].startswith("forecast_results/2024-06:")
+    # Business rows are kept, but archived after 90 days
+    assert kept["forecast_data"] is None and kept["archive_key"].startswith("forecast_results/2024-02:")
+    assert fresh["archive_key"] is None
+
+    forecasts = report["tables"]["forecast_results"]
+    assert forecasts["deleted_rows"] == 1 and forecasts["archived_rows"] == 2
+    # Both rows in one batch, archived by one RPC call
+    assert calls == [2]
+    # Partitions and table sizes need the direct Postgres backend
+    assert forecasts["partitions_created"] == [] and forecasts["size_before"] is None
+    assert 0 < forecasts["archived_compressed_bytes"] < forecasts["archived_inline_bytes"]
+    assert report["reclaimed_bytes"] == forecasts["archived_inline_bytes"] - forecasts["archived_compressed_bytes"]
+
+    # A second pass has nothing left to do
+    again = asyncio.run(retention.run_retention(NOW))["tables"]["forecast_results"]
+    assert again["deleted_rows"] == 0 and again["archived_rows"] == 0
+
+
+def test_archived_forecast_is_rehydrated_on_read(_fake_postgrest):
+    token = client.post("/auth/signup", json={"email": "archive@example.com", "password": "x"}).json()["access_token"]
+    headers = {"Authorization": f"Bearer {token}"}
+    user_id = client.get("/auth/me", headers=headers).json()["user"]["id"]
+    row = _forecast(_fake_postgrest, user_id, 10)
+    original = row["forecast_data"]
+    asyncio.run(retention.run_retention(NOW))
+    assert row["forecast_data"] is None
+
+    resp = client.get(f"/forecast/{row['id']}", headers=headers)
+    assert resp.status_code == 200
+    assert resp.json()["forecast"] == original and resp.json()["archived"] is True
+
+    other = client.post("/auth/signup", json={"email": "archive-other@example.com", "password": "x"}).json()["access_token"]
+    assert client.get(f"/forecast/{row['id']}", headers={"Authorization": f"Bearer {other}"}).status_code == 404
+
+
+def test_archive_segments_outlive_rows_that_could_not_be_deleted(monkeypatch, _fake_postgrest):
+    # Every plan expires results, so whole months can go
+    monkeypatch.setitem(retention.PLAN_RETENTION, "business", retention.RetentionPolicy(90, 400))
+    _fake_postgrest.tables["users"].append({"id": "old-user", "plan": "free"})
+    row = _forecast(_fake_postgrest, "old-user", 500)
+    stored = archive.store("forecast_results", archive.month_of(row["created_at"]), [(row["id"], {"forecast_data": row["forecast_data"]})])
+    row.update(forecast_data=None, archived_at=row["created_at"], archive_key=stored[row["id"]][0])
+
+    async def failing_delete(self, table, result_ids):
+        raise RuntimeError("database unavailable")
+    monkeypatch.setattr(Repository, "delete_results", failing_delete)
+    with pytest.raises(RuntimeError):
+        asyncio.run(retention.run_retention(NOW))
+    # The row still points at its blob, so the segment must still be there
+    assert archive.load(row["archive_key"])["forecast_data"]
+
+    monkeypatch.undo()
+    monkeypatch.setitem(retention.PLAN_RETENTION, "business", retention.RetentionPolicy(90, 400))
+    report = asyncio.run(retention.run_retention(NOW))["tables"]["forecast_results"]
+    assert report["deleted_rows"] == 1
+    assert archive.month_of(row["created_at"]) in report["archive_segments_dropped"]
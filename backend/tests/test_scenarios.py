@@ -0,0 +1,76 @@
+import asyncio
+import types
+import pytest
+from fastapi.testclient import TestClient
+from main import app
+from routers import forecast
+from services import rate_limit
+
+client = TestClient(app)
+
+
+def _headers(email):
+    token = client.post("/auth/signup", json={"email": email, "password": "x"}).json()["access_token"]
+    return {"Authorization": f"Bearer {token}"}
+
+
+def test_an_oversized_scenario_grid_is_rejected_before_fitting(monkeypatch):
+    asyncio.run(rate_limit.get_backend().reset())
+    headers = _headers("scenarios@example.com")
+    files = {"file": ("data.csv", "date,sales\n2024-01-01,10\n", "text/csv")}
+    analysis_id = client.post("/analyze/", files=files, headers=headers).json()["analysis_id"]
+    frame = types.SimpleNamespace(columns=["date", "sales", "price", "promo"])
+    monkeypatch.setattr(forecast, "load_dataset", lambda analysis_id: (frame, "fingerprint"))
+    monkeypatch.setattr(forecast, "MAX_SCENARIOS", 4)
+
+    def not_fitted(*args):
+        raise AssertionError("model fitted for a rejected request")
+    monkeypatch.setattr(forecast, "fit_regressor_model", not_fitted)
+
+    body = {"analysis_id": analysis_id, "regressors": ["price", "promo"], "grid": {"price": [0.1, 0.2, 0.3], "promo": [0, 1, 2]}}
+    resp = client.post("/forecast/scenarios", json=body, headers=headers)
+    assert resp.status_code == 400
+    assert "max 4" in resp.json()["detail"]
+    unknown = client.post("/forecast/scenarios", json={**body, "grid": {"discount": [0.1]}}, headers=headers)
+    assert unknown.status_code == 400
+
+    # Counted, not expanded: 100^6 scenarios are rejected at once
+    huge = {name: [i / 100 for i in range(100)] for name in ("a", "b", "c", "d", "e", "f")}
+    resp = client.post("/forecast/scenarios", json={**body, "grid": huge}, headers=headers)
+    assert resp.status_code == 400 and "max 4" in resp.json()["detail"]
+    resp = client.post("/forecast/scenarios", json={**body, "grid": {"price": [0.1], "promo": []}}, headers=headers)
+    assert resp.status_code == 400 and "promo" in resp.json()["detail"]
+    asyncio.run(rate_limit.get_backend().reset())
+    for days in (0, -1, 10 ** 6):
+        assert client.post("/forecast/scenarios", json={**body, "days": days}, headers=headers).status_code == 422
+
+
+def test_analytic_regressor_shift_matches_predict():
+    if not hasattr(forecast.Prophet, "add_regressor"):
+        pytest.skip("needs prophet")
+    np, pd = forecast.np, forecast.pd
+    rng = np.random.default_rng(0)
+    ds = pd.date_range("2024-01-01", periods=120, freq="D")
+    price = rng.uniform(8, 12, len(ds))
+    promo = rng.integers(0, 2, len(ds)).astype(float)
+    y = 200 - 6 * price + 20 * promo + 5 * np.sin(2 * np.pi * np.arange(len(ds)) / 7) + rng.normal(0, 1, len(ds))
+    history = pd.DataFrame({"ds": ds, "y": y, "price": price, "promo": promo})
+
+    model = forecast.Prophet(weekly_seasonality=True, daily_seasonality=False, yearly_seasonality=False)
+    model.add_regressor("price")
+    model.add_regressor("promo", mode="multiplicative")
+    model.fit(history)
+    baseline = history[["price", "promo"]].tail(28).mean().to_numpy(dtype=float)
+    entry = {"model": model, "history": history, "baseline": baseline}
+
+    scenarios = [{}, {"price": 0.1}, {"price": -0.2, "promo": 0.5}]
+    evaluated = forecast.evaluate_scenarios(entry, scenarios, 14)
+    assert np.shape(evaluated["matrix"]) == (3, 14)
+    np.testing.assert_allclose(evaluated["matrix"][0], evaluated["baseline"], atol=0.01)
+    # Each row equals a full predict() with the adjusted regressor path
+    for scenario, row in zip(scenarios, evaluated["matrix"]):
+        future = pd.DataFrame({
+            "ds": pd.to_datetime(evaluated["dates"]),
+            **{name: baseline[i] * (1 + scenario.get(name, 0.0)) for i, name in enumerate(["price", "promo"])}
+        })
+        np.testing.assert_allclose(row, model.predict(future)["yhat"].to_numpy(), atol=0.01)
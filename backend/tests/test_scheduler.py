@@ -0,0 +1,103 @@
+import asyncio
+import threading
+from services import scheduler
+from services.scheduler import FairScheduler, run_job
+
+
+def _recorder(order, release=None):
+    def job(name):
+        def run():
+            if release is not None and name.startswith("blocker"):
+                release.wait(5)
+            order.append(name)
+            return name
+        return run
+    return job
+
+
+def test_flows_are_served_fairly():
+    fair = FairScheduler("test", workers=1, reserved_slots=0)
+    release = threading.Event()
+    order = []
+    job = _recorder(order, release)
+
+    futures = [fair.submit(job("blocker"), "user-a")]
+    futures += [fair.submit(job(f"a{i}"), "user-a") for i in range(1, 4)]
+    futures.append(fair.submit(job("b1"), "user-b"))
+    release.set()
+    for future in futures:
+        future.result(timeout=5)
+
+    # user-b's first job is not queued behind user-a's backlog
+    assert order == ["blocker", "b1", "a1", "a2", "a3"]
+
+
+def test_jobs_with_the_same_dedup_key_run_once():
+    fair = FairScheduler("test", workers=1, reserved_slots=0)
+    release = threading.Event()
+    order = []
+    job = _recorder(order, release)
+
+    blocker = fair.submit(job("blocker"), "user-a")
+    first = fair.submit(job("shared"), "user-a", dedup_key="key")
+    second = fair.submit(job("shared-again"), "user-a", dedup_key="key")
+    assert first is second
+    release.set()
+    blocker.result(timeout=5)
+
+    assert first.result(timeout=5) == "shared"
+    assert order == ["blocker", "shared"] and fair.deduplicated == 1
+
+
+def test_background_jobs_yield_and_are_promoted_when_joined():
+    fair = FairScheduler("test", workers=1, reserved_slots=0)
+    release = threading.Event()
+    order = []
+    job = _recorder(order, release)
+
+    blocker = fair.submit(job("blocker"), "user-a")
+    speculative = fair.submit(job("speculative"), "user-a", background=True)
+    wanted = fair.submit(job("wanted"), "user-a", dedup_key="default", background=True)
+    interactive = fair.submit(job("interactive"), "user-b")
+    # A request for the same result joins the background job and promotes it
+    joined = fair.submit(job("wanted-again"), "user-a", dedup_key="default")
+    assert joined is wanted
+    release.set()
+    for future in (blocker, speculative, wanted, interactive):
+        future.result(timeout=5)
+
+    assert order == ["blocker", "interactive", "wanted", "speculative"]
+
+
+def test_batch_jobs_leave_the_reserved_slot_free():
+    fair = FairScheduler("test", workers=2, reserved_slots=1)
+    release = threading.Event()
+    order = []
+    job = _recorder(order, release)
+
+    batch = [fair.submit(job(f"blocker-batch{i}"), "user-a", batch=True) for i in range(2)]
+    # The second batch job waits; a small job still starts on the reserved worker
+    assert fair.submit(job("small"), "user-b").result(timeout=5) == "small"
+    assert order == ["small"] and fair.stats()["queued"]["batch"] == 1
+    release.set()
+    for future in batch:
+        future.result(timeout=5)
+
+
+def test_a_cancelled_waiter_does_not_cancel_a_shared_job(monkeypatch):
+    monkeypatch.setitem(scheduler.schedulers, "test", FairScheduler("test", workers=1, reserved_slots=0))
+    release = threading.Event()
+
+    def slow():
+        release.wait(5)
+        return "done"
+
+    async def scenario():
+        first = asyncio.ensure_future(run_job("test", None, slow, dedup_key="key"))
+        second = asyncio.ensure_future(run_job("test", None, slow, dedup_key="key"))
+        await asyncio.sleep(0.01)
+        first.cancel()
+        await asyncio.sleep(0.01)
+        release.set()
+        return await second
+    assert asyncio.run(scenario()) == "done"
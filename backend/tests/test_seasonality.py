@@ -0,0 +1,80 @@
+import types
+import numpy as np
+import pandas as pd
+import pytest
+
+if not hasattr(np, "linalg") or not hasattr(pd, "DataFrame"):
+    pytest.skip("needs numpy and pandas", allow_module_level=True)
+
+from services.seasonality import bucket_yearly, compute_seasonal_profile, fourier_features
+
+
+def _model():
+    # Prophet's layout: weekly columns (3 harmonics) then yearly (2 harmonics)
+    beta = np.linspace(-0.5, 0.5, 10)
+    return types.SimpleNamespace(
+        seasonalities={
+            "weekly": {"period": 7, "fourier_order": 3},
+            "yearly": {"period": 365.25, "fourier_order": 2}
+        },
+        train_component_cols=pd.DataFrame({"weekly": [1] * 6 + [0] * 4, "yearly": [0] * 6 + [1] * 4}),
+        # Two posterior samples averaging to beta
+        params={"beta": np.vstack([beta - 0.1, beta + 0.1])},
+        component_modes={"additive": ["weekly"], "multiplicative": ["yearly"]},
+        y_scale=10.0
+    ), beta
+
+
+def _direct(t, period, coefficients):
+    values = np.zeros(len(t))
+    for k, (b_sin, b_cos) in enumerate(zip(coefficients[0::2], coefficients[1::2]), start=1):
+        values += b_sin * np.sin(2 * np.pi * k * t / period) + b_cos * np.cos(2 * np.pi * k * t / period)
+    return values
+
+
+def test_fourier_features_match_sin_cos_pairs():
+    t = np.arange(10, dtype=float)
+    features = fourier_features(t, 7, 2)
+    assert features.shape == (10, 4)
+    np.testing.assert_allclose(features[:, 2], np.sin(4 * np.pi * t / 7))
+    np.testing.assert_allclose(features[:, 3], np.cos(4 * np.pi * t / 7))
+    # One period later the features repeat
+    np.testing.assert_allclose(fourier_features(t + 7, 7, 2), features, atol=1e-9)
+
+
+def test_profile_matches_the_closed_form_seasonalities():
+    model, beta = _model()
+    profile = compute_seasonal_profile(model)
+    assert set(profile) == {"weekly", "yearly_365", "yearly_366"}
+
+    # Weekly grid starts on Monday 1970-01-05; additive terms are in y units
+    weekly = _direct(4 + np.arange(7, dtype=float), 7, beta[:6]) * model.y_scale
+    np.testing.assert_allclose(profile["weekly"], weekly)
+    # Multiplicative terms stay relative
+    yearly = _direct(19358 + np.arange(365, dtype=float), 365.25, beta[6:])
+    np.testing.assert_allclose(profile["yearly_365"], yearly)
+    # The leap-year grid covers 2024, day 60 being February 29
+    leap = _direct(19723 + np.arange(366, dtype=float), 365.25, beta[6:])
+    np.testing.assert_allclose(profile["yearly_366"], leap)
+    assert len(bucket_yearly(profile["yearly_366"], "monthly")) == 12
+
+    monthly = bucket_yearly(profile["yearly_365"], "monthly")
+    assert len(monthly) == 12 and monthly[0] == pytest.approx(yearly[:31].mean())
+    assert len(bucket_yearly(profile["yearly_365"], "weekly")) == 52
+
+
+def test_yearly_pattern_follows_the_forecast_year():
+    from routers.forecast import extract_yearly_pattern
+    model, _ = _model()
+    profile = compute_seasonal_profile(model)
+    assert extract_yearly_pattern(profile, "daily", 2023) == profile["yearly_365"].tolist()
+    assert extract_yearly_pattern(profile, "daily", 2024) == profile["yearly_366"].tolist()
+    assert extract_yearly_pattern(profile, "monthly", 2024) == bucket_yearly(profile["yearly_366"], "monthly")
+
+
+def test_fallback_forecast_honours_the_seasonality_resolution():
+    from routers.forecast import generate_simple_forecast
+    for resolution, buckets in (("weekly", 52), ("monthly", 12)):
+        seasonality = generate_simple_forecast(7, resolution)["seasonality"]
+        assert seasonality["resolution"] == resolution and len(seasonality["yearly_pattern"]) == buckets
+    assert len(generate_simple_forecast(7)["seasonality"]["yearly_pattern"]) in (365, 366)
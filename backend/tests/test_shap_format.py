@@ -0,0 +1,49 @@
+import numpy as np
+import pytest
+
+if not hasattr(np, "linalg"):
+    pytest.skip("needs numpy", allow_module_level=True)
+
+from services.shap_format import build_compact_explanation, decode_matrix, encode_matrix, without_matrices
+
+
+def _matrix():
+    rng = np.random.default_rng(0)
+    # Columns on very different scales, one constant at zero
+    return np.column_stack([rng.normal(0, 1, 50), rng.normal(0, 1000, 50), np.zeros(50), rng.uniform(-1e-3, 1e-3, 50)])
+
+
+def test_float32_round_trip_is_exact_to_float32():
+    matrix = _matrix()
+    encoded = encode_matrix(matrix)
+    assert encoded["dtype"] == "float32" and "scale" not in encoded
+    np.testing.assert_array_equal(decode_matrix(encoded), matrix.astype(np.float32))
+
+
+@pytest.mark.parametrize("quantize", ["int16", "int8"])
+def test_quantized_round_trip_stays_within_half_a_step_per_column(quantize):
+    matrix = _matrix()
+    encoded = encode_matrix(matrix, quantize)
+    decoded = decode_matrix(encoded)
+    assert encoded["dtype"] == quantize and decoded.shape == matrix.shape
+    scale = np.asarray(encoded["scale"])
+    limit = np.iinfo(quantize).max
+    np.testing.assert_allclose(scale[[0, 1, 3]], np.abs(matrix[:, [0, 1, 3]]).max(axis=0) / limit, rtol=1e-6)
+    error = np.abs(decoded - matrix)
+    # Rounding to the nearest step, plus float32 representation error
+    assert (error <= scale / 2 + np.abs(matrix) * 1e-6 + 1e-12).all()
+    assert (decoded[:, 2] == 0).all()
+
+
+def test_encoding_rejects_unknown_quantization():
+    with pytest.raises(ValueError):
+        encode_matrix(_matrix(), "int4")
+
+
+def test_without_matrices_drops_only_the_matrices():
+    matrix = _matrix()
+    compact = build_compact_explanation(["a", "b", "c", "d"], matrix, matrix * 0.5, 1.5, quantize="int8")
+    stripped = without_matrices(compact)
+    assert set(compact) - set(stripped) == {"values", "shap_values"}
+    assert {k: compact[k] for k in stripped} == stripped
+    assert stripped["summaries"]["mean_abs"] == pytest.approx(np.abs(matrix * 0.5).mean(axis=0), abs=1e-6)
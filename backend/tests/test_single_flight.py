@@ -0,0 +1,84 @@
+import asyncio
+import httpx
+from fastapi.testclient import TestClient
+from main import app
+from routers import analyze, forecast
+from services import rate_limit
+from services.single_flight import SingleFlight
+
+client = TestClient(app)
+
+
+def _headers(email):
+    token = client.post("/auth/signup", json={"email": email, "password": "x"}).json()["access_token"]
+    return {"Authorization": f"Bearer {token}"}
+
+
+def test_concurrent_identical_forecasts_share_one_computation(monkeypatch, _fake_postgrest):
+    asyncio.run(rate_limit.get_backend().reset())
+    # Duplicates still pass admission control first; allow them in together
+    monkeypatch.setitem(rate_limit.ADMISSION_MAX_CONCURRENT, "cpu", 8)
+    headers = _headers("coalesce@example.com")
+    files = {"file": ("data.csv", "date,value\n2024-01-01,10\n2024-01-02,20\n", "text/csv")}
+    analysis_id = client.post("/analyze/", files=files, headers=headers).json()["analysis_id"]
+    calls = []
+
+    async def slow_forecast(days, analysis_id, resolution, user):
+        calls.append((days, resolution))
+        await asyncio.sleep(0.05)
+        return {"forecast": [], "days": days}
+    monkeypatch.setattr(forecast, "generate_prophet_forecast", slow_forecast)
+
+    async def fire():
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as http:
+            same = [http.post("/forecast/", params={"analysis_id": analysis_id, "days": 30}, headers=headers) for _ in range(3)]
+            other = http.post("/forecast/", params={"analysis_id": analysis_id, "days": 60}, headers=headers)
+            return await asyncio.gather(*same, other)
+    responses = asyncio.run(fire())
+
+    assert [r.status_code for r in responses] == [200] * 4
+    assert len({r.json()["forecast_id"] for r in responses[:3]}) == 1
+    assert responses[3].json()["forecast_id"] != responses[0].json()["forecast_id"]
+    assert sorted(calls) == [(30, "daily"), (60, "daily")]
+
+
+def test_idempotency_key_replays_analysis(monkeypatch, _fake_postgrest):
+    asyncio.run(rate_limit.get_backend().reset())
+    headers = _headers("idempotent@example.com")
+    calls = []
+    original = analyze.generate_multimodal_insights
+
+    async def counted(*args, **kwargs):
+        calls.append(1)
+        return await original(*args, **kwargs)
+    monkeypatch.setattr(analyze, "generate_multimodal_insights", counted)
+    files = {"file": ("data.csv", "date,value\n2024-01-01,10\n", "text/csv")}
+
+    first = client.post("/analyze/", files=files, headers={**headers, "Idempotency-Key": "upload-1"})
+    retry = client.post("/analyze/", files=files, headers={**headers, "Idempotency-Key": "upload-1"})
+    assert first.status_code == retry.status_code == 200
+    assert retry.json()["analysis_id"] == first.json()["analysis_id"]
+    assert retry.headers["Idempotent-Replayed"] == "true"
+    assert len(calls) == 1
+
+    changed = {"file": ("data.csv", "date,value\n2024-01-01,99\n", "text/csv")}
+    assert client.post("/analyze/", files=changed, headers={**headers, "Idempotency-Key": "upload-1"}).status_code == 422
+    # Keys are per user
+    other = client.post("/analyze/", files=changed, headers={**_headers("idempotent-2@example.com"), "Idempotency-Key": "upload-1"})
+    assert other.status_code == 200 and len(calls) == 2
+
+
+def test_waiting_callers_survive_the_first_caller_cancelling():
+    flights = SingleFlight()
+
+    async def scenario():
+        async def work():
+            await asyncio.sleep(0.02)
+            return "done"
+        first = asyncio.ensure_future(flights.run("key", work))
+        second = asyncio.ensure_future(flights.run("key", work))
+        await asyncio.sleep(0)
+        first.cancel()
+        return await second
+    assert asyncio.run(scenario()) == "done"
+    assert flights.stats() == {"in_flight": 0, "started": 1, "coalesced": 1}
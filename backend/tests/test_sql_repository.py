@@ -0,0 +1,111 @@
+import asyncio
+import json
+import os
+import re
+import pytest
+
+pytest.importorskip("sqlalchemy")
+
+from sqlalchemy import inspect, text
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.ext.asyncio import create_async_engine
+from services.sql_repository import SqlRepository, async_database_url
+
+_BACKEND_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+
+
+def _sql(statement):
+    return re.sub(r"\s+", " ", str(statement.compile(dialect=postgresql.dialect())))
+
+
+class _Captured(SqlRepository):
+    """Records statements instead of running them"""
+
+    def __init__(self):
+        super().__init__("postgresql://unused", auth=None, engine=object())
+        self.statements = []
+
+    async def _fetch(self, statement, params=None):
+        self.statements.append(statement)
+        return []
+
+
+def test_history_page_seeks_on_the_composite_key():
+    repository = _Captured()
+    first = _sql(repository._history_statement("forecast_results", "id,created_at", paged=False))
+    paged = _sql(repository._history_statement("forecast_results", "id,created_at", paged=True))
+
+    assert "WHERE forecast_results.user_id = %(user_id)s::UUID ORDER BY forecast_results.created_at DESC, forecast_results.id DESC LIMIT %(limit)s" in first
+    # A row-value comparison the (user_id, created_at, id) index can serve
+    assert "(forecast_results.created_at, forecast_results.id) < (%(created_at)s, %(row_id)s::UUID)" in paged
+    # Built once per column list
+    assert repository._history_statement("forecast_results", "id,created_at", paged=True) is repository._history_statement("forecast_results", "id,created_at", paged=True)
+
+
+def test_bulk_analysis_lookup_is_one_projected_query():
+    repository = _Captured()
+    asyncio.run(repository.get_analyses(["a1", "a2", "a3"], "owner", "id,user_id"))
+    statement = repository.statements[-1]
+    sql = _sql(statement)
+
+    # An expanding parameter: one placeholder per ID when executed, one statement for any count
+    assert sql == (
+        "SELECT analysis_results.id, analysis_results.user_id FROM analysis_results "
+        "WHERE analysis_results.id IN (__[POSTCOMPILE_analysis_ids]) AND analysis_results.user_id = %(user_id)s::UUID"
+    )
+    assert repository._analysis_projection("id,user_id", bulk=True) is statement
+
+
+def test_aging_rows_resume_after_the_last_key():
+    repository = _Captured()
+    asyncio.run(repository.aging_rows("explanation_results", "id,created_at", "2024-06-01T00:00:00", ("2024-01-01T00:00:00", "abc"), 50, unarchived_only=True))
+    sql = _sql(repository.statements[-1])
+
+    assert "explanation_results.created_at < %(created_at_1)s" in sql
+    assert "explanation_results.archived_at IS NULL" in sql
+    assert "(explanation_results.created_at, explanation_results.id) > (%(param_1)s, %(param_2)s::UUID)" in sql
+    assert sql.endswith("ORDER BY explanation_results.created_at, explanation_results.id LIMIT %(param_3)s")
+
+
+def test_migrations_upgrade_and_downgrade_cleanly(monkeypatch):
+    # Downgrades drop every table, so this only runs against a scratch database
+    url = os.getenv("MIGRATIONS_TEST_DATABASE_URL")
+    if not url:
+        pytest.skip("MIGRATIONS_TEST_DATABASE_URL is not set")
+    pytest.importorskip("alembic")
+    from alembic import command
+    from alembic.config import Config
+
+    monkeypatch.setenv("DATABASE_URL", url)
+    monkeypatch.chdir(_BACKEND_ROOT)
+    config = Config(os.path.join(_BACKEND_ROOT, "alembic.ini"))
+
+    async def tables():
+        engine = create_async_engine(async_database_url(url))
+        async with engine.connect() as conn:
+            names = await conn.run_sync(lambda sync: set(inspect(sync).get_table_names()))
+        await engine.dispose()
+        return names
+
+    async def archive_one():
+        # The batch function the REST repository calls, on a real partitioned table
+        engine = create_async_engine(async_database_url(url))
+        async with engine.begin() as conn:
+            row_id = (await conn.execute(text("INSERT INTO forecast_results (forecast_data) VALUES ('{}') RETURNING id"))).scalar_one()
+            await conn.execute(
+                text("SELECT mark_archived('forecast_results', CAST(:keys AS JSONB), ARRAY['forecast_data'], NOW()::TIMESTAMP)"),
+                {"keys": json.dumps({str(row_id): "forecast_results/2024-06:0:10"})}
+            )
+            row = (await conn.execute(text("SELECT forecast_data, archive_key FROM forecast_results"))).one()
+        await engine.dispose()
+        return tuple(row)
+
+    command.downgrade(config, "base")
+    command.upgrade(config, "0001")
+    assert {"users", "analysis_results", "forecast_results", "explanation_results"} <= asyncio.run(tables())
+    command.upgrade(config, "0003")
+    command.downgrade(config, "0001")
+    command.upgrade(config, "head")
+    assert asyncio.run(archive_one()) == (None, "forecast_results/2024-06:0:10")
+    command.downgrade(config, "base")
+    assert asyncio.run(tables()) <= {"alembic_version"}
@@ -0,0 +1,86 @@
+import asyncio
+from fastapi.testclient import TestClient
+from main import app
+from routers import stripe_webhook
+from services import webhook_queue
+
+client = TestClient(app)
+
+def _subscription_event(event_id, event_type, status="active", created=1700000000):
+    return {
+        "type": event_type,
+        "object": {"id": "sub_1", "customer": "cus_1", "status": status, "items": {"data": [{"price": {"id": "price_x"}}]}}
+    }, event_id, created
+
+def test_webhook_acknowledges_and_queues():
+    before = webhook_queue.queue_stats()["pending"]
+    response = client.post("/stripe/webhook", content=b'{"id": "evt_ack"}', headers={"stripe-signature": "sig"})
+    assert response.status_code == 200
+    assert response.json() == {"status": "success"}
+    assert webhook_queue.queue_stats()["pending"] == before + 1
+
+def test_queue_deduplicates_and_coalesces_per_customer(_fake_postgrest):
+    events = [
+        _subscription_event("evt_1", "customer.subscription.created", created=1700000001),
+        _subscription_event("evt_2", "customer.subscription.updated", status="past_due", created=1700000002),
+        _subscription_event("evt_3", "customer.subscription.deleted", created=1700000003),
+    ]
+    for payload, event_id, created in events:
+        assert webhook_queue.enqueue_event(event_id, payload["type"], "cus_1", created, payload)
+    # Stripe redelivers: same event ID is ignored
+    payload, event_id, created = events[0]
+    assert not webhook_queue.enqueue_event(event_id, payload["type"], "cus_1", created, payload)
+
+    writes = []
+    async def apply(customer_id, batch):
+        if customer_id == "cus_1":
+            writes.append([event["type"] for event in batch])
+            await stripe_webhook.apply_customer_events(customer_id, batch)
+    _fake_postgrest.tables["users"].append({"id": "user_cus_1", "email": "cus@example.com", "plan": "pro", "stripe_customer_id": "cus_1"})
+    asyncio.run(webhook_queue.process_pending(apply))
+
+    assert writes == [["customer.subscription.created", "customer.subscription.updated", "customer.subscription.deleted"]]
+    user = _fake_postgrest.tables["users"][-1]
+    assert user["plan"] == "free" and user["subscription_status"] == "cancelled"
+
+def test_failed_apply_is_retried_later():
+    payload, event_id, created = _subscription_event("evt_retry", "customer.subscription.updated")
+    webhook_queue.enqueue_event(event_id, payload["type"], "cus_retry", created, payload)
+
+    async def failing(customer_id, batch):
+        if customer_id == "cus_retry":
+            raise RuntimeError("database unavailable")
+    asyncio.run(webhook_queue.process_pending(failing))
+
+    seen = []
+    async def record(customer_id, batch):
+        seen.append(customer_id)
+    asyncio.run(webhook_queue.process_pending(record))
+    # Still backing off, so not yet redelivered
+    assert "cus_retry" not in seen
+    assert webhook_queue.queue_stats()["pending"] >= 1
+
+def test_prices_served_from_catalogue_with_etag(monkeypatch):
+    import stripe
+    from services import price_catalog
+    calls = []
+    original = stripe.Price.list
+    def counting_list(**kwargs):
+        calls.append(kwargs)
+        return original(**kwargs)
+    monkeypatch.setattr(stripe.Price, "list", counting_list)
+    price_catalog.invalidate_catalog()
+
+    first = client.get("/stripe/prices")
+    assert first.status_code == 200
+    assert first.json()["prices"][0]["id"] == "price_test"
+    etag = first.headers["etag"]
+
+    second = client.get("/stripe/prices", headers={"If-None-Match": etag})
+    assert second.status_code == 304
+    assert len(calls) == 1
+
+    # A price.* event makes the next read reload
+    price_catalog.invalidate_catalog()
+    assert client.get("/stripe/prices").status_code == 200
+    assert len(calls) == 2
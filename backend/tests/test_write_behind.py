@@ -0,0 +1,73 @@
+import asyncio
+import os
+import uuid
+from fastapi.testclient import TestClient
+from main import app
+from services import repository
+from services.write_behind import WriteBehindWriter, result_writer, uuid7
+
+client = TestClient(app)
+
+
+def test_uuid7_ids_are_time_ordered():
+    ids = [uuid7() for _ in range(1000)]
+    assert ids == sorted(ids)
+    assert len(set(ids)) == len(ids)
+    assert uuid.UUID(ids[0]).version == 7
+
+
+def test_analysis_is_written_behind_and_readable_before_flush(_fake_postgrest):
+    token = client.post("/auth/signup", json={"email": "wb@example.com", "password": "x"}).json()["access_token"]
+    files = {"file": ("data.csv", "date,value\n2024-01-01,10\n", "text/csv")}
+    analysis_id = client.post("/analyze/", files=files, headers={"Authorization": f"Bearer {token}"}).json()["analysis_id"]
+
+    assert uuid.UUID(analysis_id).version == 7
+    assert not any(row["id"] == analysis_id for row in _fake_postgrest.tables["analysis_results"])
+    # Follow-up requests see the buffered analysis
+    more = {"file": ("more.csv", "date,value\n2024-01-02,20\n", "text/csv")}
+    resp = client.post(f"/analyze/{analysis_id}/rows", files=more, headers={"Authorization": f"Bearer {token}"})
+    assert resp.status_code == 200
+
+    asyncio.run(result_writer.flush())
+    assert any(row["id"] == analysis_id for row in _fake_postgrest.tables["analysis_results"])
+    assert result_writer.pending("analysis_results", analysis_id) is None
+
+
+def test_unavailable_database_spills_to_disk_and_replays(tmp_path, monkeypatch, _fake_postgrest):
+    writer = WriteBehindWriter(spill_dir=str(tmp_path))
+    row_id = writer.submit("forecast_results", {"user_id": "u1", "forecast_days": 7})
+
+    async def unavailable(self, table, rows):
+        raise repository.RepositoryError(503, "database unavailable")
+    monkeypatch.setattr(repository.Repository, "insert_rows", unavailable)
+    asyncio.run(writer.flush())
+    assert os.path.exists(tmp_path / "forecast_results.jsonl")
+    assert writer.pending("forecast_results", row_id) is not None
+
+    # A restarted process still knows the spilled row
+    assert WriteBehindWriter(spill_dir=str(tmp_path)).pending("forecast_results", row_id) is not None
+
+    monkeypatch.undo()
+    asyncio.run(writer.flush())
+    assert not os.path.exists(tmp_path / "forecast_results.jsonl")
+    assert [row for row in _fake_postgrest.tables["forecast_results"] if row["id"] == row_id]
+    assert writer.pending("forecast_results", row_id) is None
+
+
+def test_rejected_rows_do_not_block_the_batch(tmp_path, monkeypatch, _fake_postgrest):
+    writer = WriteBehindWriter(spill_dir=str(tmp_path))
+    good = writer.submit("explanation_results", {"user_id": "u1"})
+    bad = writer.submit("explanation_results", {"user_id": "u1", "poison": True})
+    original = repository.Repository.insert_rows
+
+    async def rejecting(self, table, rows):
+        if any(row.get("poison") for row in rows):
+            raise repository.RepositoryError(400, "invalid input")
+        await original(self, table, rows)
+    monkeypatch.setattr(repository.Repository, "insert_rows", rejecting)
+    asyncio.run(writer.flush())
+
+    ids = {row["id"] for row in _fake_postgrest.tables["explanation_results"]}
+    assert good in ids and bad not in ids
+    assert os.path.exists(tmp_path / "explanation_results.rejected.jsonl")
+    assert writer.stats()["rejected"] == 1